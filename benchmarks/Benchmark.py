@@ -0,0 +1,133 @@
+from __future__ import annotations
+from typing import Callable, Dict, List
+import time
+
+PERCENTILES = (50, 90, 99)
+
+class Benchmark:
+    """
+    Timings of one operation, run several times. Each sample is the time of one run, and may cover
+    several items, such as the entries of a scanned directory, to report a throughput.
+
+    Attributes:
+
+    - name : :class:`str` --> the name the results are reported and saved under
+    - unit : :class:`str` --> what an item is, such as 'entries' or 'keys'
+    - samples : :class:`List[float]` --> the time of each run, in seconds
+    - items : :class:`int` --> total number of items processed over every run
+    - counters : :class:`Dict[str, float]` --> totals of other figures over every run, such as bytes sent to the terminal, reported per run
+    """
+    def __init__(self, name: str, unit: str = 'runs') -> None:
+        self.name = name
+        self.unit = unit
+        self.samples: List[float] = []
+        self.items = 0
+        self.counters: Dict[str, float] = {}
+
+    def time(self, run: Callable[[], int]):
+        """
+        Run once and record its time
+
+        Parameters:
+
+        - run : :class:`Callable[[], int]` --> the operation to time. Returns the number of items it processed, or None for one
+        """
+        started = time.perf_counter()
+        items = run()
+        self.add(time.perf_counter() - started, 1 if items is None else items)
+
+    def add(self, seconds: float, items: int = 1):
+        self.samples.append(seconds)
+        self.items += items
+
+    def count(self, name: str, value: float):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def percentile(self, p: float) -> float:
+        """
+        Returns the sample that p percent of samples are at or below, by nearest rank
+
+        Parameters:
+
+        - p : :class:`float` --> the percentile, from 0 to 100
+        """
+        ordered = sorted(self.samples)
+        rank = max(1, -(-len(ordered) * p // 100))   # Ceiling without floats
+        return ordered[int(rank) - 1]
+
+    def throughput(self) -> float:
+        """
+        Returns the number of items processed per second over every run
+        """
+        total = sum(self.samples)
+        return self.items / total if total > 0 else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Returns the figures that are reported and saved as a baseline
+        """
+        result = {f'p{p}': self.percentile(p) for p in PERCENTILES}
+        result['max'] = max(self.samples)
+        result['throughput'] = self.throughput()
+        result['runs'] = len(self.samples)
+        for name, total in self.counters.items():
+            result[f'{name} per run'] = total / len(self.samples)
+        return result
+
+
+def format_table(benchmarks: List[Benchmark], baseline: Dict[str, Dict[str, float]] = None, tolerance: float = 0.0) -> str:
+    """
+    Returns a table with a row for each benchmark. If a baseline is given, the change in median time
+    is shown, and changes beyond tolerance are marked as regressions or improvements.
+
+    Parameters:
+
+    - benchmarks : :class:`List[Benchmark]` --> the benchmarks to report, in order
+    - baseline : :class:`Dict[str, Dict[str, float]]` --> summaries saved by an earlier run, keyed by benchmark name
+    - tolerance : :class:`float` --> fraction by which the median may change before it is marked
+    """
+    header = f'{"benchmark":<28}{"runs":>6}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"max ms":>10}{"throughput":>20}'
+    if baseline is not None:
+        header += f'{"vs base":>10}'
+    lines = [header]
+    for benchmark in benchmarks:
+        s = benchmark.summary()
+        line = (f'{benchmark.name:<28}{s["runs"]:>6}{s["p50"] * 1000:>10.3f}{s["p90"] * 1000:>10.3f}{s["p99"] * 1000:>10.3f}'
+                f'{s["max"] * 1000:>10.3f}{_format_rate(s["throughput"], benchmark.unit):>20}')
+        if baseline is not None:
+            line += f'{_format_change(s, baseline.get(benchmark.name), tolerance):>10}'
+        lines.append(line)
+        for name in benchmark.counters:
+            lines.append(f'    {name} per run: {s[f"{name} per run"]:.1f}')
+    return '\n'.join(lines)
+
+def find_regressions(benchmarks: List[Benchmark], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """
+    Returns the names of benchmarks whose median time grew by more than tolerance since the baseline
+
+    Parameters:
+
+    - benchmarks : :class:`List[Benchmark]` --> the benchmarks just run
+    - baseline : :class:`Dict[str, Dict[str, float]]` --> summaries saved by an earlier run, keyed by benchmark name
+    - tolerance : :class:`float` --> fraction by which the median may grow
+    """
+    regressions = []
+    for benchmark in benchmarks:
+        base = baseline.get(benchmark.name)
+        if base is not None and base['p50'] > 0 and benchmark.percentile(50) / base['p50'] > 1 + tolerance:
+            regressions.append(benchmark.name)
+    return regressions
+
+def _format_rate(rate: float, unit: str) -> str:
+    for scale, suffix in ((1e6, 'M'), (1e3, 'k')):
+        if rate >= scale:
+            return f'{rate / scale:.1f}{suffix} {unit}/s'
+    return f'{rate:.1f} {unit}/s'
+
+def _format_change(summary: Dict[str, float], base: Dict[str, float], tolerance: float) -> str:
+    # Change in median time, with a mark if it is beyond tolerance
+    if base is None or base['p50'] <= 0:
+        return 'new'
+    ratio = summary['p50'] / base['p50']
+    mark = ' !' if ratio > 1 + tolerance else ' +' if ratio < 1 - tolerance else ''
+    return f'{(ratio - 1) * 100:+.0f}%{mark}'
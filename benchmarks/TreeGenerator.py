@@ -0,0 +1,111 @@
+from collections import deque
+import os, random
+
+SHAPES = ('wide', 'deep', 'mixed', 'unicode')
+DEFAULT_SIZES = {
+    'wide': 1000000,    # Files in one directory
+    'deep': 10000,      # Levels of nesting
+    'mixed': 100000,    # Files and directories in a bushy tree
+    'unicode': 100000,  # Files with names in many scripts, in one directory
+}
+DONE_MARKER = '.fe-bench-done'
+MIXED_FANOUT = 8            # Subdirectories per directory in the mixed tree
+MIXED_FILES_PER_DIR = 60    # Files per directory in the mixed tree
+
+# Pieces of names from scripts whose case folding, width and sort order differ from ASCII
+UNICODE_PARTS = ['Straße', 'ÆØÅ', 'çà', 'Ελληνικά', 'кириллица', 'ДОМ', 'עברית', 'عربي', '中文字符', '日本語',
+                 '한국어', 'ไทย', 'देवनागरी', 'é', '🙂', '🚀', 'ǅ', 'İ', 'ﬁ', 'Σίσυφος', 'readme', 'Data']
+
+class TreeGenerator:
+    """
+    Creates synthetic directory trees of a given shape and size for benchmarks. Trees are kept between
+    runs, and a tree is only created again if it was not finished or its size changed.
+
+    Directories are created relative to an open descriptor of their parent, so trees deeper than the
+    longest path the system accepts can still be created.
+
+    Attributes:
+
+    - root : :class:`str` --> the directory that the trees are created in
+    - seed : :class:`int` --> seed for the random choices, so the same tree is created every time
+    """
+    def __init__(self, root: str, seed: int = 0) -> None:
+        self.root = root
+        self.seed = seed
+
+    def generate(self, shape: str, size: int) -> str:
+        """
+        Returns the path of a tree of the given shape, creating it first if needed
+
+        Parameters:
+
+        - shape : :class:`str` --> one of SHAPES
+        - size : :class:`int` --> number of files for wide, mixed and unicode trees, or levels of nesting for deep trees
+        """
+        if shape not in SHAPES:
+            raise ValueError(f'Unknown tree shape: {shape}')
+        path = os.path.join(self.root, f'{shape}-{size}')
+        if os.path.exists(os.path.join(path, DONE_MARKER)):
+            return path
+        os.makedirs(path, exist_ok=True)
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            getattr(self, f'_make_{shape}')(fd, size, random.Random(self.seed))
+        finally:
+            os.close(fd)
+        with open(os.path.join(path, DONE_MARKER), 'w'):
+            pass
+        return path
+
+    def _make_wide(self, fd: int, size: int, rng: random.Random):
+        for i in range(size):
+            _touch(f'file{rng.randrange(size * 10):08d}-{i}.txt', fd)
+
+    def _make_deep(self, fd: int, size: int, rng: random.Random):
+        # A chain of short directory names, with a couple of files at each level. Only the deepest level is kept open
+        dir_fd = os.dup(fd)
+        try:
+            for level in range(size):
+                _touch('a.txt', dir_fd)
+                _touch('b.txt', dir_fd)
+                _mkdir('d', dir_fd)
+                parent_fd = dir_fd
+                dir_fd = os.open('d', os.O_RDONLY | os.O_DIRECTORY, dir_fd=parent_fd)
+                os.close(parent_fd)
+        finally:
+            os.close(dir_fd)
+
+    def _make_mixed(self, fd: int, size: int, rng: random.Random):
+        # Breadth first, so the tree stays bushy whatever the size. The tree is shallow, so paths relative to the root are short
+        pending = deque([os.curdir])
+        made = 0
+        while made < size:
+            rel_path = pending.popleft()
+            dir_fd = os.open(rel_path, os.O_RDONLY | os.O_DIRECTORY, dir_fd=fd)
+            try:
+                for i in range(rng.randrange(MIXED_FILES_PER_DIR * 2)):
+                    _touch(f'{rng.choice(["notes", "Image", "data", "src"])}_{i}.{rng.choice(["txt", "png", "py", "json"])}', dir_fd)
+                    made += 1
+                for i in range(MIXED_FANOUT):
+                    name = f'{rng.choice(["lib", "Docs", "build", "test"])}{i}'
+                    _mkdir(name, dir_fd)
+                    pending.append(os.path.join(rel_path, name))
+                    made += 1
+            finally:
+                os.close(dir_fd)
+
+    def _make_unicode(self, fd: int, size: int, rng: random.Random):
+        for i in range(size):
+            name = ' '.join(rng.choice(UNICODE_PARTS) for _ in range(rng.randrange(1, 4)))
+            _touch(f'{name} {i}', fd)
+            if i % 50 == 0:
+                _mkdir(f'{name} dir{i}', fd)
+
+def _touch(name: str, dir_fd: int):
+    os.close(os.open(name, os.O_WRONLY | os.O_CREAT, 0o644, dir_fd=dir_fd))
+
+def _mkdir(name: str, dir_fd: int):
+    try:
+        os.mkdir(name, dir_fd=dir_fd)
+    except FileExistsError:   # Left over from an unfinished run
+        pass
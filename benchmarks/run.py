@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for scanning, sorting, navigation and rendering, on synthetic trees.
+
+Run from the root of the repository:
+
+    python -m benchmarks.run --scale 0.01 --save baseline.json
+    python -m benchmarks.run --scale 0.01 --compare baseline.json
+
+Rendering is drawn to the terminal when run in one, and otherwise to a screen in memory, which also
+counts the bytes each frame would send to a terminal. Trees are kept in --trees between runs, since
+large ones take a while to create.
+"""
+import argparse, curses, json, os, platform, random, sys, tempfile, time
+from typing import Callable, Dict, List, Tuple
+from benchmarks.Benchmark import Benchmark, format_table, find_regressions
+from benchmarks.TreeGenerator import TreeGenerator, SHAPES, DEFAULT_SIZES, DONE_MARKER
+from src.explorer.FileEntry import Directory, ChildTable, iter_scandir_batches
+from src.explorer.FileExplorer import FileExplorer
+from src.explorer.DirectoryScanner import DirectoryScanner
+from src.explorer.ListingCache import ListingCache, RACY_WINDOW_NS
+from src.displays.RenderBackend import RenderBackend
+from src.displays.CursesBackend import CursesBackend
+from src.displays.HeadlessBackend import HeadlessBackend, DEFAULT_LINES, DEFAULT_COLS
+
+FIRST_BATCH = 50    # Entries in the first listing of a streamed directory, about a screenful
+SETTLE_SLEEP = 0.0005
+
+def main():
+    parser = argparse.ArgumentParser(description='Time scanning, sorting, navigation and rendering on synthetic trees')
+    parser.add_argument('--shapes', nargs='+', choices=SHAPES, default=list(SHAPES), help='tree shapes to run on')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the default size of every tree, such as 0.01 for a quick run')
+    parser.add_argument('--repeat', type=int, default=5, help='number of times each directory is scanned and sorted')
+    parser.add_argument('--steps', type=int, default=400, help='number of key presses in each navigation sequence')
+    parser.add_argument('--trees', default=os.path.join(tempfile.gettempdir(), 'fe-bench-trees'), help='directory to keep the generated trees in')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the trees and key sequences')
+    parser.add_argument('--no-render', action='store_true', help='skip the rendering benchmarks')
+    parser.add_argument('--headless', action='store_true', help='render to a screen in memory, and count the bytes each frame would send. This is the default when not run in a terminal')
+    parser.add_argument('--lines', type=int, default=DEFAULT_LINES, help='height of the screen in memory')
+    parser.add_argument('--cols', type=int, default=DEFAULT_COLS, help='width of the screen in memory')
+    parser.add_argument('--save', metavar='PATH', help='save the results as a baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare the results with a saved baseline, and fail if any got slower')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='fraction by which a median may grow before it counts as a regression')
+    args = parser.parse_args()
+
+    # Keep the listings of generated trees out of the user's cache
+    os.environ['XDG_CACHE_HOME'] = tempfile.mkdtemp(prefix='fe-bench-cache-')
+    generator = TreeGenerator(args.trees, args.seed)
+    benchmarks: List[Benchmark] = []
+    trees = {}
+    for shape in args.shapes:
+        size = max(1, int(DEFAULT_SIZES[shape] * args.scale))
+        print(f'Creating {shape} tree of size {size} in {args.trees}...', file=sys.stderr)
+        trees[shape] = generator.generate(shape, size)
+        _wait_until_cacheable(trees[shape])
+        rng = random.Random(args.seed)
+        dirs = _scanned_dirs(shape, trees[shape], min(size, args.steps))
+        benchmarks += bench_scan(shape, dirs, args.repeat)
+        benchmarks.append(bench_navigation(shape, trees[shape], _key_sequence(shape, args.steps, rng)))
+
+    if not args.no_render:
+        if args.headless or not sys.stdout.isatty():
+            benchmarks += bench_rendering(HeadlessBackend(args.lines, args.cols), trees, args)
+        else:
+            benchmarks += curses.wrapper(_bench_terminal, trees, args)
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print(format_table(benchmarks, baseline, args.tolerance))
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump({'meta': _environment(args), 'results': {b.name: b.summary() for b in benchmarks}}, f, indent=2)
+    if baseline is not None:
+        regressions = find_regressions(benchmarks, baseline, args.tolerance)
+        if len(regressions) > 0:
+            print(f'Slower than the baseline: {", ".join(regressions)}', file=sys.stderr)
+            sys.exit(1)
+
+def bench_scan(shape: str, dirs: List[str], repeat: int) -> List[Benchmark]:
+    """
+    Time reading, sorting and listing each directory. Each sample is one directory.
+
+    Parameters:
+
+    - shape : :class:`str` --> the shape of the tree, used in the benchmark names
+    - dirs : :class:`List[str]` --> the directories to scan
+    - repeat : :class:`int` --> the number of times each directory is scanned
+    """
+    read = Benchmark(f'{shape}.read', 'entries')
+    sort = Benchmark(f'{shape}.sort', 'entries')
+    scan = Benchmark(f'{shape}.scan', 'entries')
+    first = Benchmark(f'{shape}.first_listing', 'dirs')
+    cached = Benchmark(f'{shape}.cached_scan', 'entries')
+    scanner = DirectoryScanner(ListingCache())
+    for _ in range(repeat):
+        for path in dirs:
+            directory = Directory.at(path)
+            started = time.perf_counter()
+            entries = [entry for batch in iter_scandir_batches(path) for entry in batch]
+            read.add(time.perf_counter() - started, len(entries))
+            sort.time(lambda: len(ChildTable.from_entries(directory, entries)))
+            scan.time(lambda: len(directory.scan_contents()))
+            first.time(lambda: _first_listing(directory))
+            scanner.read_listing(directory)     # Fill the cache
+            cached.time(lambda: len(scanner.read_listing(directory)))
+    scanner.shutdown()
+    return [read, sort, scan, first, cached]
+
+def bench_navigation(shape: str, root: str, keys: List[str]) -> Benchmark:
+    """
+    Time each key press of a sequence, as the FileExplorer handles it, including starting the scan
+    of the newly selected directory. Each key waits for earlier scans to finish first.
+
+    Parameters:
+
+    - shape : :class:`str` --> the shape of the tree, used in the benchmark name
+    - root : :class:`str` --> the directory to start in. The sequence never moves above it
+    - keys : :class:`List[str]` --> the sequence of 'up', 'down', 'left' and 'right' presses
+    """
+    benchmark = Benchmark(f'{shape}.navigate', 'keys')
+    os.chdir(root)  # FileExplorer starts in the working directory
+    fe = FileExplorer()
+    fe.peek_right()
+    for key in keys:
+        _settle(fe.scanner.has_pending, fe.scanner.poll)
+        if key == 'left' and fe.curr_directory.get_path() == root:
+            continue
+        started = time.perf_counter()
+        if _press(fe, key):
+            fe.peek_right()
+            benchmark.add(time.perf_counter() - started)
+    fe.scanner.shutdown()   # Not shutdown(), which would save the listings to the cache
+    return benchmark
+
+def bench_rendering(backend: RenderBackend, trees: Dict[str, str], args: argparse.Namespace) -> List[Benchmark]:
+    """
+    Time the first paint and each key press through the pads, up to the screen being updated. With a
+    HeadlessBackend, the bytes a terminal would have been sent and the full redraws are counted too.
+
+    Parameters:
+
+    - backend : :class:`RenderBackend` --> the screen to draw on
+    - trees : :class:`Dict[str, str]` --> the root of the tree of each shape
+    - args : :class:`argparse.Namespace` --> the command line options
+    """
+    from src.displays.PadList import PadList
+    blank = backend.new_window(backend.get_lines(), backend.get_cols(), 0, 0)
+    benchmarks = []
+    for shape, root in trees.items():
+        first_paint = Benchmark(f'{shape}.first_paint')
+        render = Benchmark(f'{shape}.render', 'keys')
+        os.chdir(root)
+        fe = FileExplorer()
+        for _ in range(args.repeat):
+            blank.erase()   # Start from an empty screen, so the whole first frame is drawn
+            blank.noutrefresh()
+            backend.doupdate()
+            started = time.perf_counter()
+            view = PadList(fe, backend)
+            backend.doupdate()
+            first_paint.add(time.perf_counter() - started)
+            _count_frame(backend, first_paint)
+        view.peek_selection()
+        for key in _key_sequence(shape, args.steps, random.Random(args.seed)):
+            _settle(view.has_pending_scans, view.poll_scans)
+            backend.doupdate()
+            if key == 'left' and fe.curr_directory.get_path() == root:
+                continue
+            started = time.perf_counter()
+            getattr(view, f'traverse_{key}')()
+            backend.doupdate()
+            render.add(time.perf_counter() - started)
+            _count_frame(backend, render)
+        fe.scanner.shutdown()
+        benchmarks += [first_paint, render]
+    return benchmarks
+
+def _bench_terminal(stdscr, trees: Dict[str, str], args: argparse.Namespace) -> List[Benchmark]:
+    backend = CursesBackend(stdscr)
+    backend.setup()
+    return bench_rendering(backend, trees, args)
+
+def _count_frame(backend: RenderBackend, benchmark: Benchmark):
+    # Add what the last frame sent to the terminal to the benchmark's counters
+    if not isinstance(backend, HeadlessBackend):
+        return
+    frame = backend.frames[-1]
+    benchmark.count('bytes', frame.bytes_written)
+    benchmark.count('cells changed', frame.cells_changed)
+    benchmark.count('full_redraws', frame.full_redraw)
+    for caller in frame.full_redraw_callers:
+        benchmark.count(f'cleared by {caller}', 1)
+
+def _press(fe: FileExplorer, key: str) -> bool:
+    # Apply a key press the way PadList does. Returns false if the key had nothing to do
+    if key == 'up':
+        fe.traverse_up()
+    elif key == 'down':
+        fe.traverse_down()
+    elif key == 'left':
+        fe.traverse_left()
+    else:
+        selection = fe.get_selected_entry()
+        if type(selection) != Directory:
+            return False
+        fe.finish_peek()
+        if selection.children is None or len(selection.children) == 0:
+            return False
+        fe.traverse_right()
+    return True
+
+def _first_listing(directory: Directory):
+    # Read a directory until its first, partial listing is ready, as a peek does
+    listings = directory.stream_contents(FIRST_BATCH)
+    next(listings)
+    listings.close()
+
+def _settle(has_pending: Callable[[], bool], poll: Callable[[], int]):
+    # Wait for background scans to finish and apply their results, so each key starts from the same state
+    while has_pending():
+        poll()
+        time.sleep(SETTLE_SLEEP)
+
+def _wait_until_cacheable(root: str):
+    # Listings of directories changed within the racy window are not cached, so give a new tree time to age
+    age_ns = time.time_ns() - os.stat(os.path.join(root, DONE_MARKER)).st_mtime_ns
+    if age_ns < RACY_WINDOW_NS:
+        time.sleep((RACY_WINDOW_NS - age_ns) / 1e9)
+
+def _scanned_dirs(shape: str, root: str, depth: int) -> List[str]:
+    # The directories each scan benchmark reads. Deep trees are only read down to depth, since paths
+    # get too long for the system well before the bottom of the tree
+    if shape == 'mixed':
+        return [path for path, _, _ in os.walk(root)]
+    if shape == 'deep':
+        return [root + '/d' * level for level in range(depth)]
+    return [root]
+
+def _key_sequence(shape: str, steps: int, rng: random.Random) -> List[str]:
+    # Wide trees are scrolled through, deep trees are descended and climbed back out of, and the others are wandered around
+    if shape == 'wide':
+        return ['down'] * (steps // 2) + ['up'] * (steps - steps // 2)
+    if shape == 'deep':
+        return ['right'] * (steps // 2) + ['left'] * (steps - steps // 2)
+    return rng.choices(['up', 'down', 'right', 'left'], weights=[3, 4, 2, 1], k=steps)
+
+def _environment(args: argparse.Namespace) -> Dict[str, str]:
+    # What the baseline was measured on, to tell apart changes in the code from changes in the machine
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'scale': args.scale,
+        'repeat': args.repeat,
+        'steps': args.steps,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+if __name__ == '__main__':
+    main()
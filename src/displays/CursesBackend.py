@@ -0,0 +1,53 @@
+import curses, select, sys
+from src.displays.RenderBackend import RenderBackend
+from src.explorer.Timings import timed
+
+class CursesBackend(RenderBackend):
+    """
+    Renders to the terminal with curses. Pads and windows are plain curses objects, so drawing costs
+    nothing on top of curses itself.
+
+    Attributes:
+
+    - stdscr --> the curses screen returned by initscr
+    """
+    def __init__(self, stdscr) -> None:
+        self.stdscr = stdscr
+
+    def setup(self):
+        """
+        Set up the colors used by the displays, and clear the screen
+        """
+        self.stdscr.clear()
+        curses.use_default_colors()
+        curses.init_pair(1, curses.COLOR_MAGENTA, -1)
+        curses.init_pair(2, curses.COLOR_GREEN, -1)
+        curses.init_pair(3, curses.COLOR_YELLOW, -1)
+        curses.init_pair(4, 143, -1) # Darker yellow
+        curses.init_pair(5, curses.COLOR_CYAN, -1)  # Marked entries
+        curses.curs_set(0)
+        self.stdscr.refresh()    # Need to call this before rendering anything
+
+    def get_lines(self) -> int:
+        return curses.LINES
+
+    def get_cols(self) -> int:
+        return curses.COLS
+
+    def color_pair(self, number: int) -> int:
+        return curses.color_pair(number)
+
+    def new_pad(self, rows: int, cols: int):
+        return curses.newpad(rows, cols)
+
+    def new_window(self, rows: int, cols: int, y: int, x: int):
+        return curses.newwin(rows, cols, y, x)
+
+    @timed('doupdate')
+    def doupdate(self):
+        curses.doupdate()
+
+    def has_pending_input(self) -> bool:
+        # Checked on the terminal itself, since reading a key through curses would refresh the screen. A key put
+        # back with ungetch is missed, which only costs a short wait
+        return len(select.select([sys.stdin], [], [], 0)[0]) > 0
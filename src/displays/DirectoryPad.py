@@ -1,12 +1,19 @@
+from __future__ import annotations
 import curses
-from typing import List
-from src.explorer.FileEntry import FileEntry, Directory
+from typing import Dict, List, Set
+from src.explorer.FileEntry import FileEntry, Directory, ChildTable, UNKNOWN_SIZE
 from src.explorer.FileExplorer import FileExplorer
+from src.explorer.EntryFilter import EntryFilter
+from src.displays.RenderBackend import RenderBackend
+from src.explorer.Timings import timed
 import os
 
 MAX_FILENAME_LEN = 35
 ELLIPSIS_LEN = 2
 NO_EXT_LAST_N = 3
+LOADING_STR = 'loading...'
+SIZE_WIDTH = 6  # Width of the size column, such as ' 12.3G'
+SIZE_UNITS = 'BKMGTPE'
 
 class DirectoryPad:
     """
@@ -16,49 +23,109 @@ class DirectoryPad:
 
     - file_explorer : :class:`FileExplorer` --> the FileExplorer object used to read file entries for the current directory
     - directory : :class:`Directory` --> the directory being rendered in this view
+    - backend : :class:`RenderBackend` --> the screen the pad is drawn on
     - width : :class:`int` --> the total width (columns) for this directory pad, based on the longest filename in the directory
-    - start_index : :class:`int` --> the row to start rendering at
+    - start_index : :class:`int` --> position of the file entry shown in the top row of the screen, among the entries that are shown
+    - highlighted_index : :class:`int` --> position of the file entry with a selection highlight among the entries that are shown, or None
+    - entry_filter : :class:`EntryFilter` --> if set, only the entries that match it are shown, and positions count only those entries
+    - show_sizes : :class:`bool` --> True if a column with the size of each entry is shown after its name
+    - marks : :class:`Dict[str, Set[str]]` --> the names of the marked entries by the path of their directory, shared with the FileExplorer. Marked entries are shown in their own color
+    - highlight_color : :class:`int` --> the color of the selection highlight
     - offset : :class:`int` --> the column to start rendering at
     - max_cols: :class:`int` --> the max number of columns to render
     - render_from_left :class:`bool` --> True if the pad should be rendered to show content from left to right. If False, render columns from right to left. Default is True
-    - pad --> the curses pad
+    - visible : :class:`bool` --> True if the pad has been placed on screen by render_at_col. Pads that are not visible are never copied to the screen
+    - damaged : :class:`bool` --> True if the pad's content changed since it was last copied to the screen
+    - shown_at : :class:`tuple` --> the (offset, max_cols, first pad column) the pad was last copied to the screen with, or None
+    - pad --> the curses pad. It is only as tall as the screen, and holds just the rows from start_index down. It may be wider than width, after showing a directory with longer names.
+    None once released, until the pad is drawn again
     """
-    def __init__(self, directory: Directory) -> None:
-        self.DIR_COLOR = curses.color_pair(1)
-        self.FILE_COLOR = curses.color_pair(2)
-        self.SELECTED_COLOR = curses.color_pair(3)
-        self.DEEP_DIR_COLOR = curses.color_pair(4)
+    def __init__(self, directory: Directory, backend: RenderBackend, show_sizes: bool = False, marks: Dict[str, Set[str]] = None) -> None:
+        self.DIR_COLOR = backend.color_pair(1)
+        self.FILE_COLOR = backend.color_pair(2)
+        self.SELECTED_COLOR = backend.color_pair(3)
+        self.DEEP_DIR_COLOR = backend.color_pair(4)
+        self.MARKED_COLOR = backend.color_pair(5)
 
+        self.backend = backend
         self.directory = directory
+        self.show_sizes = show_sizes
+        self.marks = marks if marks is not None else {}
         self.width = self.get_width()
         self.start_index = 0
+        self.highlighted_index = None
+        self.highlight_color = self.SELECTED_COLOR
+        self.entry_filter: EntryFilter = None
         self.offset = 0
         self.max_cols = self.width
         self.render_from_left = True
+        self.drawn = False
+        self.visible = False
+        self.damaged = True
+        self.shown_at = None
         self.pad = self._create_pad()
 
+    @timed('DirectoryPad.draw')
     def draw(self):
         """
-        Render the file entries for the the current directory
+        Render the file entries that fit on screen, starting from start_index. Only these rows are
+        drawn, so the cost depends on the height of the screen rather than the size of the directory.
         """
-        self.pad.move(0, 0)
-        self.pad.clear()
-        for i, entry in enumerate(self._get_file_entries()):
-            if type(entry) == Directory:
-                self.pad.addstr(f'{self._get_display_str(entry.name)}\n', self.DIR_COLOR)
-            else:
-                self.pad.addstr(f'{self._get_display_str(entry.name)}\n', self.FILE_COLOR)
+        if self.pad is None:
+            self.pad = self._create_pad()
+        self.pad.erase()
+        if self.is_loading():
+            self.pad.addstr(0, 0, LOADING_STR, self.FILE_COLOR)
+        self._draw_rows(self.start_index)
         self.drawn = True
+        self.damaged = True
+        self.noutrefresh()
+
+    def update_rows(self, first_index: int) -> bool:
+        """
+        Redraw the rows from first_index down after entries were inserted or removed in place. If the
+        pad has a highlight, the highlighted entry is kept on the same row of the screen.
+
+        Returns false if the entries no longer fit in the pad's width, in which case the pad must be rebuilt
+
+        Parameters:
+
+        - first_index : :class:`int` --> the lowest index whose entry changed
+        """
+        if self.get_width() > self.width:
+            return False
+        if not self.is_drawn():
+            return True
+        if self.highlighted_index is not None:
+            prev_start_index = self.start_index
+            selected_index = self.directory.get_curr_selected_child_index()
+            self.keep_at_row(selected_index, self.highlighted_index - self.start_index)
+            self._set_highlight(selected_index)
+            if self.start_index != prev_start_index:  # Every visible row moved
+                self.draw()
+                return True
+        self._draw_rows(max(self._first_position(first_index), self.start_index))
         self.noutrefresh()
+        return True
 
     def noutrefresh(self):
         """
-        Mark the pad for refresh. curses.doUpdate() must be called afterwards for the refresh to take place.
+        Mark the pad for refresh. The backend's doupdate() must be called afterwards for the refresh to take place.
+        Nothing is copied if the pad is not on screen, or if it neither changed nor moved since it was last copied.
         """
+        if not self.visible:
+            return
         pad_col_start = 0 if self.width == self.max_cols or self.render_from_left else self.width - self.max_cols
+        shown_at = (self.offset, self.max_cols, pad_col_start)
+        if shown_at != self.shown_at:   # Moved, so every row has to be copied to its new place
+            self.pad.touchwin()
+        elif not self.damaged:
+            return
 
         # (upper-left of pad start, upper-left of window, lower-right of window)
-        self.pad.noutrefresh(self.start_index, pad_col_start, 0, self.offset, curses.LINES-1, self.max_cols - 1 + self.offset)
+        self.pad.noutrefresh(0, pad_col_start, 0, self.offset, self.backend.get_lines()-1, self.max_cols - 1 + self.offset)
+        self.shown_at = shown_at
+        self.damaged = False
 
     def render_at_col(self, col: int, render_from_left=True) -> bool:
         """
@@ -77,11 +144,12 @@ class DirectoryPad:
             self.set_max_cols(col)
         else:
             self.set_offset(col)
-            if col + self.width < curses.COLS:
+            if col + self.width < self.backend.get_cols():
                 self.set_max_cols(self.width)
             else:
-                self.set_max_cols(curses.COLS - col)    # Number of columns that the pad will get to render before hitting an edge of the screen
+                self.set_max_cols(self.backend.get_cols() - col)    # Number of columns that the pad will get to render before hitting an edge of the screen
             self.set_render_from_left(render_from_left)
+        self.visible = True
         if not self.is_drawn():
             self.draw()
         else:
@@ -90,19 +158,96 @@ class DirectoryPad:
 
     def select_at_index(self, curr_index: int):
         """
-        Highlight the row of the file at curr_index
+        Highlight the row of the file at curr_index, scrolling the visible rows if it is off screen.
+        Nothing is highlighted if the file is hidden by the filter.
+        """
+        self.highlight_color = self.SELECTED_COLOR
+        position = self._set_highlight(curr_index)
+        if position is None:
+            self.noutrefresh()
+        elif self._update_start_index(position):
+            self.draw()     # Visible rows changed, render the new slice
+        else:
+            self._recolor_row(position, self.SELECTED_COLOR)
+            self.noutrefresh()  # Mark for refresh
+
+    def keep_at_row(self, index: int, row: int):
+        """
+        Scroll so the entry at index is shown at the given row of the screen, without scrolling past
+        the end of the entries or moving the entry off screen
+
+        Parameters:
+
+        - index : :class:`int` --> the index of the entry
+        - row : :class:`int` --> the row of the screen to show it on
+        """
+        position = self._first_position(index)
+        start_index = min(position - row, self.get_num_entries() - self.backend.get_lines())
+        self.start_index = max(0, position - self.backend.get_lines() + 1, min(start_index, position))
+
+    def set_filter(self, entry_filter: EntryFilter):
+        """
+        Show only the entries that match a filter, or every entry if entry_filter is None, and redraw the
+        pad. The highlighted entry stays on the same row of the screen if it is still shown.
+
+        Parameters:
+
+        - entry_filter : :class:`EntryFilter` --> the filter to apply
+        """
+        row = None if self.highlighted_index is None else self.highlighted_index - self.start_index
+        self.entry_filter = entry_filter
+        selected_index = self.directory.get_curr_selected_child_index()
+        if row is not None and self._set_highlight(selected_index) is not None:
+            self.keep_at_row(selected_index, row)
+        else:
+            self.highlighted_index = None
+            self.start_index = 0
+        self.draw()
+
+    def show(self, directory: Directory):
+        """
+        Show another directory in this pad, from its first entry and without a highlight. The pad is
+        drawn again the next time it is rendered, reusing the curses pad if it is wide enough.
+
+        Parameters:
+
+        - directory : :class:`Directory` --> the directory to show
+        """
+        self.directory = directory
+        self.start_index = 0
+        self.highlighted_index = None
+        self.highlight_color = self.SELECTED_COLOR
+        self.entry_filter = None
+        self.reload()
+
+    def reload(self):
         """
-        # NOTE: coords for window.move methods are relative to the window's position
-        self.pad.move(curr_index, 0)  # Move cursor vertically
-        self.pad.chgat(self.SELECTED_COLOR)
-        self._update_start_index(curr_index)
-        self.noutrefresh()  # Mark for refresh
+        Show the latest listing of the directory, keeping the filter, and the selected entry at the same
+        row of the screen. The pad is drawn again the next time it is rendered.
+        """
+        self.width = self.get_width()
+        if self.width > self.pad_width:
+            self.pad = self._create_pad()
+            self.shown_at = None
+        if self.highlighted_index is not None:
+            selected_index = self.directory.get_curr_selected_child_index()
+            self.keep_at_row(selected_index, self.highlighted_index - self.start_index)
+            self._set_highlight(selected_index)
+        self.drawn = False
 
     def get_num_entries(self) -> int:
+        """
+        Returns the number of entries shown, which excludes any hidden by the filter
+        """
+        if self.entry_filter is not None:
+            return len(self.entry_filter)
         return len(self._get_file_entries())
 
     def get_width(self) -> int:
-        return min(self._get_max_filename_len(), MAX_FILENAME_LEN) + 1
+        if self.is_loading():
+            return len(LOADING_STR) + 1
+        name_width = min(self._get_max_filename_len(), MAX_FILENAME_LEN) + 1
+        return name_width + SIZE_WIDTH + 1 if self.show_sizes else name_width
 
     def set_offset(self, offset: int):
         self.offset = offset
@@ -113,24 +258,53 @@ class DirectoryPad:
     def set_render_from_left(self, from_left: bool):
         self.render_from_left = from_left
 
-    def deselect_file(self, curr_file: FileEntry):
+    def deselect_file(self):
         # Remove the selection highlight from the currently selected file
-        if type(curr_file) == Directory:
-            self.pad.chgat(self.DIR_COLOR)
-        else:
-            self.pad.chgat(self.FILE_COLOR)
+        position = self.highlighted_index
+        self.highlighted_index = None
+        if position is None or not self._is_visible(position):
+            return
+        if position >= self.get_num_entries():  # Entry was removed since it was highlighted
+            self._recolor_row(position, self.FILE_COLOR)
+            return
+        index = position if self.entry_filter is None else self.entry_filter.indices[position]
+        self._recolor_row(position, self._get_color(index))
 
     def deep_select_curr_file(self):
         # Apply a selection highlight to show the current file was previously selected
-        self.pad.chgat(self.DEEP_DIR_COLOR)
+        self.highlight_color = self.DEEP_DIR_COLOR
+        if self.highlighted_index is not None and self._is_visible(self.highlighted_index):
+            self._recolor_row(self.highlighted_index, self.DEEP_DIR_COLOR)
+
+    def touch(self):
+        """
+        Mark the whole pad as changed, so all of it is copied to the screen on the next refresh
+        """
+        if self.pad is None:
+            return
+        self.pad.touchwin()
+        self.damaged = True
+
+    def hide(self):
+        # Stop copying the pad to the screen, once it is scrolled off or removed
+        self.visible = False
+        self.shown_at = None
+
+    def release(self):
+        # Free the curses pad of a pad that is far off screen. It is created and drawn again the next time the pad is rendered
+        self.hide()
+        self.pad = None
+        self.pad_width = 0
+        self.drawn = False
 
     def is_drawn(self):
-        return hasattr(self, 'drawn')
+        return self.drawn
 
-    def clear(self):
-        self.pad.move(0, 0)
-        self.pad.clear()
-        self.noutrefresh()
+    def is_loading(self) -> bool:
+        """
+        Returns true if the directory is still being scanned, in which case a placeholder is shown
+        """
+        return self.directory.children is None
 
     def _get_display_str(self, filename: str) -> str:
         if len(filename) <= MAX_FILENAME_LEN:
@@ -148,22 +322,92 @@ class DirectoryPad:
         return res
 
     def _get_max_filename_len(self) -> int:
-        longest_name_file = max(self._get_file_entries(), key=lambda x: len(x.name), default=None)
-        return len(longest_name_file.name) if longest_name_file is not None else 0
+        return self._get_file_entries().max_name_len
 
     def _create_pad(self):
-        # Create a new pad with width (rows) based on number of file entries and width (columns) based on the longest file name in the file entry list
-        num_file_entries = self.get_num_entries()
-        num_rows = num_file_entries+1 if num_file_entries >= curses.LINES else curses.LINES
-        return curses.newpad(num_rows, self.width)
+        # Create a new pad as tall as the screen, with width (columns) based on the longest file name in the file entry list
+        self.pad_width = self.width
+        return self.backend.new_pad(self.backend.get_lines(), self.width)
+
+    def _draw_rows(self, from_index: int):
+        # Draw the visible rows from position from_index to the bottom of the screen, clearing any rows left below them
+        entries = self._get_file_entries()
+        end_index = min(self.get_num_entries(), self.start_index + self.backend.get_lines())
+        if from_index - self.start_index >= self.backend.get_lines():
+            return
+        self.damaged = True
+        self.pad.move(from_index - self.start_index, 0)
+        self.pad.clrtobot()
+        indices = self.entry_filter.indices if self.entry_filter is not None else None
+        size_col = self.width - SIZE_WIDTH - 1
+        marked = self._get_marked()
+        for position in range(from_index, end_index):  # Read names and kinds from the table without creating FileEntry objects
+            i = position if indices is None else indices[position]
+            color = self._get_color(i, marked)
+            self.pad.addstr(position - self.start_index, 0, self._get_display_str(entries.name(i)), color)
+            if self.show_sizes:
+                self.pad.addstr(position - self.start_index, size_col, _format_size(entries.sizes[i]), color)
+        if self.highlighted_index is not None and self._is_visible(self.highlighted_index):
+            self.pad.chgat(self.highlighted_index - self.start_index, 0, self.highlight_color)
 
-    def _get_file_entries(self):
-        return self.directory.children
+    def _recolor_row(self, position: int, color: int):
+        # Change the color of the visible row showing the entry at position
+        if self.pad is None:
+            return
+        self.pad.chgat(position - self.start_index, 0, color)
+        self.damaged = True
 
-    def _update_start_index(self, new_index: int):
+    def _get_color(self, index: int, marked: Set[str] = None) -> int:
+        entries = self._get_file_entries()
+        marked = self._get_marked() if marked is None else marked
+        if len(marked) > 0 and entries.name(index) in marked:
+            return self.MARKED_COLOR
+        return self.DIR_COLOR if entries.is_dir(index) else self.FILE_COLOR
+
+    def _get_marked(self) -> Set[str]:
+        # Names of the marked entries of the directory. Looked up once per draw, since marks are rare
+        if len(self.marks) == 0:
+            return set()
+        return self.marks.get(self.directory.get_path(), set())
+
+    def _is_visible(self, position: int) -> bool:
+        return self.start_index <= position < self.start_index + self.backend.get_lines()
+
+    def _set_highlight(self, index: int) -> int:
+        # Highlight the entry at index, if it is shown. Returns its position, or None
+        position = index if self.entry_filter is None else self.entry_filter.position(index)
+        self.highlighted_index = position if position >= 0 else None
+        return self.highlighted_index
+
+    def _first_position(self, index: int) -> int:
+        # Position of the first shown entry at or after index
+        return index if self.entry_filter is None else self.entry_filter.first_position(index)
+
+    def _get_file_entries(self) -> ChildTable:
+        return self.directory.children if self.directory.children is not None else ChildTable(self.directory)
+
+    def _update_start_index(self, new_position: int) -> bool:
         # Shift the file entry list up or down if it doesn't fit entirely within the screen
-        if new_index - self.start_index >= curses.LINES:
-            self.start_index = new_index - curses.LINES + 1
-        elif new_index < self.start_index:
-            self.start_index = new_index
-    
\ No newline at end of file
+        # Returns true if the visible rows changed
+        if new_position - self.start_index >= self.backend.get_lines():
+            self.start_index = new_position - self.backend.get_lines() + 1
+        elif new_position < self.start_index:
+            self.start_index = new_position
+        else:
+            return False
+        return True
+    
+def _format_size(size: int) -> str:
+    # Human-readable size that fits in SIZE_WIDTH columns, like ls -h. Blank if the size is unknown
+    if size == UNKNOWN_SIZE:
+        return ' ' * SIZE_WIDTH
+    unit = 0
+    value = float(size)
+    while value >= 1000 and unit < len(SIZE_UNITS) - 1:
+        value /= 1024
+        unit += 1
+    if unit == 0:
+        return f'{size}{SIZE_UNITS[0]}'.rjust(SIZE_WIDTH)
+    if value < 10:
+        return f'{value:.1f}{SIZE_UNITS[unit]}'.rjust(SIZE_WIDTH)
+    return f'{value:.0f}{SIZE_UNITS[unit]}'.rjust(SIZE_WIDTH)
@@ -0,0 +1,164 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, List
+from src.explorer.FileExplorer import FileExplorer
+from src.displays.RenderBackend import RenderBackend
+import unicodedata
+
+if TYPE_CHECKING:
+    from src.explorer.FilePreview import PreviewJob
+
+LOADING_STR = 'loading...'
+EMPTY_STR = '(empty)'
+MIN_COLS = 20   # Narrowest preview worth showing. With less room to the right of the current pad, pads are shifted left to make room
+
+class FilePreviewPad:
+    """
+    A preview of the selected file, shown to the right of the current directory's pad. Lines are read by
+    the FileExplorer's previewer in the background, a screenful at a time, and paged through on request.
+
+    Attributes:
+
+    - fe : :class:`FileExplorer` --> the FileExplorer object used to read the file
+    - backend : :class:`RenderBackend` --> the screen the preview is drawn on
+    - path : :class:`str` --> the path of the file shown, or None
+    - first_line : :class:`int` --> the index of the line shown in the top row
+    - lines : :class:`List[str]` --> the lines shown, or None while the first page is loading
+    - message : :class:`str` --> text shown instead of lines, such as why the file could not be read
+    - job : :class:`PreviewJob` --> the most recent request for lines
+    - offset : :class:`int` --> the column of the screen the preview starts at
+    - max_cols : :class:`int` --> the number of columns the preview takes up
+    - visible : :class:`bool` --> True if the preview has been placed on screen by render_at_col
+    - damaged : :class:`bool` --> True if the content changed since it was last copied to the screen
+    - window --> the window the preview is drawn in, created again when the preview moves
+    """
+    def __init__(self, fe: FileExplorer, backend: RenderBackend) -> None:
+        self.TEXT_COLOR = backend.color_pair(2)
+        self.fe = fe
+        self.backend = backend
+        self.path: str = None
+        self.first_line = 0
+        self.lines: List[str] = None
+        self.message: str = None
+        self.job: PreviewJob = None
+        self.offset = 0
+        self.max_cols = 0
+        self.visible = False
+        self.damaged = True
+        self.window = None
+
+    def show(self, path: str):
+        """
+        Start previewing a file from its first line. A loading placeholder is shown unless the first page
+        arrives within a moment
+
+        Parameters:
+
+        - path : :class:`str` --> the path of the file
+        """
+        if path == self.path:
+            return
+        self.path = path
+        self.first_line = 0
+        self.lines = None
+        self.message = None
+        self.damaged = True
+        self._request(0)
+
+    def scroll(self, pages: int):
+        """
+        Page through the file, reading only the lines that come into view
+
+        Parameters:
+
+        - pages : :class:`int` --> the number of screenfuls to move down, or up if negative
+        """
+        if self.path is None or self.lines is None:
+            return
+        self._request(max(0, self.first_line + pages * self.backend.get_lines()))
+
+    def render_at_col(self, col: int):
+        """
+        Place the preview at a column, taking up the rest of the screen, and copy it there if it moved or changed
+
+        Parameters:
+
+        - col : :class:`int` --> the column of the screen to start at
+        """
+        max_cols = self.backend.get_cols() - col
+        if self.window is None or (col, max_cols) != (self.offset, self.max_cols):
+            self.offset = col
+            self.max_cols = max_cols
+            self.window = self.backend.new_window(self.backend.get_lines(), max_cols, 0, col)
+            self.damaged = True
+        self.visible = True
+        self.noutrefresh()
+
+    def noutrefresh(self):
+        """
+        Draw the preview if it changed, and mark it for refresh
+        """
+        if not self.visible or not self.damaged:
+            return
+        self.window.erase()
+        if self.lines is None or len(self.lines) == 0:
+            text = self.message or (LOADING_STR if self.lines is None else EMPTY_STR)
+            self.window.addnstr(0, 0, text, self.max_cols - 1, self.TEXT_COLOR)
+        else:
+            for row, line in enumerate(self.lines[:self.backend.get_lines()]):
+                self.window.addstr(row, 0, _fit(line, self.max_cols - 1), self.TEXT_COLOR)
+        self.window.noutrefresh()
+        self.damaged = False
+
+    def hide(self):
+        """
+        Stop showing the preview, and drop any request still being read. Columns it leaves uncovered must be blanked
+        """
+        self.visible = False
+        self.window = None
+        self.path = None
+        if self.job is not None:
+            self.job.cancel()
+            self.job = None
+
+    def touch(self):
+        """
+        Draw the whole preview again on the next refresh, such as after something was drawn over it
+        """
+        self.damaged = True
+
+    def has_pending(self) -> bool:
+        return self.job is not None and self.job.is_pending()
+
+    def _request(self, first_line: int):
+        # Ask for the page of lines starting at first_line, waiting briefly so a fast read is shown without a placeholder.
+        # While keys are waiting, such as when one is held, the next one is handled straight away instead
+        if self.job is not None:
+            self.job.cancel()
+        self.job = self.fe.preview_file(self.path, first_line, self.backend.get_lines(), self._on_read)
+        if not self.backend.has_pending_input():
+            self.fe.wait_for_preview(self.job)
+
+    def _on_read(self, job: PreviewJob):
+        # Show the lines read for the latest request
+        if job is not self.job:
+            return
+        self.job = None
+        self.first_line = job.first_line
+        self.lines = job.lines
+        self.message = job.error
+        self.damaged = True
+        self.noutrefresh()
+
+def _fit(text: str, cols: int) -> str:
+    # The start of text that fits in cols cells, counting wide characters as two and combining ones as none
+    if text.isascii():  # Control characters were replaced, so every character takes one cell
+        return text[:cols]
+    if len(text) <= cols // 2:
+        return text
+    width = 0
+    for i, ch in enumerate(text):
+        cell = 0 if unicodedata.combining(ch) else 2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1
+        if width + cell > cols:
+            return text[:i]
+        width += cell
+    return text
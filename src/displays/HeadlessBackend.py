@@ -0,0 +1,290 @@
+from __future__ import annotations
+from typing import List, Set
+from src.displays.RenderBackend import RenderBackend
+import curses, os, sys, unicodedata
+
+DEFAULT_LINES = 40
+DEFAULT_COLS = 160
+BLANK = ' '
+WIDE = ''   # Placeholder in the cell covered by the right half of a double width character
+CLEAR_SCREEN = '\x1b[H\x1b[2J'
+
+class FrameStats:
+    """
+    What one call to doupdate did to the screen.
+
+    Attributes:
+
+    - cells_copied : :class:`int` --> cells copied from pads and windows to the screen by noutrefresh since the last frame
+    - cells_changed : :class:`int` --> cells of the screen that ended up different from the last frame
+    - rows_changed : :class:`int` --> rows of the screen with at least one changed cell
+    - bytes_written : :class:`int` --> estimate of the bytes a terminal would have been sent, counting cursor moves and color changes
+    - full_redraw : :class:`bool` --> True if the whole screen was cleared and redrawn
+    - full_redraw_callers : :class:`List[str]` --> the functions that called clear() and caused the full redraw, each as 'Module.function < Module.caller'
+    """
+    def __init__(self) -> None:
+        self.cells_copied = 0
+        self.cells_changed = 0
+        self.rows_changed = 0
+        self.bytes_written = 0
+        self.full_redraw = False
+        self.full_redraw_callers: List[str] = []
+
+
+class HeadlessWindow:
+    """
+    A pad or window held in memory. Like curses, it remembers which rows changed since they were last
+    copied to the screen, and noutrefresh only copies those rows.
+
+    Attributes:
+
+    - backend : :class:`HeadlessBackend` --> the screen the window is copied to
+    - rows : :class:`int` --> the height of the window
+    - cols : :class:`int` --> the width of the window
+    - y : :class:`int` --> the row of the screen the window is at, or None for a pad
+    - x : :class:`int` --> the column of the screen the window is at, or None for a pad
+    - chars : :class:`List[List[str]]` --> the character in each cell
+    - attrs : :class:`List[List[int]]` --> the attribute of each cell
+    - touched : :class:`Set[int]` --> rows changed since they were last copied to the screen
+    - cursor : :class:`Tuple[int, int]` --> the (row, column) that the next character is written at
+    """
+    def __init__(self, backend: HeadlessBackend, rows: int, cols: int, y: int = None, x: int = None) -> None:
+        if rows <= 0 or cols <= 0:
+            raise curses.error('Window must be at least one cell')
+        self.backend = backend
+        self.rows = rows
+        self.cols = cols
+        self.y = y
+        self.x = x
+        self.chars = [[BLANK] * cols for _ in range(rows)]
+        self.attrs = [[0] * cols for _ in range(rows)]
+        self.touched: Set[int] = set(range(rows))
+        self.cursor = (0, 0)
+        self.clear_caller: str = None
+
+    def erase(self):
+        for row in range(self.rows):
+            self._blank(row, 0)
+        self.cursor = (0, 0)
+
+    def clear(self):
+        # Like curses, the next refresh repaints the whole screen, not just this window
+        self.erase()
+        self.clear_caller = _caller()
+
+    def move(self, y: int, x: int):
+        self._check(y, x)
+        self.cursor = (y, x)
+
+    def clrtobot(self):
+        row, col = self.cursor
+        self._blank(row, col)
+        for row in range(row + 1, self.rows):
+            self._blank(row, 0)
+
+    def addstr(self, *args):
+        # addstr([y, x,] text[, attr])
+        if isinstance(args[0], int):
+            self.move(args[0], args[1])
+            args = args[2:]
+        self._write(args[0], args[1] if len(args) > 1 else 0)
+
+    def addnstr(self, *args):
+        # addnstr([y, x,] text, n[, attr])
+        if isinstance(args[0], int):
+            self.move(args[0], args[1])
+            args = args[2:]
+        self._write(args[0][:max(0, args[1])], args[2] if len(args) > 2 else 0)
+
+    def chgat(self, *args):
+        # chgat([y, x,] [num,] attr). A num of -1 or no num changes the rest of the row
+        if len(args) >= 3:
+            self.move(args[0], args[1])
+            args = args[2:]
+        num, attr = (args[0], args[1]) if len(args) == 2 else (-1, args[0])
+        row, col = self.cursor
+        end = self.cols if num < 0 else min(self.cols, col + num)
+        self.attrs[row][col:end] = [attr] * (end - col)
+        self.touched.add(row)
+
+    def touchwin(self):
+        self.touched.update(range(self.rows))
+
+    def getmaxyx(self):
+        return self.rows, self.cols
+
+    def noutrefresh(self, *args):
+        # noutrefresh() for a window, or noutrefresh(pminrow, pmincol, sminrow, smincol, smaxrow, smaxcol) for a pad
+        if len(args) == 0:
+            if self.y is None:
+                raise curses.error('noutrefresh() of a pad needs its position on screen')
+            self._copy(0, 0, self.y, self.x, self.y + self.rows - 1, self.x + self.cols - 1)
+            return
+        pminrow, pmincol, sminrow, smincol, smaxrow, smaxcol = args
+        # Same checks as pnoutrefresh in ncurses
+        pminrow, pmincol, sminrow, smincol = max(0, pminrow), max(0, pmincol), max(0, sminrow), max(0, smincol)
+        if (smaxrow >= self.backend.lines or smaxcol >= self.backend.cols or sminrow > smaxrow or smincol > smaxcol):
+            raise curses.error('pnoutrefresh() returned ERR')
+        smaxrow = min(smaxrow, sminrow + self.rows - pminrow - 1)
+        smaxcol = min(smaxcol, smincol + self.cols - pmincol - 1)
+        self._copy(pminrow, pmincol, sminrow, smincol, smaxrow, smaxcol)
+
+    def _copy(self, pminrow: int, pmincol: int, sminrow: int, smincol: int, smaxrow: int, smaxcol: int):
+        # Copy the touched rows of a region of the window to the backend's next frame
+        backend = self.backend
+        if self.clear_caller is not None:
+            backend.clear_callers.append(self.clear_caller)
+            self.clear_caller = None
+            self.touchwin()
+        width = smaxcol - smincol + 1
+        for screen_row in range(sminrow, smaxrow + 1):
+            row = pminrow + screen_row - sminrow
+            if row not in self.touched or screen_row >= backend.lines:
+                continue
+            backend.chars[screen_row][smincol:smaxcol + 1] = self.chars[row][pmincol:pmincol + width]
+            backend.attrs[screen_row][smincol:smaxcol + 1] = self.attrs[row][pmincol:pmincol + width]
+            backend.cells_copied += width
+        self.touched.difference_update(range(pminrow, pminrow + smaxrow - sminrow + 1))
+
+    def _write(self, text: str, attr: int):
+        row, col = self.cursor
+        for ch in text:
+            width = _cell_width(ch)
+            if width == 0:
+                if col > 0:     # Combining character, kept with the one before it
+                    self.chars[row][col - 1] += ch
+                    self.touched.add(row)
+                continue
+            if col + width > self.cols:     # Wrap to the next row, like curses
+                row, col = row + 1, 0
+                if row >= self.rows:
+                    self.cursor = (self.rows - 1, self.cols - 1)
+                    raise curses.error('addstr() returned ERR')
+            self.chars[row][col] = ch
+            self.attrs[row][col] = attr
+            if width == 2:
+                self.chars[row][col + 1] = WIDE
+                self.attrs[row][col + 1] = attr
+            self.touched.add(row)
+            col += width
+        if col >= self.cols and row == self.rows - 1:   # Writing to the bottom-right corner is an error in curses too
+            self.cursor = (row, self.cols - 1)
+            raise curses.error('addstr() returned ERR')
+        self.cursor = (row, col) if col < self.cols else (row + 1, 0)
+
+    def _blank(self, row: int, col: int):
+        self.chars[row][col:] = [BLANK] * (self.cols - col)
+        self.attrs[row][col:] = [0] * (self.cols - col)
+        self.touched.add(row)
+
+    def _check(self, y: int, x: int):
+        if not (0 <= y < self.rows and 0 <= x < self.cols):
+            raise curses.error('move() returned ERR')
+
+
+class HeadlessBackend(RenderBackend):
+    """
+    Renders to a screen held in memory, so displays can be driven and measured without a terminal.
+    Each doupdate compares the next frame with the last one, like curses does, and records what a
+    terminal would have been sent in a FrameStats.
+
+    Attributes:
+
+    - lines : :class:`int` --> the number of rows on the screen
+    - cols : :class:`int` --> the number of columns on the screen
+    - chars : :class:`List[List[str]]` --> the next frame, as built by noutrefresh
+    - attrs : :class:`List[List[int]]` --> the attributes of the next frame
+    - frames : :class:`List[FrameStats]` --> what each doupdate did, oldest first
+    - clear_callers : :class:`List[str]` --> callers of clear() on windows copied to the next frame, which force a full redraw
+    """
+    def __init__(self, lines: int = DEFAULT_LINES, cols: int = DEFAULT_COLS) -> None:
+        self.lines = lines
+        self.cols = cols
+        self.chars = [[BLANK] * cols for _ in range(lines)]
+        self.attrs = [[0] * cols for _ in range(lines)]
+        self.shown_chars = [[BLANK] * cols for _ in range(lines)]
+        self.shown_attrs = [[0] * cols for _ in range(lines)]
+        self.frames: List[FrameStats] = []
+        self.clear_callers: List[str] = []
+        self.cells_copied = 0
+
+    def get_lines(self) -> int:
+        return self.lines
+
+    def get_cols(self) -> int:
+        return self.cols
+
+    def color_pair(self, number: int) -> int:
+        return number << 8  # Same encoding as curses
+
+    def new_pad(self, rows: int, cols: int) -> HeadlessWindow:
+        return HeadlessWindow(self, rows, cols)
+
+    def new_window(self, rows: int, cols: int, y: int, x: int) -> HeadlessWindow:
+        if y < 0 or x < 0 or y + rows > self.lines or x + cols > self.cols:
+            raise curses.error('newwin() returned ERR')
+        return HeadlessWindow(self, rows, cols, y, x)
+
+    def has_pending_input(self) -> bool:
+        return False
+
+    def doupdate(self):
+        frame = FrameStats()
+        frame.cells_copied = self.cells_copied
+        frame.full_redraw = len(self.clear_callers) > 0
+        frame.full_redraw_callers = self.clear_callers
+        position = None     # Where the terminal's cursor is, or None if unknown
+        attr = None         # The terminal's current attribute
+        if frame.full_redraw:
+            frame.bytes_written += len(CLEAR_SCREEN)
+            position = (0, 0)
+            attr = 0
+        for y in range(self.lines):
+            chars, attrs = self.chars[y], self.attrs[y]
+            if frame.full_redraw:   # Everything that isn't blank is written again
+                shown_chars, shown_attrs = [BLANK] * self.cols, [0] * self.cols
+            else:
+                shown_chars, shown_attrs = self.shown_chars[y], self.shown_attrs[y]
+                if chars == shown_chars and attrs == shown_attrs:
+                    continue
+            row_changed = False
+            for x in range(self.cols):
+                if chars[x] == shown_chars[x] and attrs[x] == shown_attrs[x]:
+                    continue
+                if chars[x] != WIDE:
+                    if position != (y, x):
+                        frame.bytes_written += len(f'\x1b[{y + 1};{x + 1}H')
+                    if attrs[x] != attr:
+                        attr = attrs[x]
+                        frame.bytes_written += len(f'\x1b[0;{attr >> 8}m')
+                    frame.bytes_written += len(chars[x].encode('utf-8', 'replace'))
+                    position = (y, x + _cell_width(chars[x][0]))
+                frame.cells_changed += 1
+                row_changed = True
+            frame.rows_changed += row_changed
+            self.shown_chars[y] = list(chars)
+            self.shown_attrs[y] = list(attrs)
+        self.clear_callers = []
+        self.cells_copied = 0
+        self.frames.append(frame)
+
+    def get_text(self) -> List[str]:
+        """
+        Returns the text of each row of the screen, as of the last doupdate
+        """
+        return [''.join(row).rstrip() for row in self.shown_chars]
+
+def _cell_width(ch: str) -> int:
+    # Number of cells a character takes up on a terminal: 0 for combining characters, 2 for wide ones
+    if unicodedata.combining(ch):
+        return 0
+    return 2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1
+
+def _caller() -> str:
+    # The two functions above the caller of this function, as 'Module.function < Module.function'
+    frame = sys._getframe(2)
+    names = []
+    while frame is not None and len(names) < 2:
+        names.append(f'{os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]}.{frame.f_code.co_name}')
+        frame = frame.f_back
+    return ' < '.join(names)
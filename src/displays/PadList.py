@@ -1,8 +1,19 @@
-from typing import List
-from src.explorer.FileEntry import FileEntry, Directory
+from __future__ import annotations
+from typing import TYPE_CHECKING, Callable, List, Set
+from src.explorer.FileEntry import FileEntry, Directory, KIND_DIR
 from src.explorer.FileExplorer import FileExplorer
+from src.explorer.DirectoryScanner import ScanJob
+from src.explorer.EntryFilter import FILTER_SUBSTRING, FILTER_FUZZY
 from src.displays.DirectoryPad import DirectoryPad
-import curses
+from src.displays.FilePreviewPad import FilePreviewPad, MIN_COLS as MIN_PREVIEW_COLS
+from src.displays.RenderBackend import RenderBackend
+from src.explorer.Timings import timed
+
+if TYPE_CHECKING:
+    from src.explorer.DiskUsage import SizeJob
+    from src.explorer.FileOperations import OperationJob
+
+PAD_MARGIN = 8  # Pads off screen keep their curses pads if they are this close to a visible pad, so moving back to them is cheap
 
 class PadList:
     """
@@ -11,13 +22,18 @@ class PadList:
     Attributes:
 
     - file_explorer : :class:`FileExplorer` --> the FileExplorer object used to read file entries
+    - backend : :class:`RenderBackend` --> the screen the pads are drawn on
     - dir_pads : :class:`List[DirectoryPad]` --> the list of directory pads currently in use
     - current : :class:`int` --> the index of the currently selected DirectoryPad in dir_pads
     - leftmost_index : :class:`int` --> the index of the leftmost pad that is visible on the screen
     - rightmost_index : :class:`int` --> the index of the rightmost pad that is visible on the screen
+    - show_sizes : :class:`bool` --> True if pads show the size of each entry, and the sizes in the current directory are measured
+    - covered_cols : :class:`int` --> the number of columns from the left edge of the screen that visible pads were copied to by the last refresh
+    - file_preview : :class:`FilePreviewPad` --> the preview of the selected file, shown to the right of the current pad when a file is selected
     """
-    def __init__(self, fe: FileExplorer) -> None:
+    def __init__(self, fe: FileExplorer, backend: RenderBackend) -> None:
         self.fe = fe
+        self.backend = backend
         self.dir_pads = []
         self.current = 0
         self.leftmost_index = 0
@@ -25,34 +41,175 @@ class PadList:
         self.left_padding = 0
         self.right_padding = 0
         self.render_ltr = True
+        self.show_sizes = False
+        self.covered_cols = 0
+        self.file_preview = FilePreviewPad(fe, backend)
         self._init_dir_pads()
         self.refresh()
 
+    def peek_selection(self):
+        """
+        Start showing a preview of the selected directory. This is left out of initialization, so the
+        first frame can be drawn before the preview is scanned
+        """
+        self._update_peek()
+        self.refresh()
+
     def traverse_up(self):
         """
         Deselect the current file in the current directory, and select the previous one
         """
-        prev_selected_file = self.fe.get_selected_entry()
-        new_index = self.fe.traverse_up()
-        curr_dir_pad = self.get_current_dir_pad()
-        curr_dir_pad.deselect_file(prev_selected_file)
-        curr_dir_pad.select_at_index(new_index)
-        self._clear_peek_directory()
-        self._init_child_dir()
-        self.refresh(render_from_current=True)
+        self.move_selection(-1)
 
     def traverse_down(self):
         """
         Deselect the current file in the current directory, and select the next one
         """
+        self.move_selection(1)
+
+    def move_selection(self, steps: int):
+        """
+        Move the selection by a number of entries, wrapping around at either end. Only the entry it lands on
+        is peeked at and redrawn, so a burst of key presses costs as much as one
+
+        Parameters:
+
+        - steps : :class:`int` --> the number of entries to move down, or up if negative
+        """
+        num_entries = self.get_current_dir_pad().get_num_entries()
+        if num_entries == 0:
+            return
+        prev_selected_file = self.fe.get_selected_entry()
+        traverse = self.fe.traverse_down if steps > 0 else self.fe.traverse_up
+        for _ in range(abs(steps) % num_entries):   # Whole laps end where they started
+            traverse()
+        if self.fe.get_selected_entry() is not prev_selected_file:
+            self._show_selection(prev_selected_file)
+
+    def select_index(self, index: int) -> bool:
+        """
+        Select the file entry at the given index in the current directory. Returns true if the index was valid
+
+        Parameters:
+
+        - index : :class:`int` --> the index of the file entry to select
+        """
+        if self.get_current_dir_pad().get_num_entries() == 0:
+            return False
         prev_selected_file = self.fe.get_selected_entry()
-        new_index = self.fe.traverse_down()
+        if self.fe.select_by_index(index) is None:
+            return False
+        self._show_selection(prev_selected_file)
+        return True
+
+    def jump_to_name(self, name: str, prefix: bool = True) -> bool:
+        """
+        Select the file entry with the given name in the current directory. Returns true if one was found
+
+        Parameters:
+
+        - name : :class:`str` --> the name to jump to
+        - prefix : :class:`bool` --> if True and there is no exact match, jump to the first entry whose name starts with name, ignoring case
+        """
+        if self.get_current_dir_pad().get_num_entries() == 0:
+            return False
+        prev_selected_file = self.fe.get_selected_entry()
+        if self.fe.select_by_name(name, prefix) is None:
+            return False
+        self._show_selection(prev_selected_file)
+        return True
+
+    def filter_entries(self, query: str, fuzzy: bool = False) -> bool:
+        """
+        Show only the entries of the current directory whose names match query, ignoring case. The
+        selection moves to the first match if it was filtered out. Returns true if anything matches
+
+        Parameters:
+
+        - query : :class:`str` --> the text to match against names
+        - fuzzy : :class:`bool` --> if True, match names containing the characters of query in order, rather than query itself
+        """
+        if len(self.fe.get_curr_file_entries()) == 0:
+            return False
+        prev_selected_file = self.fe.get_selected_entry()
+        selection = self.fe.set_filter(query, FILTER_FUZZY if fuzzy else FILTER_SUBSTRING)
         curr_dir_pad = self.get_current_dir_pad()
-        curr_dir_pad.deselect_file(prev_selected_file)
-        curr_dir_pad.select_at_index(new_index)
-        self._clear_peek_directory()
-        self._init_child_dir()
+        curr_dir_pad.set_filter(self.fe.entry_filter)
+        if selection is not prev_selected_file or selection is None:
+            self._update_peek()
         self.refresh(render_from_current=True)
+        return selection is not None
+
+    def clear_filter(self):
+        """
+        Show every entry of the current directory again, keeping the selection
+        """
+        prev_selected_file = self.fe.get_selected_entry()
+        self.fe.clear_filter()
+        self._drop_pad_filters()
+        if self.fe.get_selected_entry() is not prev_selected_file: # Selection was hidden, so it has not been peeked at
+            self._update_peek()
+        self.refresh()
+
+    def is_filtered(self) -> bool:
+        return self.fe.entry_filter is not None
+
+    def jump_to_path(self, path: str) -> bool:
+        """
+        Move to the directory containing path and select the entry at path, rebuilding the pads from
+        that directory. Returns true if the path was reached
+
+        Parameters:
+
+        - path : :class:`str` --> the absolute path of the entry to select
+        """
+        if self.fe.jump_to(path) is None:
+            return False
+        for dp in self.dir_pads:
+            dp.hide()   # Columns they leave uncovered are blanked by refresh
+        self.dir_pads = []
+        self.current = 0
+        self.leftmost_index = 0
+        self.rightmost_index = 0
+        self.left_padding = 0
+        self.right_padding = 0
+        self._init_dir_pads()
+        self._update_peek()
+        self._measure_sizes()
+        self.refresh()
+        return True
+
+    def jump_into_directory(self, path: str) -> bool:
+        """
+        Move into the directory at path, rebuilding the pads from its parent. Unlike moving there one level at a time,
+        only the directory and its parent are read, and none of the directories passed on the way are peeked at.
+        Returns true if the path was reached
+
+        Parameters:
+
+        - path : :class:`str` --> the absolute path of the directory
+        """
+        if self.fe.jump_into(path) is None:
+            return False
+        for dp in self.dir_pads:
+            dp.hide()   # Columns they leave uncovered are blanked by refresh
+        self.dir_pads = []
+        self.leftmost_index = 0
+        self.rightmost_index = 0
+        self.left_padding = 0
+        self.right_padding = 0
+        parent = self.fe.curr_directory.parent
+        if parent is not None and parent.children is not None:    # Show where the directory is, as if moved into from its parent
+            parent_pad = DirectoryPad(parent, self.backend, self.show_sizes, self.fe.marks)
+            parent_pad.select_at_index(parent.get_curr_selected_child_index())
+            parent_pad.deep_select_curr_file()
+            self.dir_pads.append(parent_pad)
+        self.current = len(self.dir_pads)
+        self._init_dir_pads()
+        self._update_peek()
+        self._measure_sizes()
+        self.refresh()
+        return True
 
     def traverse_left(self):
         """
@@ -62,31 +219,199 @@ class PadList:
             self.fe.traverse_left()
         except:
             return
+        self._drop_pad_filters()
         curr_dir_pad = self.get_current_dir_pad()
         curr_dir_pad.deep_select_curr_file()
         curr_dir_pad.noutrefresh()
         if self.current == 0:
-            new_dir = DirectoryPad(self.fe.curr_directory)
+            new_dir = DirectoryPad(self.fe.curr_directory, self.backend, self.show_sizes, self.fe.marks)
             self.dir_pads.insert(0, new_dir)
         else:
             self.current -= 1
+        self._measure_sizes()
         self.refresh()
 
     def traverse_right(self):
         """
-        If a child directory in the current directory is selected, move into the child directory
+        If a child directory or archive in the current directory is selected, move into it
         """
         curr_selection = self.fe.get_selected_entry()
-        if type(curr_selection) != Directory:
+        if not isinstance(curr_selection, Directory):
+            return
+        if self.fe.finish_peek():   # Directory had to be scanned now, so the peek pad is out of date
+            self._replace_dir_pad(curr_selection)
+        if curr_selection.children is None: # First entries have not been read yet
             return
-        if len(self.fe.get_selected_entry().children) == 0: # Directory is empty
+        if len(curr_selection.children) == 0: # Directory is empty
             return
         curr_dir_pad = self.get_current_dir_pad()
-        curr_dir_pad.deep_select_curr_file()
+        if len(self.dir_pads) == self.current + 1:  # An archive shows a file preview rather than a peek pad until it is moved into
+            self.file_preview.hide()
+            self.dir_pads.append(DirectoryPad(curr_selection, self.backend, self.show_sizes, self.fe.marks))
         self.fe.traverse_right()
+        self._drop_pad_filters()
+        curr_dir_pad.deep_select_curr_file()
         self.current += 1
         if self.current == len(self.dir_pads)-1:
-            self._init_child_dir()
+            self._update_peek()
+        self._measure_sizes()
+        self.refresh()
+
+    def poll_scans(self) -> bool:
+        """
+        Apply the results of any finished background scans, updating the pads that show them.
+
+        Returns true if any results were applied
+        """
+        return self.fe.scanner.poll() > 0
+
+    def has_pending_scans(self) -> bool:
+        return self.fe.scanner.has_pending()
+
+    def toggle_sizes(self):
+        """
+        Show or hide the size column in every pad. While it is shown, the entries of the current directory
+        are measured in the background, including everything under subdirectories
+        """
+        self.show_sizes = not self.show_sizes
+        for dp in list(self.dir_pads):
+            self._replace_dir_pad(dp.directory)
+        self._measure_sizes()
+        self.refresh()
+
+    def set_sort_mode(self, mode: int):
+        """
+        Order the entries of every directory on screen by a sort mode, keeping the same entries selected.
+        Entries are sorted from data already read, so only the stat data of a mode that needs it may be read from disk.
+
+        Parameters:
+
+        - mode : :class:`int` --> one of the SORT_ constants
+        """
+        self.fe.set_sort_mode(mode)
+        for dp in list(self.dir_pads):
+            dp.directory.sort_children(mode)
+            self._replace_dir_pad(dp.directory)
+        self.refresh()
+
+    def poll_sizes(self) -> bool:
+        """
+        Show the sizes measured since the last poll. Returns true if any were shown
+        """
+        return self.fe.poll_sizes() > 0
+
+    def toggle_mark(self):
+        """
+        Mark the selected entry, or unmark it, and move the selection down to the next entry
+        """
+        if self.fe.get_selected_entry() is None:
+            return
+        self.fe.toggle_mark()
+        self.move_selection(1)  # The mark's color shows once the highlight moves off the entry
+
+    def clear_marks(self):
+        """
+        Unmark every entry, redrawing the pads that showed marks
+        """
+        marked_dirs = set(self.fe.marks)
+        self.fe.clear_marks()
+        self._redraw_dirs(marked_dirs)
+
+    def start_operation(self, kind: int, on_progress: Callable[[OperationJob], None] = None) -> OperationJob:
+        """
+        Start copying or moving the marked entries into the current directory, or deleting them, in the background.
+        The marks are cleared, and the directories on screen that the operation changes are read again once it is done.
+        Returns the job, or None if there was nothing to operate on
+
+        Parameters:
+
+        - kind : :class:`int` --> OP_COPY, OP_MOVE or OP_DELETE
+        - on_progress : :class:`Callable[[OperationJob], None]` --> called on the UI thread each time the operation makes progress, and once it is done
+        """
+        from src.explorer.FileOperations import OP_COPY, OP_MOVE, OP_DELETE
+        start = {OP_COPY: self.fe.copy_marked, OP_MOVE: self.fe.move_marked, OP_DELETE: self.fe.delete_marked}[kind]
+        marked_dirs = set(self.fe.marks)
+
+        def on_operated(job: OperationJob):
+            if job.finished_at is not None:
+                touched = job.touched_dirs()
+                self.fe.rescan((dp.directory for dp in self.dir_pads if dp.directory.get_path() in touched), on_rescanned=self._on_scanned)
+            if on_progress is not None:
+                on_progress(job)
+
+        job = start(on_operated)
+        if job is not None:
+            self._redraw_dirs(marked_dirs)
+        return job
+
+    def poll_operations(self) -> bool:
+        """
+        Report the progress made by file operations since the last poll. Returns true if any made progress
+        """
+        return self.fe.poll_operations() > 0
+
+    def is_operating(self) -> bool:
+        return self.fe.is_operating()
+
+    def scroll_preview(self, pages: int):
+        """
+        Page through the preview of the selected file, if one is shown
+
+        Parameters:
+
+        - pages : :class:`int` --> the number of screenfuls to move down, or up if negative
+        """
+        self.file_preview.scroll(pages)
+
+    def poll_previews(self) -> bool:
+        """
+        Show the pages of the file preview read since the last poll. Returns true if any were shown
+        """
+        return self.fe.poll_previews() > 0
+
+    def has_pending_previews(self) -> bool:
+        return self.file_preview.has_pending()
+
+    def is_measuring(self) -> bool:
+        return self.fe.is_measuring()
+
+    def is_watching(self) -> bool:
+        return self.fe.watcher is not None
+
+    def apply_fs_changes(self) -> bool:
+        """
+        Apply changes to the watched directories, redrawing only the rows of each pad from the first
+        changed entry down. Returns true if anything changed
+        """
+        selected_before = self.fe.get_selected_entry()
+        updated = self.fe.apply_fs_changes(on_rescanned=self._on_scanned)
+        if len(updated) == 0:
+            return False
+        needs_refresh = False
+        for dp in list(self.dir_pads):
+            first_changed = updated.get(dp.directory)
+            if first_changed is None:
+                continue
+            if not dp.update_rows(first_changed):  # New entries don't fit in the pad's width
+                self._replace_dir_pad(dp.directory)
+                needs_refresh = True
+        if self.fe.curr_directory in updated and self.fe.get_selected_entry() is not selected_before:
+            # Selected file was removed, so the file that took its place needs to be peeked at
+            self.get_current_dir_pad().select_at_index(self.fe.selected_index)
+            self._update_peek()
+            needs_refresh = True
+        if needs_refresh:
+            self.refresh()
+        return True
+
+    def redraw(self):
+        """
+        Copy every visible pad back to the screen, such as after something was drawn over them
+        """
+        for dp in self.dir_pads:
+            if dp.is_drawn():
+                dp.touch()
+        self.file_preview.touch()
         self.refresh()
 
     def get_current_dir_pad(self) -> DirectoryPad:
@@ -95,17 +420,20 @@ class PadList:
         """
         return self.dir_pads[self.current]
 
+    @timed('PadList.refresh')
     def refresh(self, render_from_current=False):
         """
-        Update the position of all DirectoryPads that can be visible on screen, and mark each one for refresh
+        Update the position of all DirectoryPads that can be visible on screen, and mark each one that moved or
+        changed for refresh. Columns that no pad covers any more are blanked
 
         Parameters:
 
         - render_from_current : :class:`bool` --> if True, only re-render DirectoryPads to the right of the current one, unless the pads need to be shifted left. Default value is False
         """
+        self.fe.watch(dp.directory for dp in self.dir_pads)
         current_pad: DirectoryPad = self.get_current_dir_pad()
-        selected_pad = current_pad.directory.get_curr_selected_child()
-        curr_pad_contains_child = False if selected_pad is None else current_pad.directory.get_curr_selected_child().contains_child_dirs()
+        selected_pad = self.fe.get_selected_entry()    # None if hidden by the filter
+        curr_pad_contains_child = selected_pad is not None and selected_pad.kind() == KIND_DIR and selected_pad.contains_child_dirs()
 
         # Index of the furthest-right DirectoryPad that must be shown on screen fully
         shown_dp_index = self.current + 1 if curr_pad_contains_child else self.current
@@ -120,19 +448,23 @@ class PadList:
             i += 1
         
         shown_dp: DirectoryPad = self.dir_pads[shown_dp_index]
-        if offset + shown_dp.width > curses.COLS:
+        preview_cols = MIN_PREVIEW_COLS if self._previewed_file() is not None else 0    # Room kept for the preview of a selected file
+        if offset + shown_dp.width + preview_cols > self.backend.get_cols():
             # Need to render pads from the right edge of the screen to the left
             start_at = self.current + 1 if curr_pad_contains_child else self.current
-            self._refresh_rtl(start_at)
+            self._refresh_rtl(start_at, preview_cols)
         else:
             self.leftmost_index = self.current if self.current < self.leftmost_index else self.leftmost_index   # Index of furthest left pad visible on the screen
             self._refresh_ltr(render_from_current)
-    
+        self._place_preview()
+        self._hide_offscreen_pads()
+        self._trim_tree()
+
     def _refresh_ltr(self, render_from_current=False):
         dp: DirectoryPad
         i = self.current if render_from_current else self.leftmost_index
         offset = self.get_current_dir_pad().offset if render_from_current else 0
-        while i < len(self.dir_pads) and offset < curses.COLS:
+        while i < len(self.dir_pads) and offset < self.backend.get_cols():
             dp = self.dir_pads[i]
             dp.render_at_col(offset)    # Render pad at specified offset
             if i == self.current:   # Highlight currently selected file
@@ -144,13 +476,13 @@ class PadList:
         self.rightmost_index = i-1  # Index of the last pad to be rendered on screen
         self.right_padding = self.dir_pads[i-1].max_cols
 
-    def _refresh_rtl(self, start: int):
+    def _refresh_rtl(self, start: int, right_margin: int = 0):
         if start >= len(self.dir_pads):
             return
         dp: DirectoryPad = self.dir_pads[start]
         i = start
-        offset = curses.COLS
-        while i >= 0 and offset >= 0:
+        offset = self.backend.get_cols() - right_margin
+        while i >= 0 and offset > 0:    # Stop once the screen is full, rather than render a pad with no columns
             dp = self.dir_pads[i]
             offset -= dp.width
             col = offset + dp.width if offset < 0 else offset
@@ -160,24 +492,130 @@ class PadList:
             i -= 1
 
         self.leftmost_index = i+1
+        self.rightmost_index = start
 
-    def _clear_peek_directory(self):
-        while len(self.dir_pads) > self.current + 1:
-            prev_child_dir_pad = self.dir_pads.pop()
-            prev_child_dir_pad.clear()
-            self.rightmost_index -= 1
+    def _show_selection(self, prev_selected_file: FileEntry):
+        # Move the highlight in the current pad to the newly selected file, and peek into it
+        curr_dir_pad = self.get_current_dir_pad()
+        curr_dir_pad.deselect_file()
+        curr_dir_pad.select_at_index(self.fe.selected_index)
+        self._update_peek()
+        self.refresh(render_from_current=True)
+
+    def _drop_pad_filters(self):
+        # Show every entry again in any pad that was filtered
+        for dp in self.dir_pads:
+            if dp.entry_filter is not None:
+                dp.set_filter(None)
+
+    def _hide_offscreen_pads(self):
+        # Stop copying pads that are off screen, and blank the columns that were covered by pads before this refresh but not now.
+        # Pads far off screen give up their curses pads
+        covered_cols = self.file_preview.offset + self.file_preview.max_cols if self.file_preview.visible else 0
+        for i, dp in enumerate(self.dir_pads):
+            if self.leftmost_index <= i <= self.rightmost_index:
+                covered_cols = max(covered_cols, dp.offset + dp.max_cols)
+                continue
+            if dp.visible:
+                dp.hide()
+            if dp.pad is not None and not self.leftmost_index - PAD_MARGIN <= i <= self.rightmost_index + PAD_MARGIN:
+                dp.release()
+        if covered_cols < self.covered_cols:
+            blank = self.backend.new_window(self.backend.get_lines(), self.covered_cols - covered_cols, 0, covered_cols)
+            blank.noutrefresh()
+        self.covered_cols = covered_cols
+
+    def _previewed_file(self) -> FileEntry:
+        # The selected file if its preview is shown, or None
+        selection = self.fe.get_selected_entry()
+        if selection is None or selection.kind() == KIND_DIR or selection.get_path() != self.file_preview.path:
+            return None
+        return selection
+
+    def _place_preview(self):
+        # Show the preview of the selected file to the right of the current pad, or stop showing it once another entry is selected
+        if self.file_preview.path is None:
+            return
+        current_pad = self.get_current_dir_pad()
+        col = current_pad.offset + current_pad.max_cols
+        if self._previewed_file() is None or col >= self.backend.get_cols():
+            self.file_preview.hide()
+        else:
+            self.file_preview.render_at_col(col)
+
+    def _trim_tree(self):
+        # Record the directories on screen as used, and keep the tree within its memory budget. Directories with a pad,
+        # which are the current path and the preview, keep their children
+        budget = self.fe.tree_budget
+        budget.touch(dp.directory for dp in self.dir_pads[min(self.leftmost_index, self.current):])
+        budget.trim(lambda: {dp.directory for dp in self.dir_pads})
+
+    def _drop_pads_after(self, index: int):
+        # Remove the pads to the right of the pad at index. Columns they leave uncovered are blanked by refresh
+        while len(self.dir_pads) > index + 1:
+            self.dir_pads.pop().hide()
+        self.rightmost_index = min(self.rightmost_index, index)
 
     def _init_dir_pads(self):
-        # Create the first directory pad and highlight the first entry
-        # Then, create the first child directory pad
-        first_dir_pad = DirectoryPad(self.fe.curr_directory)
+        # Create the first directory pad. The first child directory pad is created by peek_selection
+        first_dir_pad = DirectoryPad(self.fe.curr_directory, self.backend, self.show_sizes, self.fe.marks)
         self.dir_pads.append(first_dir_pad)
-        self._init_child_dir()
-
-    def _init_child_dir(self):
-        # If the currently selected file is a directory, show a preview of it to the right
-        is_dir = self.fe.peek_right()
-        if is_dir:
-            selected_dir = self.fe.get_selected_entry()
-            peek_dir_pad = DirectoryPad(selected_dir)
+
+    def _update_peek(self):
+        # If the currently selected file is a directory, show a preview of it to the right. The pad that showed
+        # the last preview is reused, so moving the selection redraws it in place rather than rebuilding it.
+        # A selected file, including an archive, gets a preview of its first lines instead, unless it is inside an archive and so not on disk
+        self._drop_pads_after(self.current + 1)
+        is_dir = self.fe.peek_right(on_scanned=self._on_scanned, first_batch=self.backend.get_lines())
+        if not is_dir:
+            self._drop_pads_after(self.current)
+            selection = self.fe.get_selected_entry()
+            if selection is None or self.fe.in_archive():
+                self.file_preview.hide()
+            else:
+                self.file_preview.show(selection.get_path())
+            return
+        self.file_preview.hide()
+        selected_dir = self.fe.get_selected_entry()
+        if len(self.dir_pads) > self.current + 1:
+            peek_dir_pad = self.dir_pads[self.current + 1]
+            if peek_dir_pad.directory is not selected_dir:
+                peek_dir_pad.show(selected_dir)
+        else:
+            peek_dir_pad = DirectoryPad(selected_dir, self.backend, self.show_sizes, self.fe.marks)  # Shows a loading placeholder until the scan finishes
             self.dir_pads.append(peek_dir_pad)
+
+    def _measure_sizes(self):
+        # Measure the entries of the current directory, if sizes are shown
+        if self.show_sizes:
+            self.fe.measure_sizes(on_measured=self._on_measured)
+
+    def _on_measured(self, job: SizeJob):
+        # Redraw the pad showing a directory whose sizes grew
+        for dp in self.dir_pads:
+            if dp.directory is job.directory and dp.is_drawn():
+                dp.draw()
+
+    def _redraw_dirs(self, paths: Set[str]):
+        # Draw the pads showing the directories at paths again, such as after their marks changed
+        for dp in self.dir_pads:
+            if dp.is_drawn() and dp.directory.get_path() in paths:
+                dp.draw()
+
+    def _on_scanned(self, job: ScanJob):
+        # Show the latest listing of a scanned directory, if it is still on screen.
+        # This is called again each time a streamed directory grows
+        if job.directory is self.fe.curr_directory:
+            self.fe.sync_selection()    # Entries may have been inserted above the selection
+        if self._replace_dir_pad(job.directory):
+            self.refresh()
+
+    def _replace_dir_pad(self, directory: Directory) -> bool:
+        # Redraw the pad showing the given directory from its latest listing, keeping its selection at the same
+        # row on screen. Returns true if such a pad was found
+        for dp in self.dir_pads:
+            if dp.directory is directory:
+                dp.show_sizes = self.show_sizes
+                dp.reload()
+                return True
+        return False
@@ -0,0 +1,89 @@
+from src.displays.RenderBackend import RenderBackend
+from src.explorer.FileOperations import OperationJob, OP_COPY, OP_MOVE
+import os
+
+OVERLAY_WIDTH = 44
+OVERLAY_HEIGHT = 5
+MIB = 1 << 20
+VERBS = ('copying', 'moving', 'deleting')
+DONE_VERBS = ('copied', 'moved', 'deleted')
+
+class ProgressOverlay:
+    """
+    A box in the bottom-right corner of the screen, above the prompt row, showing the progress of a copy,
+    move or delete: how much is done, the throughput over the last few seconds, the time left, and errors.
+    Once the operation is done it shows a summary until it is closed.
+
+    Attributes:
+
+    - job : :class:`OperationJob` --> the operation shown
+    - backend : :class:`RenderBackend` --> the screen the overlay is drawn on
+    - window --> the window the overlay is drawn in
+    """
+    def __init__(self, job: OperationJob, backend: RenderBackend) -> None:
+        self.TEXT_COLOR = backend.color_pair(3)
+        self.job = job
+        self.backend = backend
+        width = min(OVERLAY_WIDTH, backend.get_cols())
+        height = min(OVERLAY_HEIGHT, backend.get_lines() - 1)  # Leave the bottom row for the prompt
+        self.window = backend.new_window(height, width, backend.get_lines() - 1 - height, backend.get_cols() - width)
+        self.draw()
+
+    def draw(self):
+        """
+        Render the latest progress of the operation
+        """
+        self.window.erase()
+        height, width = self.window.getmaxyx()
+        job = self.job
+        lines = [self._title(), _bar(self._fraction(), width - 8)]
+        if job.kind in (OP_COPY, OP_MOVE) and job.bytes_total > 0:
+            rate = '' if job.finished_at is not None else f'  {job.rate() / MIB:,.1f} MiB/s'
+            lines.append(f'{job.bytes_done / MIB:,.1f} of {job.bytes_total / MIB:,.1f} MiB{rate}')
+        lines.append(f'{job.files_done:,} of {job.files_total:,}{"" if job.planned else "+"} files{self._eta()}')
+        if job.num_errors > 0:
+            path, reason = job.errors[0]
+            lines.append(f'{job.num_errors:,} failed, {os.path.basename(path)}: {reason}')
+        for row, line in enumerate(lines[:height]):
+            self.window.addnstr(row, 0, line, width - 1, self.TEXT_COLOR)
+        self.window.noutrefresh()
+
+    def close(self):
+        """
+        Clear the overlay from the screen. The content underneath must be redrawn afterwards.
+        """
+        self.window.erase()
+        self.window.noutrefresh()
+
+    def _title(self) -> str:
+        # What the operation does, and whether it is done
+        job = self.job
+        count = f'{len(job.sources)} {"entry" if len(job.sources) == 1 else "entries"}'
+        if job.finished_at is not None:
+            status = 'cancelled' if job.cancelled else f'{DONE_VERBS[job.kind]} in {job.finished_at - job.started_at:.1f}s'
+            return f'{count} {status}'
+        return f'{VERBS[job.kind]} {count}' + ('' if job.cancelled else ', esc to stop')
+
+    def _fraction(self) -> float:
+        # Share of the operation that is done, by bytes if it copies any and by files otherwise
+        job = self.job
+        if job.finished_at is not None:
+            return 1.0
+        if job.bytes_total > 0:
+            return job.bytes_done / job.bytes_total
+        return job.files_done / job.files_total if job.files_total > 0 else 0.0
+
+    def _eta(self) -> str:
+        # Time left at the recent rate, once every source has been walked and data is being copied
+        job = self.job
+        rate = job.rate()
+        if job.finished_at is not None or not job.planned or rate <= 0 or job.bytes_total == 0:
+            return ''
+        seconds = int((job.bytes_total - job.bytes_done) / rate)
+        return f'  {seconds // 60}:{seconds % 60:02d} left'
+
+def _bar(fraction: float, width: int) -> str:
+    # Progress bar followed by a percentage, such as '[####    ]  50%'
+    fraction = max(0.0, min(fraction, 1.0))   # Files can grow while they are copied
+    filled = int(fraction * width)
+    return f'[{"#" * filled}{" " * (width - filled)}]{fraction * 100:4.0f}%'
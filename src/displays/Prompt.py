@@ -0,0 +1,87 @@
+import curses
+from src.displays.RenderBackend import RenderBackend
+
+PROMPT_ACTIVE = 0
+PROMPT_ACCEPTED = 1
+PROMPT_CANCELLED = 2
+
+ENTER_KEYS = (10, 13, curses.KEY_ENTER)
+BACKSPACE_KEYS = (8, 127, curses.KEY_BACKSPACE)
+ESCAPE_KEY = 27
+
+class Prompt:
+    """
+    A single line of text input drawn over the bottom row of the screen.
+
+    Attributes:
+
+    - label : :class:`str` --> text shown before the input, such as 'find: '
+    - text : :class:`str` --> the text typed so far
+    - pending_bytes : :class:`bytes` --> bytes of a multi-byte UTF-8 character that has not been completed yet
+    - backend : :class:`RenderBackend` --> the screen the prompt is drawn on
+    - window --> the window the prompt is drawn in
+    """
+    def __init__(self, label: str, backend: RenderBackend) -> None:
+        self.PROMPT_COLOR = backend.color_pair(3)
+        self.backend = backend
+        self.label = label
+        self.text = ''
+        self.pending_bytes = b''
+        self.window = backend.new_window(1, backend.get_cols(), backend.get_lines() - 1, 0)
+        self.draw()
+
+    def handle_key(self, k: int) -> int:
+        """
+        Update the prompt with a key read using getch().
+
+        Returns PROMPT_ACCEPTED if enter was pressed, PROMPT_CANCELLED if escape was pressed or the
+        text was deleted past its start, and PROMPT_ACTIVE otherwise.
+
+        Parameters:
+
+        - k : :class:`int` --> the key code
+        """
+        if k in ENTER_KEYS:
+            return PROMPT_ACCEPTED
+        if k == ESCAPE_KEY:
+            return PROMPT_CANCELLED
+        if k in BACKSPACE_KEYS:
+            if len(self.text) == 0:
+                return PROMPT_CANCELLED
+            self.text = self.text[:-1]
+        elif 32 <= k < 127:
+            self.text += chr(k)
+        elif 128 <= k < 256:    # Part of a UTF-8 encoded character
+            self.pending_bytes += bytes([k])
+            try:
+                self.text += self.pending_bytes.decode('utf-8')
+                self.pending_bytes = b''
+            except UnicodeDecodeError:
+                if len(self.pending_bytes) >= 4:
+                    self.pending_bytes = b''
+                return PROMPT_ACTIVE
+        else:
+            return PROMPT_ACTIVE
+        self.draw()
+        return PROMPT_ACTIVE
+
+    def set_label(self, label: str):
+        self.label = label
+        self.draw()
+
+    def draw(self):
+        """
+        Render the label and text, showing the end of the text if it does not fit
+        """
+        self.window.erase()
+        line = f'{self.label}{self.text}'
+        max_len = self.backend.get_cols() - 1   # Writing to the bottom-right corner of the screen is an error
+        self.window.addstr(0, 0, line[-max_len:], self.PROMPT_COLOR)
+        self.window.noutrefresh()
+
+    def close(self):
+        """
+        Clear the prompt from the screen. The content underneath must be redrawn afterwards.
+        """
+        self.window.erase()
+        self.window.noutrefresh()
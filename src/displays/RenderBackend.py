@@ -0,0 +1,69 @@
+from abc import ABC, abstractmethod
+
+class RenderBackend(ABC):
+    """
+    The screen that the displays draw on. Displays create their pads and windows through a backend, and
+    read the size of the screen from it, so they can be drawn to a terminal with CursesBackend or to
+    memory with HeadlessBackend.
+
+    Pads and windows returned by a backend support the subset of the curses window methods that the
+    displays use: erase, clear, move, clrtobot, addstr, addnstr, chgat, touchwin, getmaxyx and noutrefresh.
+    A backend must implement every method, or it cannot be created.
+    """
+    @abstractmethod
+    def get_lines(self) -> int:
+        """
+        Returns the number of rows on the screen
+        """
+
+    @abstractmethod
+    def get_cols(self) -> int:
+        """
+        Returns the number of columns on the screen
+        """
+
+    @abstractmethod
+    def color_pair(self, number: int) -> int:
+        """
+        Returns the attribute that draws text in the given color pair
+
+        Parameters:
+
+        - number : :class:`int` --> the number of the color pair
+        """
+
+    @abstractmethod
+    def new_pad(self, rows: int, cols: int):
+        """
+        Returns a new pad, which can be larger than the screen and is copied to it by noutrefresh
+
+        Parameters:
+
+        - rows : :class:`int` --> the height of the pad
+        - cols : :class:`int` --> the width of the pad
+        """
+
+    @abstractmethod
+    def new_window(self, rows: int, cols: int, y: int, x: int):
+        """
+        Returns a new window at a fixed position on the screen
+
+        Parameters:
+
+        - rows : :class:`int` --> the height of the window
+        - cols : :class:`int` --> the width of the window
+        - y : :class:`int` --> the row of the screen the top of the window is at
+        - x : :class:`int` --> the column of the screen the left of the window is at
+        """
+
+    @abstractmethod
+    def doupdate(self):
+        """
+        Update the screen to match everything marked with noutrefresh since the last update
+        """
+
+    @abstractmethod
+    def has_pending_input(self) -> bool:
+        """
+        Returns true if the user has typed keys that have not been read yet
+        """
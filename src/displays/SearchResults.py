@@ -0,0 +1,91 @@
+import os
+from typing import List, Tuple
+from src.displays.RenderBackend import RenderBackend
+
+class SearchResults:
+    """
+    A list of paths found by a search, drawn over every row of the screen except the bottom one,
+    which is left for the prompt.
+
+    Attributes:
+
+    - root : :class:`str` --> the directory that paths are shown relative to, or None to show them in full
+    - results : :class:`List[Tuple[str, bool]]` --> the (path, is_dir) of each result
+    - selected_index : :class:`int` --> index of the highlighted result
+    - start_index : :class:`int` --> index of the result shown in the top row
+    - backend : :class:`RenderBackend` --> the screen the results are drawn on
+    - window --> the window the results are drawn in
+    """
+    def __init__(self, root: str, backend: RenderBackend) -> None:
+        self.DIR_COLOR = backend.color_pair(1)
+        self.FILE_COLOR = backend.color_pair(2)
+        self.SELECTED_COLOR = backend.color_pair(3)
+        self.backend = backend
+        self.root = root
+        self.results: List[Tuple[str, bool]] = []
+        self.selected_index = 0
+        self.start_index = 0
+        self.window = backend.new_window(backend.get_lines() - 1, backend.get_cols(), 0, 0)
+        self.draw()
+
+    def set_results(self, results: List[Tuple[str, bool]]):
+        """
+        Show new results, keeping the same path highlighted if it is still among them
+
+        Parameters:
+
+        - results : :class:`List[Tuple[str, bool]]` --> the (path, is_dir) of each result
+        """
+        selected = self.get_selected()
+        self.results = results
+        self.selected_index = 0
+        for i, (path, _) in enumerate(results):
+            if path == selected:
+                self.selected_index = i
+                break
+        self.start_index = min(self.start_index, self.selected_index)
+        self.draw()
+
+    def get_selected(self) -> str:
+        """
+        Returns the path of the highlighted result, or None if there are no results
+        """
+        if len(self.results) == 0:
+            return None
+        return self.results[self.selected_index][0]
+
+    def traverse_up(self):
+        if self.selected_index > 0:
+            self.selected_index -= 1
+            self.draw()
+
+    def traverse_down(self):
+        if self.selected_index < len(self.results) - 1:
+            self.selected_index += 1
+            self.draw()
+
+    def draw(self):
+        """
+        Render the results that fit on screen, scrolling to keep the highlighted one visible
+        """
+        height = self.backend.get_lines() - 1
+        if self.selected_index >= self.start_index + height:
+            self.start_index = self.selected_index - height + 1
+        elif self.selected_index < self.start_index:
+            self.start_index = self.selected_index
+        self.window.erase()
+        for row, (path, is_dir) in enumerate(self.results[self.start_index:self.start_index + height]):
+            if row + self.start_index == self.selected_index:
+                color = self.SELECTED_COLOR
+            else:
+                color = self.DIR_COLOR if is_dir else self.FILE_COLOR
+            shown = path if self.root is None else os.path.relpath(path, self.root)
+            self.window.addnstr(row, 0, shown, self.backend.get_cols() - 1, color)
+        self.window.noutrefresh()
+
+    def close(self):
+        """
+        Clear the results from the screen. The content underneath must be redrawn afterwards.
+        """
+        self.window.erase()
+        self.window.noutrefresh()
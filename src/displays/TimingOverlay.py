@@ -0,0 +1,47 @@
+from src.displays.RenderBackend import RenderBackend
+from src.explorer.Timings import Timings, KEY_OP
+
+OVERLAY_WIDTH = 38
+MAX_OPS = 10    # Operations listed, the slowest at p99 first
+
+class TimingOverlay:
+    """
+    A box in the top-right corner of the screen showing the p50 and p99 time per key press of each
+    timed operation, over the recent key presses.
+
+    Attributes:
+
+    - timings : :class:`Timings` --> the timings to show
+    - backend : :class:`RenderBackend` --> the screen the overlay is drawn on
+    - window --> the window the overlay is drawn in
+    """
+    def __init__(self, timings: Timings, backend: RenderBackend) -> None:
+        self.TEXT_COLOR = backend.color_pair(3)
+        self.timings = timings
+        self.backend = backend
+        width = min(OVERLAY_WIDTH, backend.get_cols())
+        height = min(MAX_OPS + 2, backend.get_lines() - 1)   # Leave the bottom row for the prompt
+        self.window = backend.new_window(height, width, 0, backend.get_cols() - width)
+        self.draw()
+
+    def draw(self):
+        """
+        Render the latest percentiles
+        """
+        self.window.erase()
+        height, width = self.window.getmaxyx()
+        p50 = self.timings.recent_percentiles(50)
+        p99 = self.timings.recent_percentiles(99)
+        num_keys = len(self.timings.recent)
+        self.window.addnstr(0, 0, f'{f"last {num_keys} keys":<18}{"p50 ms":>9}{"p99 ms":>9}', width - 1, self.TEXT_COLOR)
+        ops = sorted(p99, key=lambda op: (op != KEY_OP, -p99[op]))[:height - 1]
+        for row, op in enumerate(ops, start=1):
+            self.window.addnstr(row, 0, f'{op[:18]:<18}{p50[op] * 1000:>9.2f}{p99[op] * 1000:>9.2f}', width - 1, self.TEXT_COLOR)
+        self.window.noutrefresh()
+
+    def close(self):
+        """
+        Clear the overlay from the screen. The content underneath must be redrawn afterwards.
+        """
+        self.window.erase()
+        self.window.noutrefresh()
@@ -0,0 +1,165 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+from src.explorer.FileEntry import UNKNOWN_MTIME
+import os, threading, time
+
+ZIP_SUFFIXES = ('.zip', '.jar', '.whl')
+DEFAULT_MAX_MEMBERS = 1000000   # Members the cached indexes may hold in total before the least recently used are dropped
+
+class ArchiveIndex:
+    """
+    The members of a zip or tar archive, arranged as a tree of directories. Nothing is extracted: a zip
+    is indexed from its central directory, and a tar from a single pass over its headers, skipping the
+    data of its members. Directories that only appear in the paths of their members are created too.
+
+    Attributes:
+
+    - path : :class:`str` --> the path of the archive
+    - stamp : :class:`Tuple[int, int]` --> the size and modification time of the archive when it was indexed
+    - dirs : :class:`Dict[str, Dict[str, Tuple[bool, int, int]]]` --> for each directory inside the archive, by its path with '' for the top,
+    the (is_dir, size, mtime) of each entry by name. Sizes of directories are the totals of everything under them
+    - num_members : :class:`int` --> number of entries in the index
+    - error : :class:`str` --> why the archive could not be read to the end, or None. Members read before the error are kept
+    - ready : :class:`threading.Event` --> set once the archive has been indexed
+    """
+    def __init__(self, path: str, stamp: Tuple[int, int]) -> None:
+        self.path = path
+        self.stamp = stamp
+        self.dirs: Dict[str, Dict[str, Tuple[bool, int, int]]] = {'': {}}
+        self.num_members = 0
+        self.error: str = None
+        self.ready = threading.Event()
+
+    def read(self):
+        """
+        Index the archive. Slow for compressed tars, which must be decompressed to find their headers, so
+        this is best called from a worker thread
+        """
+        try:
+            if self.path.lower().endswith(ZIP_SUFFIXES):
+                self._read_zip()
+            else:
+                self._read_tar()
+        except Exception as e:  # Corrupt and truncated archives raise errors specific to their format and compression
+            self.error = str(e) or type(e).__name__
+        finally:
+            self._total_sizes()
+            self.num_members = sum(map(len, self.dirs.values()))
+            self.ready.set()
+
+    def listing(self, member: str) -> List[Tuple[str, bool, int, int]]:
+        """
+        Returns the (name, is_dir, size, mtime) of each entry of a directory inside the archive, or an empty list if there is no such directory
+
+        Parameters:
+
+        - member : :class:`str` --> the path of the directory inside the archive, or '' for the top
+        """
+        return [(name, *row) for name, row in self.dirs.get(member, {}).items()]
+
+    def _read_zip(self):
+        import zipfile
+        with zipfile.ZipFile(self.path) as archive:
+            for info in archive.infolist():
+                self._add(info.filename, info.is_dir(), info.file_size, _zip_mtime(info.date_time))
+
+    def _read_tar(self):
+        import tarfile
+        with tarfile.open(self.path, 'r:*') as archive:
+            while True:
+                info = archive.next()   # Seeks past the data of the member before it
+                if info is None:
+                    break
+                archive.members = []    # Only the index is kept, not a TarInfo for every member
+                self._add(info.name, info.isdir(), info.size, info.mtime * 1000000000)
+
+    def _add(self, name: str, is_dir: bool, size: int, mtime: int):
+        # Add a member by its path in the archive. Leading slashes and '.' are dropped, and members outside the archive's top are skipped
+        parts = [part for part in name.split('/') if part not in ('', '.')]
+        if len(parts) == 0 or '..' in parts:
+            return
+        path = '/'.join(parts)
+        parent, _, base = path.rpartition('/')
+        siblings = self._ensure_dir(parent)
+        if is_dir:
+            siblings[base] = (True, 0, mtime)
+            self._ensure_dir(path)
+        elif not siblings.get(base, (False,))[0]:   # A directory with the same name keeps its place
+            siblings[base] = (False, size, mtime)
+
+    def _ensure_dir(self, path: str) -> Dict[str, Tuple[bool, int, int]]:
+        # The entries of the directory at path, creating it and any of its parents that are missing
+        entries = self.dirs.get(path)
+        if entries is None:
+            entries = self.dirs[path] = {}
+            parent, _, base = path.rpartition('/')
+            self._ensure_dir(parent).setdefault(base, (True, 0, UNKNOWN_MTIME))
+        return entries
+
+    def _total_sizes(self):
+        # Set the size of each directory to the total of its entries, deepest directories first
+        for path in sorted(self.dirs, key=lambda path: path.count('/') + (path != ''), reverse=True):
+            if path == '':
+                continue
+            parent, _, base = path.rpartition('/')
+            _, _, mtime = self.dirs[parent][base]
+            self.dirs[parent][base] = (True, sum(size for _, size, _ in self.dirs[path].values()), mtime)
+
+
+class ArchiveIndexCache:
+    """
+    The indexes of the archives browsed most recently, so going back into an archive costs a single stat() call.
+    An index is read again if its archive changed, and the least recently used are dropped once they hold more
+    than max_members members. Safe to use from several threads: a thread asking for an archive that another
+    is indexing waits for it rather than reading the archive twice.
+
+    Attributes:
+
+    - max_members : :class:`int` --> the number of members the cached indexes may hold in total. The most recent index is always kept
+    - indexes : :class:`OrderedDict[str, ArchiveIndex]` --> the index of each archive by its path, least recently used first
+    """
+    def __init__(self, max_members: int = DEFAULT_MAX_MEMBERS) -> None:
+        self.max_members = max_members
+        self.indexes: OrderedDict[str, ArchiveIndex] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path: str) -> ArchiveIndex:
+        """
+        Returns the index of an archive, reading it on this thread unless it is cached and unchanged. Raises OSError if the archive cannot be stat'ed
+
+        Parameters:
+
+        - path : :class:`str` --> the path of the archive
+        """
+        st = os.stat(path)
+        stamp = (st.st_size, st.st_mtime_ns)
+        with self.lock:
+            index = self.indexes.get(path)
+            is_new = index is None or index.stamp != stamp
+            if is_new:
+                index = self.indexes[path] = ArchiveIndex(path, stamp)
+            self.indexes.move_to_end(path)
+        if not is_new:
+            index.ready.wait()
+            return index
+        index.read()
+        with self.lock:
+            self._trim()
+        return index
+
+    def _trim(self):
+        # Drop the least recently used indexes until the rest fit. Must be called with the lock held
+        total = sum(index.num_members for index in self.indexes.values())
+        while total > self.max_members and len(self.indexes) > 1:
+            _, index = self.indexes.popitem(last=False)
+            total -= index.num_members
+
+def _zip_mtime(date_time: Tuple[int, int, int, int, int, int]) -> int:
+    # Modification time in nanoseconds of a zip member, whose date and time are stored in local time
+    try:
+        return int(time.mktime(date_time + (0, 0, -1))) * 1000000000
+    except (OverflowError, ValueError):
+        return UNKNOWN_MTIME
+
+ARCHIVE_INDEXES = ArchiveIndexCache()   # Shared by every ArchiveDirectory, so an index outlives the Directory objects that were read from it
@@ -0,0 +1,311 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty
+from typing import Callable, Dict
+from src.explorer.FileEntry import FileEntry, Directory, ArchiveDirectory, ChildTable, SORT_NAME, STAT_SORT_MODES
+from src.explorer.ListingCache import ListingCache
+from src.explorer.Timings import timed
+import os, threading
+
+DEFAULT_WORKERS = 4
+
+class ScanJob:
+    """
+    A request to read the contents of a directory on a worker thread.
+
+    Attributes:
+
+    - directory : :class:`Directory` --> the directory being scanned
+    - callback : :class:`Callable[[ScanJob], None]` --> called on the UI thread once the results have been saved to the directory
+    - lane : :class:`str` --> jobs sharing a lane replace each other, so only the most recent one is guaranteed to finish. None if the job is independent
+    - first_batch : :class:`int` --> number of entries to read before handing back a first, partial listing. None to only hand back the complete listing
+    - children : :class:`ChildTable` --> the most recent listing read by the job
+    - first_ready : :class:`threading.Event` --> set once the first listing has been handed back
+    - cancelled : :class:`bool` --> True if the results of this job should be thrown away
+    - done : :class:`bool` --> True once the complete listing has been saved to the directory
+    """
+    def __init__(self, directory: Directory, callback: Callable[[ScanJob], None] = None, lane: str = None, first_batch: int = None) -> None:
+        self.directory = directory
+        self.callback = callback
+        self.lane = lane
+        self.first_batch = first_batch
+        self.children: ChildTable = None
+        self.first_ready = threading.Event()
+        self.cancelled = False
+        self.done = False
+
+    def cancel(self):
+        """
+        Drop the results of this job. A job that has not started yet will not be run at all.
+        """
+        self.cancelled = True
+
+    def is_pending(self) -> bool:
+        return not self.done and not self.cancelled
+
+
+class DirectoryScanner:
+    """
+    Service that scans directories on a pool of worker threads, so slow directories never block the UI.
+
+    Results are handed back to the UI thread through poll(), which saves them to their directories
+    and runs the job callbacks. Directory objects are never modified from a worker thread. Large
+    directories are streamed: partial listings are handed back as they grow, each one replacing the last.
+    Partial listings stay in name order, and complete ones are put in the order of sort_mode.
+
+    Attributes:
+
+    - cache : :class:`ListingCache` --> cache of previous listings, checked before a directory is scanned. None if caching is disabled
+    - executor : :class:`ThreadPoolExecutor` --> the pool of worker threads
+    - completed : :class:`Queue` --> (job, listing, is_final) results waiting to be polled
+    - running : :class:`Dict[str, ScanJob]` --> the job currently running in each lane
+    - queued : :class:`Dict[str, ScanJob]` --> the job waiting to run in each lane once the running one finishes
+    - outstanding : :class:`int` --> number of submitted jobs that have not been polled yet
+    - sort_mode : :class:`int` --> the SORT_ constant that listings are ordered by once complete. Modes that sort by stat data have it read during the scan
+    """
+    def __init__(self, cache: ListingCache = None, max_workers: int = DEFAULT_WORKERS) -> None:
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fe-scan')
+        self.completed: Queue = Queue()
+        self.running: Dict[str, ScanJob] = {}
+        self.queued: Dict[str, ScanJob] = {}
+        self.outstanding = 0
+        self.sort_mode = SORT_NAME
+        self.lock = threading.Lock()
+
+    def submit(self, directory: Directory, callback: Callable[[ScanJob], None] = None, lane: str = None, first_batch: int = None) -> ScanJob:
+        """
+        Scan a directory in the background. Returns the job, which can be used to cancel the scan.
+
+        If a lane is given, any job in the same lane is cancelled. At most one job per lane runs at a
+        time, and only the latest job submitted while it runs is started afterwards.
+
+        Parameters:
+
+        - directory : :class:`Directory` --> the directory to scan
+        - callback : :class:`Callable[[ScanJob], None]` --> called from poll() each time a listing is saved to the directory
+        - lane : :class:`str` --> the lane to run the job in
+        - first_batch : :class:`int` --> number of entries to read before handing back a first, partial listing
+        """
+        job = ScanJob(directory, callback, lane, first_batch)
+        start_now = True
+        with self.lock:
+            self.outstanding += 1
+            if lane is not None:
+                running = self.running.get(lane)
+                if running is None:
+                    self.running[lane] = job
+                else:
+                    running.cancel()
+                    replaced = self.queued.get(lane)
+                    if replaced is not None:
+                        replaced.cancel()
+                        self.outstanding -= 1   # Never runs, so it is never polled
+                    self.queued[lane] = job
+                    start_now = False
+        if start_now:
+            self.executor.submit(self._run, job)
+        return job
+
+    def poll(self) -> int:
+        """
+        Save the results of all finished jobs to their directories and run their callbacks.
+        Must be called from the UI thread. Returns the number of jobs whose results were used.
+        """
+        applied = 0
+        while True:
+            try:
+                job, children, final = self.completed.get_nowait()
+            except Empty:
+                return applied
+            if final:
+                with self.lock:
+                    self.outstanding -= 1
+            if job.cancelled:
+                continue
+            if final:
+                job.done = True
+            if children is None:
+                continue
+            if children is job.directory.children:  # Listing is unchanged, but once complete it may need sorting
+                if not final or children.mode == self.sort_mode:
+                    continue
+                self._sort(job.directory)
+            elif final:
+                self.save_listing(job.directory, children)
+            else:
+                job.directory.set_children(children)
+            applied += 1
+            if job.callback is not None:
+                job.callback(job)
+
+    def wait_for_first(self, job: ScanJob, timeout: float) -> bool:
+        """
+        Block until a job has handed back its first listing, then poll for results.
+        Returns true if the first listing arrived within the timeout.
+
+        Parameters:
+
+        - job : :class:`ScanJob` --> the job to wait for
+        - timeout : :class:`float` --> the longest time in seconds to wait
+        """
+        ready = job.first_ready.wait(timeout)
+        self.poll()
+        return ready
+
+    def detach(self, job: ScanJob):
+        """
+        Take a job out of its lane, so that later jobs submitted to the lane do not cancel it
+        """
+        start_now = False
+        with self.lock:
+            if job.lane is None:
+                return
+            if self.running.get(job.lane) is job:
+                del self.running[job.lane]
+            elif self.queued.get(job.lane) is job:  # Start it now instead of waiting for the lane
+                del self.queued[job.lane]
+                start_now = True
+            job.lane = None
+        if start_now:
+            self.executor.submit(self._run, job)
+
+    def read_listing(self, directory: Directory, existing_child: FileEntry = None) -> ChildTable:
+        """
+        Returns the sorted children of a directory. If the directory has not changed since it was last
+        scanned, the cached listing is returned at the cost of a single stat() call. Archives are listed
+        from their own index instead of the listing cache. Safe to call from a worker thread.
+
+        Parameters:
+
+        - directory : :class:`Directory` --> the directory to read
+        - existing_child : :class:`FileEntry` --> an existing FileEntry object that represents a
+        file entry inside this directory, used in place of the one in the listing
+        """
+        if isinstance(directory, ArchiveDirectory):
+            return directory.scan_contents(existing_child)
+        path = directory.get_path()
+        try:
+            st = os.stat(path)
+        except OSError:
+            return ChildTable(directory)
+        children = None if self.cache is None else self.cache.get(path, st)
+        if children is None:
+            children = directory.scan_contents(existing_child, self.sort_mode in STAT_SORT_MODES)
+            if self.cache is not None:
+                self.cache.put(path, st, children)
+        elif existing_child is not None:
+            children.substitute(existing_child)
+        return children
+
+    def read_cached(self, directory: Directory) -> ChildTable:
+        """
+        Returns the cached listing of a directory if it is still valid, or None. A stat() call is only made
+        if the cache holds a listing for the directory, so this is cheap enough for the UI thread.
+
+        Parameters:
+
+        - directory : :class:`Directory` --> the directory to look up
+        """
+        if self.cache is None:
+            return None
+        path = directory.get_path()
+        if not self.cache.contains(path):
+            return None
+        try:
+            return self.cache.get(path, os.stat(path))
+        except OSError:
+            return None
+
+    @timed('scan_now')
+    def scan_now(self, directory: Directory, existing_child: FileEntry = None):
+        """
+        Read the children of a directory on the calling thread and save them to the directory
+
+        Parameters:
+
+        - directory : :class:`Directory` --> the directory to scan
+        - existing_child : :class:`FileEntry` --> an existing FileEntry object that represents a
+        file entry inside this directory
+        """
+        self.save_listing(directory, self.read_listing(directory, existing_child))
+
+    def save_listing(self, directory: Directory, children: ChildTable):
+        """
+        Save a complete listing to a directory, in the order of sort_mode. Like a rescan, a selection at the top
+        stays there. Must be called from the UI thread, since a listing from the cache may be shared with other directories.
+
+        Parameters:
+
+        - directory : :class:`Directory` --> the directory the listing belongs to
+        - children : :class:`ChildTable` --> the listing
+        """
+        directory.set_children(children)
+        self._sort(directory)
+
+    def has_pending(self) -> bool:
+        """
+        Returns true if any submitted job has not been polled yet
+        """
+        return self.outstanding > 0
+
+    def shutdown(self):
+        """
+        Stop accepting jobs and drop any that have not started
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job: ScanJob):
+        try:
+            if not job.cancelled:
+                self._stream_listing(job)
+        finally:
+            self.completed.put((job, job.children, True))
+            job.first_ready.set()
+            with self.lock:
+                lane = job.lane
+            if lane is not None:
+                self._start_next_in_lane(lane, job)
+
+    def _stream_listing(self, job: ScanJob):
+        # Read a directory on a worker thread, handing back partial listings as they grow
+        directory = job.directory
+        if isinstance(directory, ArchiveDirectory):  # Read whole from the archive's index, which is cached on its own
+            job.children = directory.scan_contents()
+            return
+        path = directory.get_path()
+        try:
+            st = os.stat(path)
+        except OSError:
+            job.children = ChildTable(directory)
+            return
+        cached = None if self.cache is None else self.cache.get(path, st)
+        if cached is not None:
+            job.children = cached
+            return
+        for table in directory.stream_contents(job.first_batch, with_stats=self.sort_mode in STAT_SORT_MODES):
+            if job.cancelled:
+                return
+            job.children = table
+            self.completed.put((job, table, False))
+            job.first_ready.set()
+        if self.cache is not None:
+            self.cache.put(path, st, job.children)
+
+    def _sort(self, directory: Directory):
+        at_top = directory.get_curr_selected_child_index() == 0
+        directory.sort_children(self.sort_mode)
+        if at_top:
+            directory.select_child(0)
+
+    def _start_next_in_lane(self, lane: str, finished: ScanJob):
+        with self.lock:
+            if self.running.get(lane) is not finished:  # Job was detached from the lane
+                return
+            next_job = self.queued.pop(lane, None)
+            if next_job is None:
+                del self.running[lane]
+            else:
+                self.running[lane] = next_job
+        if next_job is not None:
+            self.executor.submit(self._run, next_job)
@@ -0,0 +1,185 @@
+from __future__ import annotations
+from typing import Dict, Iterable, Tuple
+from src.explorer.FileEntry import Directory, KIND_DIR, KIND_FILE
+import ctypes, os, stat, struct, sys
+
+# Flags from <sys/inotify.h>
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_EXCL_UNLINK
+EVENT_HEADER = struct.Struct('iIII')   # wd, mask, cookie, len
+READ_SIZE = 64 * 1024
+
+class DirectoryChanges:
+    """
+    The net changes to the entries of one directory since they were last read.
+
+    Attributes:
+
+    - directory : :class:`Directory` --> the directory that changed
+    - entries : :class:`Dict[str, Tuple[int, int]]` --> for each changed name, the (inode, kind) of the entry that now exists, or None if it was removed
+    - rescan : :class:`bool` --> True if events were lost and the directory must be scanned again
+    """
+    def __init__(self, directory: Directory) -> None:
+        self.directory = directory
+        self.entries: Dict[str, Tuple[int, int]] = {}
+        self.rescan = False
+
+    def add(self, name: str, is_dir: bool):
+        path = os.path.join(self.directory.get_path(), name)
+        try:
+            st = os.lstat(path)
+        except OSError:     # Already gone again
+            self.entries[name] = None
+            return
+        if stat.S_ISLNK(st.st_mode):    # Symlinks to directories are listed as directories, like in a scan
+            is_dir = os.path.isdir(path)
+        self.entries[name] = (st.st_ino, KIND_DIR if is_dir else KIND_FILE)
+
+    def remove(self, name: str):
+        self.entries[name] = None
+
+    def merge(self, later: DirectoryChanges):
+        """
+        Add changes to the same directory that were read afterwards
+        """
+        self.entries.update(later.entries)
+        self.rescan = self.rescan or later.rescan
+
+
+class DirectoryWatcher:
+    """
+    Watches directories for entries being created, deleted or renamed using Linux inotify, called
+    through ctypes. Use DirectoryWatcher.create(), which returns None where inotify is not available.
+
+    Attributes:
+
+    - fd : :class:`int` --> the inotify file descriptor, opened in non-blocking mode
+    - watches : :class:`Dict[int, Directory]` --> the watched directory for each watch descriptor
+    - descriptors : :class:`Dict[Directory, int]` --> the watch descriptor for each watched directory
+    - overflowed : :class:`bool` --> True if the kernel dropped events since changes were last read
+    """
+    def __init__(self, libc: ctypes.CDLL, fd: int) -> None:
+        self.libc = libc
+        self.fd = fd
+        self.watches: Dict[int, Directory] = {}
+        self.descriptors: Dict[Directory, int] = {}
+        self.overflowed = False
+
+    @staticmethod
+    def create() -> DirectoryWatcher:
+        """
+        Returns a new DirectoryWatcher, or None if inotify is not available on this system
+        """
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)   # Symbols already loaded into the process, which include libc. find_library would run ldconfig
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        except (OSError, AttributeError):
+            return None
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        return DirectoryWatcher(libc, fd)
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def set_watched(self, directories: Iterable[Directory]):
+        """
+        Watch exactly the given directories, adding and removing watches as needed.
+        Directories that cannot be watched are skipped.
+
+        Parameters:
+
+        - directories : :class:`Iterable[Directory]` --> the directories to watch
+        """
+        wanted = set(directories)
+        for directory in list(self.descriptors):
+            if directory not in wanted:
+                self._remove_watch(directory)
+        for directory in wanted:
+            if directory not in self.descriptors:
+                self._add_watch(directory)
+
+    def read_changes(self) -> Dict[Directory, DirectoryChanges]:
+        """
+        Read all pending events without blocking, and return the net changes to each watched directory.
+        If the kernel's event queue overflowed, every watched directory is marked for a rescan.
+        """
+        changes: Dict[Directory, DirectoryChanges] = {}
+        while True:
+            try:
+                buf = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            except OSError:
+                break
+            if len(buf) == 0:
+                break
+            self._parse_events(buf, changes)
+        if self.overflowed:
+            self.overflowed = False
+            for directory in self.descriptors:
+                changes.setdefault(directory, DirectoryChanges(directory)).rescan = True
+        return changes
+
+    def close(self):
+        os.close(self.fd)
+        self.watches.clear()
+        self.descriptors.clear()
+
+    def _parse_events(self, buf: bytes, changes: Dict[Directory, DirectoryChanges]):
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buf):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(buf, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(buf[offset:offset + name_len].rstrip(b'\0'))
+            offset += name_len
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:   # Watch was removed, such as when the directory was deleted
+                self.watches.pop(wd, None)
+                self.descriptors.pop(directory, None)
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF) or len(name) == 0:
+                continue
+            dir_changes = changes.get(directory)
+            if dir_changes is None:
+                dir_changes = changes[directory] = DirectoryChanges(directory)
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                dir_changes.add(name, (mask & IN_ISDIR) != 0)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                dir_changes.remove(name)
+
+    def _add_watch(self, directory: Directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory.get_path()), WATCH_MASK)
+        if wd < 0:  # Out of watches, no permission, or the directory is gone
+            return
+        self.watches[wd] = directory
+        self.descriptors[directory] = wd
+
+    def _remove_watch(self, directory: Directory):
+        wd = self.descriptors.pop(directory)
+        if self.watches.get(wd) is directory:
+            del self.watches[wd]
+            self.libc.inotify_rm_watch(self.fd, wd)
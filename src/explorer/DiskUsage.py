@@ -0,0 +1,303 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Callable, Dict, List, Set, Tuple
+from src.explorer.FileEntry import Directory, ArchiveDirectory
+from src.explorer.ListingCache import RACY_WINDOW_NS
+import os, threading, time
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_CACHED = 200000 # Number of directory listings to remember
+BLOCK_SIZE = 512            # Unit of st_blocks
+
+class SizeJob:
+    """
+    Measures the disk usage of each child of a directory, counting everything under subdirectories.
+    Totals grow as the subtrees are walked, and are copied into the directory's ChildTable on the UI thread.
+
+    Attributes:
+
+    - directory : :class:`Directory` --> the directory whose children are measured
+    - callback : :class:`Callable[[SizeJob], None]` --> called on the UI thread each time more sizes are available
+    - sizes : :class:`Dict[str, int]` --> the size in bytes of each child measured so far. Totals of subdirectories are partial until done is True
+    - changed : :class:`Set[str]` --> names whose size changed since they were last copied into the ChildTable
+    - seen_links : :class:`Set[Tuple[int, int]]` --> (device, inode) of files with several hard links that were already counted
+    - cancelled : :class:`bool` --> True if the results are no longer wanted
+    - done : :class:`bool` --> True once every subtree has been measured
+    """
+    def __init__(self, directory: Directory, callback: Callable[[SizeJob], None] = None) -> None:
+        self.directory = directory
+        self.callback = callback
+        self.sizes: Dict[str, int] = {}
+        self.changed: Set[str] = set()
+        self.seen_links: Set[Tuple[int, int]] = set()
+        self.cancelled = False
+        self.done = False
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def is_pending(self) -> bool:
+        return not self.cancelled and not self.done
+
+    def _add(self, name: str, size: int):
+        # Must be called with the lock held
+        self.sizes[name] = self.sizes.get(name, 0) + size
+        self.changed.add(name)
+
+
+class SizeNode:
+    """
+    A directory being walked by a SizeJob. Nodes are dropped as soon as their subtree is complete, so
+    only the directories still being walked are held in memory.
+
+    Attributes:
+
+    - job : :class:`SizeJob` --> the job the directory is measured for
+    - path : :class:`str` --> the path of the directory
+    - parent : :class:`SizeNode` --> the node of the parent directory, or None for the directory the job measures
+    - top : :class:`str` --> the name of the child of the job's directory that this node is under, or None for the job's directory
+    - st : :class:`os.stat_result` --> the stat data of the directory before it was read, used to validate its cached listing
+    - total : :class:`int` --> bytes counted so far under the directory
+    - pending : :class:`int` --> number of subdirectories still being walked, plus one until the directory itself has been read
+    """
+    __slots__ = ('job', 'path', 'parent', 'top', 'st', 'total', 'pending')
+
+    def __init__(self, job: SizeJob, path: str, parent: SizeNode, top: str, st: os.stat_result) -> None:
+        self.job = job
+        self.path = path
+        self.parent = parent
+        self.top = top
+        self.st = st
+        self.total = 0
+        self.pending = 1
+
+
+class DiskUsage:
+    """
+    Service that measures disk usage like du, on a pool of worker threads. Each directory is a unit of
+    work, and every worker takes the most recently found directory from a shared stack. Workers
+    therefore share the directories of every subtree between them, while the walk stays close to depth
+    first. That keeps the number of directories waiting to be read small even in very large trees.
+
+    What each directory holds is cached: the space taken by the directory and the files directly in it, and
+    the names of its subdirectories. The cache is validated by the directory's mtime, inode and device, so
+    measuring again, such as a parent afterwards, only stats the subdirectories of directories that have not
+    changed instead of reading them. Every directory is still visited, so files created or removed anywhere
+    in the tree are noticed. A file that grows in place does not change its directory, and is counted at
+    the size it had when its directory was last read, until the directory changes or leaves the cache.
+
+    Attributes:
+
+    - max_workers : :class:`int` --> the number of worker threads
+    - max_cached : :class:`int` --> the number of directory listings to remember
+    - cache : :class:`OrderedDict[str, Tuple[int, int, int, int, Tuple[str, ...]]]` --> the (mtime_ns, inode, device, own usage, subdirectory names)
+    of directories read, from least to most recently used. The own usage counts the directory and the files directly in it
+    - stack : :class:`List[SizeNode]` --> directories waiting to be read
+    - jobs : :class:`List[SizeJob]` --> jobs whose results have not all been copied to the UI yet
+    """
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, max_cached: int = DEFAULT_MAX_CACHED) -> None:
+        self.max_workers = max_workers
+        self.max_cached = max_cached
+        self.cache: OrderedDict[str, Tuple[int, int, int, int, Tuple[str, ...]]] = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.stack: List[SizeNode] = []
+        self.condition = threading.Condition()
+        self.workers: List[threading.Thread] = []
+        self.jobs: List[SizeJob] = []
+        self.stopping = False
+
+    def measure(self, directory: Directory, callback: Callable[[SizeJob], None] = None) -> SizeJob:
+        """
+        Start measuring the children of a directory in the background
+
+        Parameters:
+
+        - directory : :class:`Directory` --> the directory whose children are measured
+        - callback : :class:`Callable[[SizeJob], None]` --> called on the UI thread each time more sizes are available
+        """
+        job = SizeJob(directory, callback)
+        if isinstance(directory, ArchiveDirectory):     # Sizes of members come with the listing, from the archive's index
+            job.done = True
+            return job
+        path = directory.get_path()
+        try:
+            st = os.stat(path)
+        except OSError:
+            job.done = True
+            return job
+        self._start_workers()
+        self.jobs.append(job)
+        self._push([SizeNode(job, path, None, None, st)])
+        return job
+
+    def poll(self) -> int:
+        """
+        Copy the sizes measured since the last poll into the ChildTables of the measured directories, and
+        call each job's callback. Must be called on the UI thread.
+
+        Returns the number of jobs with new sizes
+        """
+        num_updated = 0
+        for job in list(self.jobs):
+            if job.cancelled:
+                self.jobs.remove(job)
+                continue
+            with job.lock:
+                changed = job.changed
+                job.changed = set()
+                sizes = [(name, job.sizes[name]) for name in changed]
+                done = job.done
+            if done:
+                self.jobs.remove(job)
+            children = job.directory.children
+            if len(sizes) == 0 or children is None:
+                continue
+            for name, size in sizes:
+                i = children.find(name)
+                if i >= 0:
+                    children.set_size(i, size)
+            num_updated += 1
+            if job.callback is not None:
+                job.callback(job)
+        return num_updated
+
+    def has_pending(self) -> bool:
+        return len(self.jobs) > 0
+
+    def shutdown(self):
+        with self.condition:
+            self.stopping = True
+            self.stack.clear()
+            self.condition.notify_all()
+
+    def _start_workers(self):
+        while len(self.workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def _push(self, nodes: List[SizeNode]):
+        if len(nodes) == 0:
+            return
+        with self.condition:
+            self.stack.extend(nodes)
+            self.condition.notify(len(nodes))
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while len(self.stack) == 0 and not self.stopping:
+                    self.condition.wait()
+                if self.stopping:
+                    return
+                node = self.stack.pop()
+            if not node.job.cancelled:
+                self._push(self._read_node(node))
+
+    def _read_node(self, node: SizeNode) -> List[SizeNode]:
+        # Count the files directly in a directory, and return nodes for its subdirectories. A directory that is
+        # unchanged since it was cached is not read, and only its subdirectories are statted
+        job = node.job
+        cached = None if node.parent is None else self._get_cached(node.path, node.st)   # The measured directory's files are shown one by one
+        if cached is None:
+            own, subdirs, files = self._scan(node)
+            self._put_cached(node.path, node.st, own, tuple(name for name, _ in subdirs))
+        else:
+            own, names = cached
+            files = []
+            subdirs = []
+            for name in names:
+                try:
+                    subdirs.append((name, os.stat(os.path.join(node.path, name), follow_symlinks=False)))
+                except OSError:     # Gone since, which changed the directory too, so it is read next time
+                    pass
+
+        new_nodes = []
+        with job.lock:
+            node.total += own
+            if node.top is not None:
+                job._add(node.top, own)
+            for name, size in files:
+                job._add(name, size)
+            for name, st in subdirs:
+                top = name if node.parent is None else node.top
+                node.pending += 1
+                new_nodes.append(SizeNode(job, os.path.join(node.path, name), node, top, st))
+                if node.parent is None:
+                    job._add(top, 0)
+            node.pending -= 1
+            if node.pending == 0:
+                self._complete(node)
+        return new_nodes
+
+    def _scan(self, node: SizeNode) -> Tuple[int, List[Tuple[str, os.stat_result]], List[Tuple[str, int]]]:
+        # Read a directory. Returns the space taken by it and the files directly in it, the (name, lstat) of its subdirectories,
+        # and for the measured directory the (name, size) of each of its files
+        job = node.job
+        own = _disk_usage(node.st)  # The directory itself takes up space too
+        subdirs: List[Tuple[str, os.stat_result]] = []
+        files: List[Tuple[str, int]] = []
+        try:
+            with os.scandir(node.path) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append((entry.name, st))
+                        continue
+                    size = _disk_usage(st)
+                    if st.st_nlink > 1:     # Count hard-linked files once
+                        with job.lock:
+                            if (st.st_dev, st.st_ino) in job.seen_links:
+                                size = 0
+                            job.seen_links.add((st.st_dev, st.st_ino))
+                    own += size
+                    if node.parent is None:
+                        files.append((entry.name, size))
+        except OSError:     # No permission, or gone
+            pass
+        return own, subdirs, files
+
+    def _complete(self, node: SizeNode):
+        # Add the total of a finished subtree to its parent, finishing the parent too if it was the last
+        # Must be called with the job's lock held
+        while node is not None:
+            parent = node.parent
+            if parent is None:
+                node.job.done = True
+                return
+            parent.total += node.total
+            parent.pending -= 1
+            if parent.pending > 0:
+                return
+            node = parent
+
+    def _get_cached(self, path: str, st: os.stat_result) -> Tuple[int, Tuple[str, ...]]:
+        # The (own usage, subdirectory names) cached for a directory, or None if it changed since
+        with self.cache_lock:
+            cached = self.cache.get(path)
+            if cached is None:
+                return None
+            mtime_ns, inode, device, own, subdirs = cached
+            if st.st_mtime_ns != mtime_ns or st.st_ino != inode or st.st_dev != device:
+                del self.cache[path]
+                return None
+            self.cache.move_to_end(path)
+            return own, subdirs
+
+    def _put_cached(self, path: str, st: os.stat_result, own: int, subdirs: Tuple[str, ...]):
+        if time.time_ns() - st.st_mtime_ns < RACY_WINDOW_NS:  # A change in the same mtime tick would go unnoticed
+            return
+        with self.cache_lock:
+            self.cache[path] = (st.st_mtime_ns, st.st_ino, st.st_dev, own, subdirs)
+            self.cache.move_to_end(path)
+            while len(self.cache) > self.max_cached:
+                self.cache.popitem(last=False)
+
+def _disk_usage(st: os.stat_result) -> int:
+    # Space allocated on disk, like du. Falls back to the file size where st_blocks is not available
+    blocks = getattr(st, 'st_blocks', None)
+    return st.st_size if blocks is None else blocks * BLOCK_SIZE
@@ -0,0 +1,109 @@
+from __future__ import annotations
+from bisect import bisect_left
+from itertools import compress, repeat
+from operator import add, contains, ge
+from typing import List, Sequence, Tuple
+from src.explorer.FileEntry import Directory
+
+FILTER_SUBSTRING = 0
+FILTER_FUZZY = 1
+
+class EntryFilter:
+    """
+    Narrows the children of a directory down to those whose names match a query, ignoring case.
+    Names are matched against the lowercased keys computed when the directory was scanned. Each
+    query that extends the previous one only searches the previous matches, and the matches of
+    shorter queries are kept so deleting characters does not search again.
+
+    Attributes:
+
+    - directory : :class:`Directory` --> the directory whose children are filtered
+    - mode : :class:`int` --> FILTER_SUBSTRING to match names containing the query, or FILTER_FUZZY to match names containing its characters in order
+    - query : :class:`str` --> the lowercased query
+    - indices : :class:`Sequence[int]` --> the indices of the matching children, in ascending order
+    - keys : :class:`List[str]` --> the lowercased names of the matching children, so narrowing does not have to look them up again
+    - ends : :class:`Sequence[int]` --> in fuzzy mode, where the earliest match of the query ends in each of keys
+    - history : :class:`List[Tuple[str, Sequence[int], List[str], Sequence[int]]]` --> the queries that led to the current one, and their matches
+    """
+    def __init__(self, directory: Directory, mode: int = FILTER_SUBSTRING) -> None:
+        self.directory = directory
+        self.mode = mode
+        self.query = ''
+        self.indices: Sequence[int] = range(len(directory.children))
+        self.keys: List[str] = directory.children.keys
+        self.ends: Sequence[int] = None
+        self.history: List[Tuple[str, Sequence[int], List[str], Sequence[int]]] = []
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def set_query(self, query: str) -> Sequence[int]:
+        """
+        Filter the children with a new query, and return the indices of the matches
+
+        Parameters:
+
+        - query : :class:`str` --> the text to match against the names of the children
+        """
+        query = query.lower()
+        while not query.startswith(self.query):    # Characters were deleted, go back to an earlier result
+            self.query, self.indices, self.keys, self.ends = self.history.pop()
+        if query != self.query:
+            self.history.append((self.query, self.indices, self.keys, self.ends))
+            if self.mode == FILTER_FUZZY:
+                self._search_fuzzy(query[len(self.query):])
+            else:
+                self._keep(list(map(contains, self.keys, repeat(query))))
+            self.query = query
+        return self.indices
+
+    def set_mode(self, mode: int) -> Sequence[int]:
+        """
+        Switch between substring and fuzzy matching, and return the indices of the matches
+        """
+        if mode == self.mode:
+            return self.indices
+        self.mode = mode
+        return self.refresh()
+
+    def refresh(self) -> Sequence[int]:
+        """
+        Search again after the directory's children have changed, and return the indices of the matches
+        """
+        query = self.query
+        self.query = ''
+        self.indices = range(len(self.directory.children))
+        self.keys = self.directory.children.keys
+        self.ends = None
+        self.history = []
+        return self.set_query(query)
+
+    def position(self, index: int) -> int:
+        """
+        Returns the position of the child at index among the matches, or -1 if it does not match
+        """
+        i = bisect_left(self.indices, index)
+        return i if i < len(self.indices) and self.indices[i] == index else -1
+
+    def first_position(self, index: int) -> int:
+        """
+        Returns the position of the first match at or after the child at index
+        """
+        return bisect_left(self.indices, index)
+
+    def _search_fuzzy(self, chars: str):
+        # A name matches if the characters of the query appear in it in order. Finding each character
+        # after the end of the earliest match of the ones before it means only the new characters are
+        # searched for. The loops run in C through map and compress
+        for c in chars:
+            found = list(map(str.find, self.keys, repeat(c), self.ends if self.ends is not None else repeat(0)))
+            matches = list(map(ge, found, repeat(0)))
+            self._keep(matches)
+            self.ends = list(map(add, compress(found, matches), repeat(1)))
+
+    def _keep(self, matches: List[bool]):
+        # Narrow the matches down to the ones flagged in matches
+        if matches.count(False) == 0:
+            return
+        self.indices = list(compress(self.indices, matches))
+        self.keys = list(compress(self.keys, matches))
@@ -1,6 +1,14 @@
 from __future__ import annotations
-from typing import List
-import os
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Tuple
+from src.explorer.Timings import TIMINGS
+import os, re, sys, time
+
+STREAM_INTERVAL = 0.5   # Longest time in seconds between partial listings while streaming a directory
+TIME_CHECK_EVERY = 1024 # Number of entries to read between checks of the stream interval
+REBUILD_THRESHOLD = 256 # Number of changes above which a table is rebuilt in one pass instead of edited entry by entry
+_DIGITS = re.compile(r'(\d+)')
 
 class FileEntry:
     """
@@ -12,6 +20,8 @@ class FileEntry:
     - name : :class:`str` --> the name of the file
     - parent : :class:`Directory` --> the Directory object representing the file's parent directory
     """
+    __slots__ = ('dir', 'name', 'parent')
+
     def __init__(self, dir: str, name: str, parent: Directory = None) -> None:
         self.dir = dir
         self.name = name
@@ -36,29 +46,139 @@ class FileEntry:
     def contains_child_dirs(self):
         return False
 
+    def kind(self) -> int:
+        """
+        Returns KIND_DIR or KIND_FILE, the kind of the entry in its parent's ChildTable
+        """
+        return KIND_FILE
+
 class Directory(FileEntry):
     """
     A directory in the file system.
 
     - Attributes:
 
-    - children : :class:`List[FileEntry]` --> a list of files contained in this directory
+    - children : :class:`ChildTable` --> the files contained in this directory, or None if it has not been scanned
     - selected_child_index :class:`int` --> index of the currently selected child
     """
-    def __init__(self, dir: str = None, name: str = None, parent: Directory = None) -> None:
-        if dir is None or name is None or parent is None:
-            super().__init__(*os.path.split(os.getcwd()))
-        else:
-            super().__init__(dir, name, parent)
+    __slots__ = ('children', 'selected_child_index', 'contains_dirs')
+
+    def __init__(self, dir: str, name: str, parent: Directory = None) -> None:
+        super().__init__(dir, name, parent)
         self.children = None
         self.selected_child_index = 0
         self.contains_dirs = False
 
-    def _set_children(self, children: List[FileEntry]) -> None:
+    @staticmethod
+    def at(path: str) -> Directory:
+        """
+        Returns a new Directory without a parent for the directory at path. Relative paths are resolved
+        once, here, so the Directory does not depend on the working directory afterwards.
+
+        Parameters:
+
+        - path : :class:`str` --> the path of the directory
+        """
+        return Directory(*os.path.split(os.path.abspath(path)))
+
+    def set_children(self, children: ChildTable) -> None:
+        """
+        Save a table of file entries as the children of this directory.
+
+        Parameters:
+
+        - children : :class:`ChildTable` --> the sorted file entries in this directory, with directories first
+        """
+        if children.parent is not self:    # Listing was cached from another Directory object
+            children.adopt(self)
+        if self.children is not None and self.children is not children:
+            # Keep the same entry selected across a rescan, unless the selection is still at the top
+            new_index = children.inherit(self.children, self.selected_child_index)
+            self.selected_child_index = new_index if self.selected_child_index > 0 else 0
+        elif self.children is None:     # Selection may be remembered from before the children were released
+            self.selected_child_index = max(0, min(self.selected_child_index, len(children) - 1))
         self.children = children
+        self.contains_dirs = children.contains_dirs()
 
     def get_child(self, index: int) -> FileEntry:
         return self.children[index]
+
+    def kind(self) -> int:
+        return KIND_DIR
+
+    def make_child(self, name: str, kind: int) -> FileEntry:
+        """
+        Returns a new FileEntry object for a child of this directory. Archives get an ArchiveDirectory, so they can be browsed like directories
+
+        Parameters:
+
+        - name : :class:`str` --> the name of the child
+        - kind : :class:`int` --> KIND_DIR or KIND_FILE
+        """
+        dir = self.get_path()
+        if kind == KIND_DIR:
+            return Directory(dir, name, self)
+        if name.lower().endswith(ARCHIVE_SUFFIXES):
+            return ArchiveDirectory(dir, name, self)
+        return FileEntry(dir, name, self)
+
+    def release_children(self):
+        """
+        Drop the children to free their memory, keeping selected_child_index. Like a directory that was never
+        scanned, the children are read again, from the listing cache if unchanged, the next time they are needed.
+        """
+        children = self.children
+        self.children = None
+        if children is not None and children.parent is self:
+            # The table may live on in the listing cache, but the entries and their subtrees should not
+            children.entries = {}
+
+    def sort_children(self, mode: int):
+        """
+        Put the children in the order of a sort mode, keeping the same child selected
+
+        Parameters:
+
+        - mode : :class:`int` --> one of the SORT_ constants
+        """
+        children = self.children
+        if children is None:
+            return
+        selected_name = children.names[self.selected_child_index] if self.selected_child_index < len(children) else None
+        children.sort_by(mode)
+        if selected_name is not None:
+            self.selected_child_index = children.find(selected_name)
+
+    def apply_changes(self, changes: Dict[str, Tuple[int, int]]) -> int:
+        """
+        Insert and remove children in place, keeping the currently selected child selected. If the
+        selected child was removed, the child that took its place is selected.
+
+        Returns the lowest index whose child changed, or -1 if nothing changed.
+
+        Parameters:
+
+        - changes : :class:`Dict[str, Tuple[int, int]]` --> for each changed name, the (inode, kind) of the entry that now exists, or None if it was removed
+        """
+        if self.children is None:   # Not scanned yet, the scan will see the changes
+            return -1
+        children = self.children
+        selected_name = children.names[self.selected_child_index] if self.selected_child_index < len(children) else None
+        first_changed = children.apply_changes(changes)
+        if first_changed < 0:
+            return -1
+        new_index = -1 if selected_name is None else children.find(selected_name)
+        if new_index < 0:
+            new_index = min(self.selected_child_index, len(children) - 1)
+        self.selected_child_index = max(0, new_index)
+        self.contains_dirs = children.contains_dirs()
+        return first_changed
+
+    def get_child_index(self, name: str) -> int:
+        """
+        Returns the index of the child with the given name, or -1 if there is none
+        """
+        return self.children.find(name)
     
     def select_child(self, index: int):
         self.selected_child_index = index
@@ -73,43 +193,663 @@ class Directory(FileEntry):
 
     def contains_child_dirs(self) -> bool:
         if not self.contains_dirs and self.children is not None:
-            return len(self.children) > 0 and type(self.children[0]) == Directory
+            return self.children.contains_dirs()
         return self.contains_dirs
 
     def traverse_contents(self, existing_child: FileEntry = None) -> None:
         """
-        Create FileEntry or Directory objects for each file entry in the directory, and save them
-        as children of the directory. If existing_child is passed in and it matches a file entry
-        in this directory, it will be used directly in place of a new FileEntry object.
+        Read the file entries in the directory and save them as children of the directory.
+        If existing_child is passed in and it matches a file entry in this directory, it will be
+        used directly in place of a new FileEntry object.
+
+        Parameters:
+
+        - existing_child : :class:`FileEntry` --> an existing FileEntry object that represents a
+        file entry inside this directory
+        """
+        self.set_children(self.scan_contents(existing_child))
+
+    def scan_contents(self, existing_child: FileEntry = None, with_stats: bool = False) -> ChildTable:
+        """
+        Read the file entries in the directory using os.scandir and return them as a sorted
+        ChildTable, without saving them as children. This does not touch any shared state, so it
+        is safe to call from a worker thread.
+
+        Parameters:
+
+        - existing_child : :class:`FileEntry` --> an existing FileEntry object that represents a
+        file entry inside this directory
+        - with_stats : :class:`bool` --> if True, the size and modification time of each entry are read too
+        """
+        table = ChildTable(self)
+        for table in self.stream_contents(first_batch=None, with_stats=with_stats):
+            pass
+        if existing_child is not None:
+            table.substitute(existing_child)
+        return table
+
+    def stream_contents(self, first_batch: int = None, interval: float = STREAM_INTERVAL, with_stats: bool = False) -> Iterator[ChildTable]:
+        """
+        Read the file entries in the directory in batches, yielding a sorted ChildTable of all the
+        entries read so far after each batch. The last table yielded holds every entry. Safe to call
+        from a worker thread.
+
+        The first table is yielded once first_batch entries have been read, so a screenful can be
+        shown straight away. After that, a table is yielded each time the number of entries read
+        doubles, or once interval seconds have passed, so the total cost of sorting stays O(n log n).
+
+        Parameters:
+
+        - first_batch : :class:`int` --> number of entries to read before yielding the first table. If None, a single complete table is yielded
+        - interval : :class:`float` --> the longest time in seconds to go without yielding a table, once the first has been yielded
+        - with_stats : :class:`bool` --> if True, the size and modification time of each entry are read in the same pass, for the sort modes that need them
+        """
+        dirs = []
+        files = []
+        read_started = time.perf_counter()
+        for batch in iter_scandir_batches(self.get_path(), first_batch, interval, with_stats):
+            if TIMINGS.enabled:
+                TIMINGS.record('scan.read', time.perf_counter() - read_started)
+            with TIMINGS.time('scan.sort'):
+                if with_stats:
+                    new_dirs = [(_sort_key(name), name, inode, size, mtime) for name, inode, is_dir, size, mtime in batch if is_dir]
+                    new_files = [(_sort_key(name), name, inode, size, mtime) for name, inode, is_dir, size, mtime in batch if not is_dir]
+                else:
+                    new_dirs = [(_sort_key(name), name, inode) for name, inode, is_dir in batch if is_dir]
+                    new_files = [(_sort_key(name), name, inode) for name, inode, is_dir in batch if not is_dir]
+                dirs = _merge_rows(dirs, new_dirs)
+                files = _merge_rows(files, new_files)
+                table = ChildTable(self)
+                table.extend(dirs, KIND_DIR)
+                table.extend(files, KIND_FILE)
+                table.has_stats = with_stats
+            yield table
+            read_started = time.perf_counter()
+        table.build_name_index()    # The last table holds the whole directory
+
+class ArchiveDirectory(Directory):
+    """
+    A zip or tar archive, or a directory inside one, browsed like a directory without extracting anything.
+    Children are listed from an index of the archive's members, which is read once and shared by every
+    ArchiveDirectory of the archive until the archive changes. The archive itself stays a file in its
+    parent's ChildTable. Entries inside an archive have paths below the archive's path, but nothing on disk.
+
+    Attributes:
+
+    - archive_path : :class:`str` --> the path of the archive
+    - member : :class:`str` --> the path of the directory inside the archive, or '' for the archive itself
+    """
+    __slots__ = ('archive_path', 'member')
+
+    def __init__(self, dir: str, name: str, parent: Directory = None, archive_path: str = None, member: str = '') -> None:
+        super().__init__(dir, name, parent)
+        self.archive_path = os.path.join(dir, name) if archive_path is None else archive_path
+        self.member = member
+
+    def kind(self) -> int:
+        return KIND_FILE if self.member == '' else KIND_DIR
+
+    def make_child(self, name: str, kind: int) -> FileEntry:
+        dir = self.get_path()
+        if kind == KIND_DIR:
+            return ArchiveDirectory(dir, name, self, self.archive_path, name if self.member == '' else f'{self.member}/{name}')
+        return FileEntry(dir, name, self)   # Archives inside archives would have to be extracted to be read
+
+    def scan_contents(self, existing_child: FileEntry = None, with_stats: bool = False) -> ChildTable:
+        """
+        Read the entries of the directory from the archive's index, indexing the archive first unless its index is cached.
+        Sizes and modification times come with the index, so with_stats is ignored. Safe to call from a worker thread.
+        If the archive cannot be read, the table holds the members read before the error.
 
         Parameters:
 
         - existing_child : :class:`FileEntry` --> an existing FileEntry object that represents a
         file entry inside this directory
+        - with_stats : :class:`bool` --> unused, since stat data is always available
         """
-        full_path = self.get_path()
-        traverser = os.walk(full_path)
+        from src.explorer.ArchiveIndex import ARCHIVE_INDEXES
+        table = ChildTable(self)
         try:
-            root, dirs, files = traverser.__next__()
-        except:
-            self._set_children([])
+            listing = ARCHIVE_INDEXES.get(self.archive_path).listing(self.member)
+        except OSError:
+            listing = []
+        dirs = sorted((_sort_key(name), name, 0, size, mtime) for name, is_dir, size, mtime in listing if is_dir)
+        files = sorted((_sort_key(name), name, 0, size, mtime) for name, is_dir, size, mtime in listing if not is_dir)
+        table.extend(dirs, KIND_DIR)
+        table.extend(files, KIND_FILE)
+        for i, row in enumerate(dirs):  # Totals of the directories' members, which extend leaves unknown
+            table.sizes[i] = row[3]
+        table.has_stats = True
+        table.build_name_index()
+        if existing_child is not None:
+            table.substitute(existing_child)
+        return table
+
+    def stream_contents(self, first_batch: int = None, interval: float = STREAM_INTERVAL, with_stats: bool = False) -> Iterator[ChildTable]:
+        """
+        Yields the entries of the directory as a single complete table, since the index is read whole
+        """
+        yield self.scan_contents()
+
+KIND_FILE = 0
+KIND_DIR = 1
+UNKNOWN_SIZE = -1
+UNKNOWN_MTIME = -1
+ARCHIVE_SUFFIXES = ('.zip', '.jar', '.whl', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')    # Files browsed as ArchiveDirectory objects
+
+# Orders of a ChildTable. Directories come first in every mode, and entries that tie are ordered by name
+SORT_NAME = 0       # Name, ignoring case
+SORT_NATURAL = 1    # Name, comparing runs of digits as numbers, so file2 comes before file10
+SORT_EXTENSION = 2  # Extension, ignoring case
+SORT_MTIME = 3      # Newest first
+SORT_SIZE = 4       # Largest first. Directories are ordered by their measured disk usage, once known
+SORT_MODE_NAMES = ('name', 'natural', 'extension', 'newest', 'largest')
+STAT_SORT_MODES = (SORT_MTIME, SORT_SIZE)   # Modes whose keys come from stat data
+
+class ChildTable:
+    """
+    Compact list of the file entries in a directory, sorted with directories first and then by
+    lowercased name. Entries are stored as parallel arrays, and FileEntry or Directory objects are
+    only created for the entries that are accessed by index.
+
+    Attributes:
+
+    - parent : :class:`Directory` --> the directory containing the entries
+    - names : :class:`List[str]` --> the name of each entry
+    - keys : :class:`List[str]` --> the lowercased name of each entry, computed once at scan time and used for sorting and searching
+    - kinds : :class:`array` --> KIND_DIR or KIND_FILE for each entry
+    - inodes : :class:`array` --> the inode number of each entry
+    - sizes : :class:`array` --> the size in bytes of each entry, or UNKNOWN_SIZE if it has not been read. Files get their length from stat data, and
+    any entry its disk usage once measured
+    - mtimes : :class:`array` --> the modification time of each entry in nanoseconds, or UNKNOWN_MTIME if it has not been read
+    - has_stats : :class:`bool` --> True once the stat data of every entry has been read into sizes and mtimes
+    - mode : :class:`int` --> the SORT_ constant the rows are ordered by
+    - order : :class:`array` --> for each row, the index it would have in name order. None while the mode is SORT_NAME
+    - orders : :class:`Dict[int, array]` --> the name order indices of the rows in each mode sorted so far, so switching back needs no comparisons.
+    Forgotten once the entries change
+    - num_dirs : :class:`int` --> number of directories, which are the first entries in the table
+    - entries : :class:`Dict[str, FileEntry]` --> FileEntry objects created so far, keyed by name
+    - name_index : :class:`Dict[str, int]` --> map from each name to its index, built once the whole directory has been read, or the rows are
+    sorted by anything but name. None until then
+    - max_name_len : :class:`int` --> length of the longest name in the table
+    """
+    __slots__ = ('parent', 'names', 'keys', 'kinds', 'inodes', 'sizes', 'mtimes', 'has_stats', 'mode', 'order', 'orders', 'num_dirs', 'entries',
+                 'name_index', 'max_name_len')
+
+    def __init__(self, parent: Directory) -> None:
+        self.parent = parent
+        self.names: List[str] = []
+        self.keys: List[str] = []
+        self.kinds = array('B')
+        self.inodes = array('Q')
+        self.sizes = array('q')
+        self.mtimes = array('q')
+        self.has_stats = False
+        self.mode = SORT_NAME
+        self.order: array = None
+        self.orders: Dict[int, array] = {}
+        self.num_dirs = 0
+        self.entries: Dict[str, FileEntry] = {}
+        self.name_index: Dict[str, int] = None
+        self.max_name_len = 0
+
+    @staticmethod
+    def from_entries(parent: Directory, entries: List[Tuple[str, int, bool]]) -> ChildTable:
+        """
+        Build a complete table from entries in any order, sorted the way Directory.stream_contents sorts them
+
+        Parameters:
+
+        - parent : :class:`Directory` --> the directory containing the entries
+        - entries : :class:`List[Tuple[str, int, bool]]` --> the (name, inode, is_dir) of each entry
+        """
+        table = ChildTable(parent)
+        table.extend(_merge_rows([], [(_sort_key(name), name, inode) for name, inode, is_dir in entries if is_dir]), KIND_DIR)
+        table.extend(_merge_rows([], [(_sort_key(name), name, inode) for name, inode, is_dir in entries if not is_dir]), KIND_FILE)
+        table.build_name_index()
+        return table
+
+    @staticmethod
+    def from_sorted(parent: Directory, names: List[str], inodes: array, num_dirs: int) -> ChildTable:
+        """
+        Build a complete table from names that are already in table order, such as a listing read back from disk.
+        The name index is not built, so lookups use a binary search over the sorted names.
+
+        Parameters:
+
+        - parent : :class:`Directory` --> the directory containing the entries
+        - names : :class:`List[str]` --> the name of each entry, directories first
+        - inodes : :class:`array` --> the inode number of each entry
+        - num_dirs : :class:`int` --> number of directories at the start of names
+        """
+        table = ChildTable(parent)
+        table.names = names
+        table.keys = list(map(_sort_key, names))
+        table.inodes = inodes
+        table.kinds = array('B', bytes([KIND_DIR]) * num_dirs + bytes([KIND_FILE]) * (len(names) - num_dirs))
+        table.sizes = array('q', [UNKNOWN_SIZE]) * len(names)
+        table.mtimes = array('q', [UNKNOWN_MTIME]) * len(names)
+        table.num_dirs = num_dirs
+        table.max_name_len = max(map(len, names), default=0)
+        return table
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, index: int) -> FileEntry:
+        name = self.names[index]
+        entry = self.entries.get(name)
+        if entry is None:
+            entry = self.entries[name] = self.parent.make_child(name, self.kinds[index])
+        return entry
+
+    def __iter__(self) -> Iterator[FileEntry]:
+        for i in range(len(self.names)):
+            yield self[i]
+
+    def extend(self, rows: List[Tuple[str, str, int]], kind: int):
+        """
+        Append entries of a single kind to the end of the table. Directories must be added before files.
+
+        Parameters:
+
+        - rows : :class:`List[Tuple]` --> the (sort key, name, inode) of each entry, already sorted. Rows may also hold the entry's
+        (size, mtime) from its stat data, as in (sort key, name, inode, size, mtime)
+        - kind : :class:`int` --> KIND_DIR or KIND_FILE
+        """
+        if len(rows) == 0:
+            return
+        self.keys.extend([row[0] for row in rows])
+        self.names.extend([row[1] for row in rows])
+        self.inodes.extend([row[2] for row in rows])
+        self.kinds.extend(bytes([kind]) * len(rows))
+        if len(rows[0]) > 3:
+            # The length of a directory says nothing about its contents, so it is left for disk usage to fill in
+            self.sizes.extend([UNKNOWN_SIZE if kind == KIND_DIR else row[3] for row in rows])
+            self.mtimes.extend([row[4] for row in rows])
+        else:
+            self.sizes.extend(array('q', [UNKNOWN_SIZE]) * len(rows))
+            self.mtimes.extend(array('q', [UNKNOWN_MTIME]) * len(rows))
+        if kind == KIND_DIR:
+            self.num_dirs += len(rows)
+        self.max_name_len = max(self.max_name_len, max(map(len, self.names[-len(rows):])))
+
+    def name(self, index: int) -> str:
+        return self.names[index]
+
+    def is_dir(self, index: int) -> bool:
+        return self.kinds[index] == KIND_DIR
+
+    def set_size(self, index: int, size: int):
+        """
+        Record the measured size of an entry. Any remembered largest first order is forgotten, since it may no longer hold
+        """
+        self.sizes[index] = size
+        self.orders.pop(SORT_SIZE, None)
+
+    def read_stats(self):
+        """
+        Read the size and modification time of every entry, unless they were read at scan time. Each entry
+        is stat'ed once, and the data is kept with the table for any later sort.
+        """
+        if self.has_stats:
+            return
+        path = self.parent.get_path()
+        for i, name in enumerate(self.names):
+            self._read_stat(path, i)
+        self.has_stats = True
+        self.orders.pop(SORT_MTIME, None)
+        self.orders.pop(SORT_SIZE, None)
+
+    def sort_by(self, mode: int):
+        """
+        Reorder the rows for a sort mode, keeping directories first. The keys come from data already in the
+        table, so nothing is read from disk except for the stat data of a table that was scanned without it.
+        Each mode's order is remembered, so switching back to it is a single pass without comparisons.
+        Sorting again by the current mode only does any work if the order was forgotten, such as after
+        sizes were measured. Afterwards, names are looked up through the name index.
+
+        Parameters:
+
+        - mode : :class:`int` --> one of the SORT_ constants
+        """
+        if mode == self.mode and (mode == SORT_NAME or mode in self.orders):
             return
-        dirs.sort(key=str.lower)
-        files.sort(key=str.lower)
+        if mode in STAT_SORT_MODES:
+            self.read_stats()
+        positions = self._positions()
+        target = range(len(self.names)) if mode == SORT_NAME else self.orders.get(mode)
+        if target is None:
+            row_key = self._row_key(mode)
+            sort_key = lambda j: row_key(positions[j])
+            # Stable sorts of indices in name order, so entries that tie stay in name order
+            target = array('I', sorted(range(self.num_dirs), key=sort_key) + sorted(range(self.num_dirs, len(self.names)), key=sort_key))
+            self.orders[mode] = target
+        rows = [positions[j] for j in target]
+        self.keys = [self.keys[r] for r in rows]
+        self.names = [self.names[r] for r in rows]
+        self.kinds = array('B', [self.kinds[r] for r in rows])
+        self.inodes = array('Q', [self.inodes[r] for r in rows])
+        self.sizes = array('q', [self.sizes[r] for r in rows])
+        self.mtimes = array('q', [self.mtimes[r] for r in rows])
+        self.order = None if mode == SORT_NAME else target
+        self.mode = mode
+        self.build_name_index()
+
+    def in_name_order(self) -> Tuple[List[str], array]:
+        """
+        Returns the names and inodes of the entries in name order, whatever mode the rows are sorted by
+        """
+        if self.order is None:
+            return self.names, self.inodes
+        positions = self._positions()
+        return [self.names[r] for r in positions], array('Q', [self.inodes[r] for r in positions])
+
+    def nbytes(self) -> int:
+        """
+        Returns an estimate of the memory held by the table in bytes: its arrays, lists and strings, the name
+        index, remembered orders and FileEntry objects created so far, but not the children of those entries
+        """
+        size = sum(map(sys.getsizeof, (self.names, self.keys, self.kinds, self.inodes, self.sizes, self.mtimes, self.entries)))
+        size += sum(map(sys.getsizeof, self.names))
+        size += sum(sys.getsizeof(key) for key, name in zip(self.keys, self.names) if key is not name)
+        size += sum(map(sys.getsizeof, self.entries.values()))
+        size += sum(map(sys.getsizeof, self.orders.values()))
+        if self.name_index is not None:
+            size += sys.getsizeof(self.name_index)
+        return size
+
+    def build_name_index(self):
+        """
+        Build the map from names to indices, so entries can be found by name in O(1).
+        The table must not be extended afterwards.
+        """
+        self.name_index = dict(zip(self.names, range(len(self.names))))
+
+    def find(self, name: str, kind: int = None) -> int:
+        """
+        Returns the index of the entry with the given name, or -1 if there is none. Uses the name
+        index if it has been built, and a binary search over the sorted names otherwise.
+
+        Parameters:
+
+        - name : :class:`str` --> the name of the entry
+        - kind : :class:`int` --> KIND_DIR or KIND_FILE, if known. Otherwise both are searched
+        """
+        if self.name_index is not None:
+            i = self.name_index.get(name, -1)
+            return i if i < 0 or kind is None or self.kinds[i] == kind else -1
+        key = _sort_key(name)
+        for seg_kind, lo, hi in ((KIND_DIR, 0, self.num_dirs), (KIND_FILE, self.num_dirs, len(self.names))):
+            if kind is not None and kind != seg_kind:
+                continue
+            i = bisect_left(self.keys, key, lo, hi)
+            while i < hi and self.keys[i] == key:
+                if self.names[i] == name:
+                    return i
+                i += 1
+        return -1
+
+    def find_prefix(self, prefix: str) -> int:
+        """
+        Returns the index of the first entry whose name starts with prefix, ignoring case, or -1 if
+        there is none. Uses a binary search over the sorted names, so directories are searched before files.
+        While the rows are sorted by anything but name, every entry is searched in order instead.
+
+        Parameters:
+
+        - prefix : :class:`str` --> the start of the name to search for
+        """
+        key = prefix.lower()
+        if self.mode != SORT_NAME:  # Keys are not in order, so search them all
+            return next((i for i, entry_key in enumerate(self.keys) if entry_key.startswith(key)), -1)
+        for lo, hi in ((0, self.num_dirs), (self.num_dirs, len(self.names))):
+            i = bisect_left(self.keys, key, lo, hi)
+            if i < hi and self.keys[i].startswith(key):
+                return i
+        return -1
+
+    def index(self, entry: FileEntry) -> int:
+        """
+        Returns the index of the given file entry. Raises ValueError if it is not in the table
+        """
+        i = self.find(entry.name, entry.kind())
+        if i < 0:
+            raise ValueError(f'{entry.name} is not in the table')
+        return i
+
+    def substitute(self, entry: FileEntry):
+        """
+        Use an existing FileEntry object for the entry with the same name, if there is one
+
+        Parameters:
+
+        - entry : :class:`FileEntry` --> an existing FileEntry object that represents a file entry in this directory
+        """
+        if entry.name in self.entries or self.find(entry.name) >= 0:
+            entry.set_parent(self.parent)
+            self.entries[entry.name] = entry
+
+    def inherit(self, previous: ChildTable, selected_index: int) -> int:
+        """
+        Reuse the FileEntry objects of a previous listing of the same directory for entries that
+        are still present, so that state saved on them (such as a Directory's children) survives
+        a rescan. Returns the new index of the entry found at selected_index in the previous table,
+        or the closest valid index if it is gone.
+
+        Parameters:
+
+        - previous : :class:`ChildTable` --> an older table of entries for the same directory
+        - selected_index : :class:`int` --> index of the selected entry in the previous table
+        """
+        for name, entry in previous.entries.items():
+            if name not in self.entries and self.find(name, entry.kind()) >= 0:
+                self.entries[name] = entry
+        if 0 <= selected_index < len(previous):
+            new_index = self.find(previous.names[selected_index], previous.kinds[selected_index])
+            if new_index >= 0:
+                return new_index
+        return max(0, min(selected_index, len(self.names) - 1))
+
+    def adopt(self, parent: Directory):
+        """
+        Move the table to another Directory object representing the same directory, such as when a
+        cached listing is reused.
+        """
+        self.parent = parent
+        for entry in self.entries.values():
+            entry.set_parent(parent)
+
+    def contains_dirs(self) -> bool:
+        return self.num_dirs > 0
+
+    def apply_changes(self, changes: Dict[str, Tuple[int, int]]) -> int:
+        """
+        Insert and remove entries in place, keeping the table sorted. Small batches are applied one
+        entry at a time, and large ones by merging them into the table in a single pass. The name
+        index is dropped, so lookups fall back to a binary search. A table sorted by anything but name
+        is put back in name order for the changes, then sorted again, and every row counts as changed.
+
+        Returns the lowest index whose entry changed, or -1 if nothing changed.
 
-        if len(dirs) > 0:
-            self.contains_dirs = True
+        Parameters:
 
-        if existing_child is None:
-            results = list(map(lambda dir: Directory(full_path, dir, self), dirs))
+        - changes : :class:`Dict[str, Tuple[int, int]]` --> for each changed name, the (inode, kind) of the entry that now exists, or None if it was removed
+        """
+        removed = []
+        added = []
+        for name, new_entry in changes.items():
+            i = self.find(name)
+            if i >= 0 and (new_entry is None or new_entry[1] != self.kinds[i]):
+                removed.append(i)
+            if new_entry is not None and (i < 0 or new_entry[1] != self.kinds[i]):
+                added.append((_sort_key(name), name, new_entry[0], new_entry[1]))
+        if len(removed) == 0 and len(added) == 0:
+            return -1
+        mode = self.mode
+        if mode != SORT_NAME:
+            removed = [self.order[i] for i in removed]  # Rows are about to move back to name order
+            self.sort_by(SORT_NAME)
+        self.orders = {}
+        self.name_index = None
+        for i in removed:
+            self.entries.pop(self.names[i], None)
+        if len(removed) + len(added) > REBUILD_THRESHOLD:
+            first_changed = self._rebuild(removed, added)
         else:
-            results = list(map(lambda dir: create_dir_child(full_path, dir, self, existing_child), dirs))
-        results.extend(list(map(lambda file: FileEntry(full_path, file, self), files)))
-        self._set_children(results)
-
-def create_dir_child(dir, name, parent: Directory, existing_child: FileEntry) -> Directory:
-    if os.path.join(dir, name) == existing_child.get_path():
-        existing_child.set_parent(parent)
-        return existing_child
-    else:
-        return Directory(dir, name, parent)
\ No newline at end of file
+            first_changed = len(self.names)
+            for i in sorted(removed, reverse=True):
+                self._remove_at(i)
+                first_changed = min(first_changed, i)
+            for key, name, inode, kind in added:
+                first_changed = min(first_changed, self._insert(key, name, inode, kind))
+        if self.has_stats:
+            path = self.parent.get_path()
+            for _, name, _, kind in added:
+                self._read_stat(path, self.find(name, kind))
+        if mode != SORT_NAME:
+            self.sort_by(mode)
+            first_changed = 0
+        return first_changed
+
+    def _insert(self, key: str, name: str, inode: int, kind: int) -> int:
+        # Insert a single entry at its sorted position, returning its index
+        lo, hi = (0, self.num_dirs) if kind == KIND_DIR else (self.num_dirs, len(self.names))
+        i = bisect_left(self.keys, key, lo, hi)
+        while i < hi and self.keys[i] == key and self.names[i] < name:
+            i += 1
+        self.keys.insert(i, key)
+        self.names.insert(i, name)
+        self.kinds.insert(i, kind)
+        self.inodes.insert(i, inode)
+        self.sizes.insert(i, UNKNOWN_SIZE)
+        self.mtimes.insert(i, UNKNOWN_MTIME)
+        if kind == KIND_DIR:
+            self.num_dirs += 1
+        self.max_name_len = max(self.max_name_len, len(name))
+        return i
+
+    def _remove_at(self, i: int):
+        del self.keys[i]
+        del self.names[i]
+        del self.kinds[i]
+        del self.inodes[i]
+        del self.sizes[i]
+        del self.mtimes[i]
+        if i < self.num_dirs:
+            self.num_dirs -= 1
+
+    def _rebuild(self, removed: List[int], added: List[Tuple[str, str, int, int]]) -> int:
+        # Apply a large batch of changes by filtering out removed rows and merging in the new ones
+        first_changed = min(removed, default=len(self.names))
+        removed = set(removed)
+        rows = [row for i, row in enumerate(zip(self.keys, self.names, self.inodes, self.sizes, self.kinds, self.mtimes)) if i not in removed]
+        for key, name, inode, kind in added:
+            rows.append((key, name, inode, UNKNOWN_SIZE, kind, UNKNOWN_MTIME))
+        rows.sort(key=lambda row: (row[4] != KIND_DIR, row[0], row[1]))
+        self.keys = [row[0] for row in rows]
+        self.names = [row[1] for row in rows]
+        self.inodes = array('Q', [row[2] for row in rows])
+        self.sizes = array('q', [row[3] for row in rows])
+        self.kinds = array('B', [row[4] for row in rows])
+        self.mtimes = array('q', [row[5] for row in rows])
+        self.num_dirs = self.kinds.count(KIND_DIR)
+        self.max_name_len = max(map(len, self.names), default=0)
+        for key, name, _, kind in added:
+            first_changed = min(first_changed, self.find(name, kind))
+        return first_changed
+
+    def _positions(self) -> List[int]:
+        # The row of each entry, indexed by its position in name order
+        if self.order is None:
+            return range(len(self.names))
+        positions = [0] * len(self.order)
+        for row, j in enumerate(self.order):
+            positions[j] = row
+        return positions
+
+    def _row_key(self, mode: int) -> Callable[[int], object]:
+        # Function from a row to its key in a sort mode other than SORT_NAME
+        if mode == SORT_NATURAL:
+            return lambda r: _natural_key(self.keys[r])
+        if mode == SORT_EXTENSION:
+            return lambda r: os.path.splitext(self.keys[r])[1]
+        if mode == SORT_MTIME:
+            return lambda r: -self.mtimes[r]
+        if mode == SORT_SIZE:
+            return lambda r: -self.sizes[r]     # Unknown sizes sort last
+        return lambda r: 0  # Name order itself
+
+    def _read_stat(self, path: str, i: int):
+        # Read the stat data of the entry at row i into sizes and mtimes, without following symlinks
+        try:
+            st = os.lstat(os.path.join(path, self.names[i]))
+        except OSError:
+            return
+        self.mtimes[i] = st.st_mtime_ns
+        if self.kinds[i] == KIND_FILE and self.sizes[i] == UNKNOWN_SIZE:
+            self.sizes[i] = st.st_size
+
+def iter_scandir_batches(path: str, first_batch: int = None, interval: float = STREAM_INTERVAL, with_stats: bool = False) -> Iterator[List[Tuple]]:
+    """
+    Read a directory with os.scandir, yielding the (name, inode, is_dir) of its entries in batches.
+    Entries are classified using d_type, so stat() is only called for symlinks, unless with_stats
+    is set. If the directory cannot be read, a single empty batch is yielded.
+
+    Parameters:
+
+    - path : :class:`str` --> the path of the directory
+    - first_batch : :class:`int` --> size of the first batch. Each later batch is as large as all the previous ones combined. If None, a single batch is yielded
+    - interval : :class:`float` --> the longest time in seconds to go without yielding a batch after the first one
+    - with_stats : :class:`bool` --> if True, each entry is stat'ed without following symlinks and yielded as (name, inode, is_dir, size, mtime)
+    """
+    batch = []
+    target = first_batch
+    total = 0
+    last_yield = time.monotonic()
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if with_stats:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                        batch.append((entry.name, entry.inode(), is_dir, st.st_size, st.st_mtime_ns))
+                    except OSError:
+                        batch.append((entry.name, entry.inode(), is_dir, UNKNOWN_SIZE, UNKNOWN_MTIME))
+                else:
+                    batch.append((entry.name, entry.inode(), is_dir))
+                if target is None:
+                    continue
+                if len(batch) >= target or (total > 0 and len(batch) % TIME_CHECK_EVERY == 0 and time.monotonic() - last_yield >= interval):
+                    yield batch
+                    total += len(batch)
+                    target = total
+                    batch = []
+                    last_yield = time.monotonic()
+    except OSError:
+        pass
+    if len(batch) > 0 or total == 0:
+        yield batch
+
+def _sort_key(name: str) -> str:
+    key = name.lower()
+    return name if key == name else key   # Share the string when the name is already lowercase
+
+def _natural_key(key: str) -> Tuple:
+    # Split a sort key into text and numbers, so runs of digits compare by value
+    parts = _DIGITS.split(key)
+    parts[1::2] = map(int, parts[1::2])
+    return tuple(parts)
+
+def _merge_rows(rows: List[Tuple[str, str, int]], new_rows: List[Tuple[str, str, int]]) -> List[Tuple[str, str, int]]:
+    # Merge a batch of rows into an already sorted list. Timsort finds the two sorted runs, so this is linear
+    if len(new_rows) == 0:
+        return rows
+    new_rows.sort()
+    merged = rows + new_rows
+    merged.sort()
+    return merged
@@ -1,7 +1,31 @@
-import os, subprocess, platform
-from typing import List
-from src.explorer.FileEntry import FileEntry, Directory
-import pyperclip
+"""
+The state of the explorer, and the services it runs in the background.
+
+Modules that only some features need, such as the services that measure, preview, search and operate on
+files, are imported inside the function that first uses them, and only named for type checking at the top
+of a module. Startup then loads just what the first screen needs. The displays and main follow the same rule.
+"""
+from __future__ import annotations
+import os
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Set, Tuple
+from src.explorer.FileEntry import FileEntry, Directory, ArchiveDirectory, ChildTable, SORT_NAME, KIND_DIR
+from src.explorer.DirectoryScanner import DirectoryScanner, ScanJob
+from src.explorer.ListingCache import ListingCache, LISTINGS_FILENAME, user_cache_dir
+from src.explorer.EntryFilter import EntryFilter, FILTER_SUBSTRING
+from src.explorer.Prefetcher import Prefetcher, DEFAULT_REACH
+from src.explorer.TreeBudget import TreeBudget, TreeStats, DEFAULT_MAX_ENTRIES as DEFAULT_TREE_ENTRIES, ENV_VAR as TREE_ENTRIES_ENV_VAR
+
+if TYPE_CHECKING:
+    from src.explorer.SubtreeIndex import SubtreeIndex, SearchJob
+    from src.explorer.DirectoryWatcher import DirectoryWatcher
+    from src.explorer.DiskUsage import DiskUsage, SizeJob
+    from src.explorer.FilePreview import FilePreviewer, PreviewJob
+    from src.explorer.FileOperations import FileOperations, OperationJob
+    from src.explorer.FrecencyStore import FrecencyStore
+
+PEEK_LANE = 'peek'
+FIRST_LISTING_TIMEOUT = 0.5 # Longest time in seconds to wait for a directory being entered to show its first entries
+PREVIEW_TIMEOUT = 0.02      # Longest time in seconds to wait for a page of a file preview before showing a placeholder
 
 class FileExplorer:
     """
@@ -11,38 +35,109 @@ class FileExplorer:
     Attributes:
 
     - start : :class:`str` --> the absolute file path for the directory upon initialization
-    - curr_directory : :class:`Directory` --> the current directory the program is running in
+    - curr_directory : :class:`Directory` --> the directory being browsed. Paths are kept absolute, so the process working directory is never changed
     - selected_index : :class:`int` --> index of the currently selected file entry, inside the
     curr_directory
+    - listing_cache : :class:`ListingCache` --> cache of directory listings, so unchanged directories are not rescanned. It is saved
+    under the user cache directory on shutdown and loaded on the next start
+    - scanner : :class:`DirectoryScanner` --> service used to scan directories, in the background when peeking
+    - peek_job : :class:`ScanJob` --> the most recent background scan started by peek_right
+    - prefetcher : :class:`Prefetcher` --> reads the directories next to the selection, and the parent directory, into the listing cache ahead of
+    time. None if disabled by setting FE_PREFETCH=0
+    - watcher : :class:`DirectoryWatcher` --> watches the directories on screen for changes, created the first time directories are watched. None until then,
+    if inotify is unavailable, or if disabled by setting FE_WATCH=0
+    - can_watch : :class:`bool` --> False once watching is known to be unavailable or disabled
+    - entry_filter : :class:`EntryFilter` --> narrows the entries of curr_directory that can be selected, or None to allow all of them
+    - subtree_index : :class:`SubtreeIndex` --> index of every file under start, opened the first time it is searched
+    - disk_usage : :class:`DiskUsage` --> service used to measure the sizes of entries, created the first time sizes are measured
+    - size_job : :class:`SizeJob` --> the most recent measurement started by measure_sizes
+    - previewer : :class:`FilePreviewer` --> service used to read pages of files for previews, created the first time a file is previewed
+    - marks : :class:`Dict[str, Set[str]]` --> the names of the marked entries, by the path of their directory. Marks are kept while moving between directories
+    - file_ops : :class:`FileOperations` --> service used to copy, move and delete marked entries, created the first time it is used
+    - sort_mode : :class:`int` --> the SORT_ constant that directories are ordered by. Directories read in another mode are sorted when next shown
+    - frecency : :class:`FrecencyStore` --> the directories moved into most often and most recently, saved under the user cache directory on shutdown.
+    Created the first time it is used, through _get_frecency()
+    - tree_budget : :class:`TreeBudget` --> bounds the entries held by the directories read so far, releasing the children of those shown longest ago.
+    Set FE_TREE_ENTRIES to change the number of entries
+
+    Parameters:
+
+    - on_phase : :class:`Callable[[str], None]` --> called with the name of each step of initialization once it is done, to time startup
     """
-    def __init__(self) -> None:
+    def __init__(self, on_phase: Callable[[str], None] = None) -> None:
+        on_phase = on_phase or (lambda phase: None)
         self.start = os.getcwd()
+        self.listing_cache = ListingCache(store_path=os.path.join(user_cache_dir(), LISTINGS_FILENAME))
+        self.listing_cache.load()
+        on_phase('load listing cache')
+        self.scanner = DirectoryScanner(self.listing_cache)
+        self.sort_mode = SORT_NAME
+        self.tree_budget = TreeBudget(int(os.environ.get(TREE_ENTRIES_ENV_VAR, DEFAULT_TREE_ENTRIES)))
+        self.peek_job: ScanJob = None
+        self.prefetcher = Prefetcher(self.listing_cache, self.scanner.has_pending) if os.environ.get('FE_PREFETCH', '1') != '0' else None
+        self.watcher: DirectoryWatcher = None
+        self.can_watch = os.environ.get('FE_WATCH', '1') != '0'
         self.curr_directory = self._get_curr_directory()
+        on_phase('scan start directory')
+        self.frecency: FrecencyStore = None
         self.selected_index = 0
+        self.entry_filter: EntryFilter = None
+        self.subtree_index: SubtreeIndex = None
+        self.disk_usage: DiskUsage = None
+        self.size_job: SizeJob = None
+        self.previewer: FilePreviewer = None
+        self.marks: Dict[str, Set[str]] = {}
+        self.file_ops: FileOperations = None
 
     def get_selected_entry(self) -> FileEntry:
+        """
+        Returns the selected file entry, or None if the current directory is empty or the selection
+        is hidden by the filter
+        """
+        if len(self.curr_directory.children) == 0 or not self._passes_filter(self.selected_index):
+            return None
         return self.curr_directory.get_child(self.selected_index)
 
     def select_by_index(self, index: int) -> FileEntry:
         """
-        Set the file entry at the given index as the current file entry, and return the file entry. Returns None if the index is out of bounds.
+        Set the file entry at the given index as the current file entry, and return the file entry. Returns None if the index is out of bounds
+        or the entry is hidden by the filter.
 
         Parameters:
 
         - index: :class:`int` --> the index of the file entry to select
         """
-        if (index < 0 or index >= len(self.curr_directory.children)):
+        if (index < 0 or index >= len(self.curr_directory.children)) or not self._passes_filter(index):
             return None
         else:
             self.selected_index = index
             self.curr_directory.select_child(self.selected_index)
             return self.get_selected_entry()
 
+    def select_by_name(self, name: str, prefix: bool = False) -> FileEntry:
+        """
+        Select the file entry with the given name in the current directory, and return it. Returns
+        None if there is no such entry. Exact names are found in O(1) using the directory's name index,
+        and prefixes in O(log n) using its sorted order.
+
+        Parameters:
+
+        - name : :class:`str` --> the name of the file entry to select
+        - prefix : :class:`bool` --> if True, select the first entry whose name starts with name, ignoring case
+        """
+        children = self.curr_directory.children
+        index = children.find(name)
+        if index < 0 and prefix:
+            index = children.find_prefix(name)
+        return self.select_by_index(index)
+
     def traverse_up(self) -> int:
         """
         Move upwards one selection in the current directory. Returns the index of the currently
         selected file entry.
         """
+        if self.entry_filter is not None:
+            return self._step_filtered(-1)
         if self.selected_index == 0:
             self.selected_index = len(self.curr_directory.children) - 1
         else:
@@ -55,6 +150,8 @@ class FileExplorer:
         Move downwards one selection in the current directory. Returns the index of the currently
         selected file entry.
         """
+        if self.entry_filter is not None:
+            return self._step_filtered(1)
         if self.selected_index == len(self.curr_directory.children) - 1:
             self.selected_index = 0
         else:
@@ -71,98 +168,651 @@ class FileExplorer:
 
         current_dir = self.curr_directory
         current_dir.select_child(self.selected_index) # Maintain history of selected child
-        os.chdir('../')
+        self.clear_filter()
         if self.curr_directory.parent is None:
-            parent_dir = Directory()
-            parent_dir.traverse_contents(current_dir)
+            parent_dir = Directory.at(current_dir.dir)
+            self.scanner.scan_now(parent_dir, current_dir)
             self.curr_directory = parent_dir
         else:
             self.curr_directory = self.curr_directory.parent
-        self.selected_index = self.curr_directory.children.index(current_dir) # TODO: Use a faster method than index()
+            if self.curr_directory.children is None:    # Created by jump_to without being scanned, or released to save memory
+                self.scanner.scan_now(self.curr_directory, current_dir)
+            else:
+                self.curr_directory.sort_children(self.sort_mode)
+        # The directory left may have been renamed or removed since, so the first entry is selected instead
+        self.selected_index = max(self.curr_directory.get_child_index(current_dir.name), 0)
+        self.curr_directory.select_child(self.selected_index)
 
     def traverse_right(self) -> int:
         """
-        Move into the currently selected directory
+        Move into the currently selected directory, or archive
 
         Returns the index of the currently selected file entry.
 
-        Raises an exception if the current selection is not a directory
+        Raises an exception if the current selection is not a directory, or if none of its entries
+        have been read yet
         """
         selection = self.get_selected_entry()
         parent = self.curr_directory
 
-        if type(selection) != Directory:
+        if not isinstance(selection, Directory):
             raise Exception('Cannot traverse a file')
-        os.chdir(selection.name)
+        self.finish_peek()
+        if selection.children is None:
+            raise Exception('Directory is still being scanned')
+        if self.is_peek_pending():  # Keep streaming the rest of the directory after moving into it
+            self.scanner.detach(self.peek_job)
+            self.peek_job = None
+        self.clear_filter()
         if selection.parent is None:
             selection.set_parent(parent)
+        if not self.is_peek_pending():  # A listing still streaming in is sorted once complete
+            selection.sort_children(self.sort_mode)
         self.curr_directory = selection
-        if self.curr_directory.children == None:
-            self.curr_directory.traverse_contents()
         self.selected_index = self.curr_directory.get_curr_selected_child_index()
+        if not self.in_archive():
+            self._get_frecency().visit(selection.get_path())
         return self.selected_index
 
-    def peek_right(self) -> bool:
+    def jump_to(self, path: str) -> FileEntry:
+        """
+        Make the directory containing path the current directory, and select the entry at path. Only the
+        directories from the nearest one already read down to the target are created, and the ones
+        in between are not scanned until they are moved into. A path outside every directory read so
+        far gets only its own directory, whose parents are read as they are moved into.
+
+        Returns the selected file entry, or None if the path could not be reached
+
+        Parameters:
+
+        - path : :class:`str` --> the absolute path of the entry to select
+        """
+        dir_path, name = os.path.split(os.path.normpath(path))
+        if not os.path.isdir(dir_path):
+            return None
+        ancestor = self.curr_directory
+        while ancestor.parent is not None and not _is_under(dir_path, ancestor.get_path()):
+            ancestor = ancestor.parent
+        if not _is_under(dir_path, ancestor.get_path()):    # Outside the directories read so far, so start a new tree at the directory itself
+            ancestor = Directory.at(dir_path)
+        directory = ancestor
+        rel_path = os.path.relpath(dir_path, ancestor.get_path())
+        for component in ([] if rel_path == os.curdir else rel_path.split(os.sep)):
+            if directory.children is None:
+                child = Directory(directory.get_path(), component, directory)
+            else:
+                index = directory.get_child_index(component)
+                if index < 0 or not directory.children.is_dir(index):
+                    return None
+                directory.select_child(index)
+                child = directory.get_child(index)
+            directory = child
+        if directory.children is None:
+            self.scanner.scan_now(directory)
+        else:
+            directory.sort_children(self.sort_mode)
+        index = directory.get_child_index(name)
+        if index < 0:
+            return None
+        self.cancel_peek()
+        self.clear_filter()
+        self.curr_directory = directory
+        self.select_by_index(index)
+        return self.get_selected_entry()
+
+    def jump_into(self, path: str) -> Directory:
+        """
+        Make the directory at path the current directory. Only the directory and its parent are read, however deep it
+        is, and moving left from it reads each parent as it is reached. A directory that is empty or could not be read
+        is selected in its parent instead, as when moving right. Directories that no longer exist are forgotten by frecency.
+
+        Returns the current directory, or None if path could not be reached
+
+        Parameters:
+
+        - path : :class:`str` --> the absolute path of the directory
+        """
+        selection = self.jump_to(path)
+        if not isinstance(selection, Directory):
+            self._get_frecency().remove(path)
+            return None
+        self.finish_peek()
+        if len(selection.children) > 0:
+            self.traverse_right()
+        return self.curr_directory
+
+    def frecent_directories(self, query: str) -> List[Tuple[str, bool]]:
+        """
+        Returns the (path, is_dir) of the directories moved into before whose paths match query, ignoring case, best match first.
+        See FrecencyStore.matches for the order
+
+        Parameters:
+
+        - query : :class:`str` --> the text to match against paths
+        """
+        return [(path, True) for path in self._get_frecency().matches(query)]
+
+    def search_subtree(self, query: str, on_found: Callable[[SearchJob], None] = None) -> SearchJob:
+        """
+        Search the indexed entries under start whose names contain query, ignoring case, in the background.
+        Any search still running is dropped. If the index is being updated, results may be missing until
+        is_indexing() returns false. Returns the job
+
+        Parameters:
+
+        - query : :class:`str` --> the text to search for in names
+        - on_found : :class:`Callable[[SearchJob], None]` --> called on the UI thread with the (path, is_dir) of the entries found
+        """
+        if self.subtree_index is None:
+            self.update_subtree_index()
+        return self.subtree_index.request_search(self.start, query, on_found)
+
+    def poll_searches(self) -> int:
+        """
+        Hand the results of background searches to their callbacks. Returns the number of searches whose results were used
+        """
+        return 0 if self.subtree_index is None else self.subtree_index.poll()
+
+    def is_searching(self) -> bool:
+        return self.subtree_index is not None and self.subtree_index.is_searching()
+
+    def update_subtree_index(self) -> bool:
+        """
+        Open the index of every file under start, and start bringing it up to date in the background.
+        Only directories that changed since they were indexed are read again.
+
+        Returns false if an update is already running
+        """
+        if self.subtree_index is None:
+            from src.explorer.SubtreeIndex import SubtreeIndex
+            self.subtree_index = SubtreeIndex()
+        return self.subtree_index.start_update(self.start)
+
+    def is_indexing(self) -> bool:
+        return self.subtree_index is not None and self.subtree_index.is_updating()
+
+    def get_tree_stats(self) -> TreeStats:
+        """
+        Returns what the directories read so far hold in memory
+        """
+        return self.tree_budget.stats()
+
+    def measure_sizes(self, on_measured: Callable[[SizeJob], None] = None) -> SizeJob:
+        """
+        Start measuring the disk usage of each entry in the current directory in the background, counting
+        everything under subdirectories. Any previous measurement that has not finished is cancelled,
+        but the totals of the subtrees it completed are kept.
+
+        Parameters:
+
+        - on_measured : :class:`Callable[[SizeJob], None]` --> called on the UI thread each time more sizes have been copied into the directory's children
+        """
+        if self.disk_usage is None:
+            from src.explorer.DiskUsage import DiskUsage
+            self.disk_usage = DiskUsage()
+        if self.size_job is not None:
+            if self.size_job.directory is self.curr_directory and self.size_job.is_pending():
+                return self.size_job
+            self.size_job.cancel()
+        self.size_job = self.disk_usage.measure(self.curr_directory, on_measured)
+        return self.size_job
+
+    def poll_sizes(self) -> int:
+        """
+        Copy sizes measured in the background into the children of their directories. Returns the number of directories updated
+        """
+        return 0 if self.disk_usage is None else self.disk_usage.poll()
+
+    def is_measuring(self) -> bool:
+        return self.disk_usage is not None and self.disk_usage.has_pending()
+
+    def preview_file(self, path: str, first_line: int, num_lines: int, on_read: Callable[[PreviewJob], None] = None) -> PreviewJob:
+        """
+        Start reading a page of lines of a file in the background, dropping any earlier request that has not been read yet
+
+        Parameters:
+
+        - path : :class:`str` --> the path of the file
+        - first_line : :class:`int` --> the index of the first line to read
+        - num_lines : :class:`int` --> the number of lines to read
+        - on_read : :class:`Callable[[PreviewJob], None]` --> called on the UI thread once the lines have been read
+        """
+        if self.previewer is None:
+            from src.explorer.FilePreview import FilePreviewer
+            self.previewer = FilePreviewer()
+        return self.previewer.request(path, first_line, num_lines, on_read)
+
+    def wait_for_preview(self, job: PreviewJob) -> bool:
+        """
+        Wait briefly for a page of a preview to be read, and show it if it was. Returns true if it was read in time
+        """
+        return self.previewer.wait_for(job, PREVIEW_TIMEOUT)
+
+    def poll_previews(self) -> int:
+        """
+        Show the pages of previews read in the background. Returns the number shown
+        """
+        return 0 if self.previewer is None else self.previewer.poll()
+
+    def toggle_mark(self) -> bool:
+        """
+        Mark the selected entry, or unmark it if it was marked. Entries inside archives cannot be marked. Returns true if the entry is now marked
+        """
+        selection = self.get_selected_entry()
+        if selection is None or self.in_archive():
+            return False
+        path = self.curr_directory.get_path()
+        names = self.marks.setdefault(path, set())
+        if selection.name in names:
+            names.discard(selection.name)
+            if len(names) == 0:
+                del self.marks[path]
+            return False
+        names.add(selection.name)
+        return True
+
+    def clear_marks(self):
+        """
+        Unmark every entry, in every directory
+        """
+        self.marks.clear()
+
+    def get_marked(self) -> List[str]:
+        """
+        Returns the paths of the marked entries, grouped by directory
+        """
+        return [os.path.join(path, name) for path in sorted(self.marks) for name in sorted(self.marks[path])]
+
+    def copy_marked(self, on_progress: Callable[[OperationJob], None] = None) -> OperationJob:
+        """
+        Start copying the marked entries into the current directory in the background, and unmark them.
+        Returns the job, or None if nothing is marked or the current directory is inside an archive
+
+        Parameters:
+
+        - on_progress : :class:`Callable[[OperationJob], None]` --> called on the UI thread each time more of the entries are copied, and once they all are
+        """
+        from src.explorer.FileOperations import OP_COPY
+        return self._operate_on_marked(OP_COPY, on_progress)
+
+    def move_marked(self, on_progress: Callable[[OperationJob], None] = None) -> OperationJob:
+        """
+        Start moving the marked entries into the current directory in the background, and unmark them.
+        Returns the job, or None if nothing is marked or the current directory is inside an archive
+
+        Parameters:
+
+        - on_progress : :class:`Callable[[OperationJob], None]` --> called on the UI thread each time more of the entries are moved, and once they all are
+        """
+        from src.explorer.FileOperations import OP_MOVE
+        return self._operate_on_marked(OP_MOVE, on_progress)
+
+    def delete_marked(self, on_progress: Callable[[OperationJob], None] = None) -> OperationJob:
+        """
+        Start deleting the marked entries in the background, or the selected entry if nothing is marked.
+        Returns the job, or None if there is nothing to delete or the current directory is inside an archive
+
+        Parameters:
+
+        - on_progress : :class:`Callable[[OperationJob], None]` --> called on the UI thread each time more of the entries are deleted, and once they all are
+        """
+        from src.explorer.FileOperations import OP_DELETE
+        return self._operate_on_marked(OP_DELETE, on_progress)
+
+    def count_targets(self, kind: int) -> int:
+        """
+        Returns the number of entries an operation would start with: the marked ones, or for a delete the selected one if nothing is marked
+
+        Parameters:
+
+        - kind : :class:`int` --> OP_COPY, OP_MOVE or OP_DELETE
+        """
+        from src.explorer.FileOperations import OP_DELETE
+        if self.in_archive():
+            return 0
+        num_marked = sum(map(len, self.marks.values()))
+        if num_marked == 0 and kind == OP_DELETE:
+            return 0 if self.get_selected_entry() is None else 1
+        return num_marked
+
+    def poll_operations(self) -> int:
+        """
+        Report the progress of copies, moves and deletes running in the background. Returns the number of jobs that made progress
+        """
+        return 0 if self.file_ops is None else self.file_ops.poll()
+
+    def is_operating(self) -> bool:
+        return self.file_ops is not None and self.file_ops.has_pending()
+
+    def cancel_operations(self) -> bool:
+        """
+        Stop every copy, move and delete running in the background. Entries already processed stay processed. Returns true if any were running
+        """
+        if not self.is_operating():
+            return False
+        for job in self.file_ops.jobs:
+            job.cancel()
+        return True
+
+    def rescan(self, directories: Iterable[Directory], on_rescanned: Callable[[ScanJob], None] = None):
         """
-        If the currently selected file entry is a directory, parse it using the FileExplorer object.
+        Read directories again in the background, such as after files were copied into them
 
-        Returns true if a directory was parsed, false otherwise
+        Parameters:
+
+        - directories : :class:`Iterable[Directory]` --> the directories to read
+        - on_rescanned : :class:`Callable[[ScanJob], None]` --> called on the UI thread once a directory has been read
+        """
+        for directory in directories:
+            self.listing_cache.invalidate(directory.get_path())
+            self.scanner.submit(directory, on_rescanned)
+
+    def shutdown(self):
+        """
+        Stop background scans, indexing, measurements, previews and file operations, and save the listing cache and frecency for the next start
+        """
+        self.scanner.shutdown()
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown()
+        self.listing_cache.save()
+        self._get_frecency().save()
+        if self.subtree_index is not None:
+            self.subtree_index.close()
+        if self.disk_usage is not None:
+            self.disk_usage.shutdown()
+        if self.previewer is not None:
+            self.previewer.shutdown()
+        if self.file_ops is not None:
+            self.file_ops.shutdown()
+
+    def peek_right(self, on_scanned: Callable[[ScanJob], None] = None, first_batch: int = None) -> bool:
         """
+        If the currently selected file entry is a directory, start scanning it in the background. Archives are only indexed once
+        moved into, so scrolling past a large one costs nothing. A directory that was never shown but has a valid
+        cached listing, such as one prefetched, gets it straight away.
+        Any previous peek that has not finished yet is cancelled, and the directories around the selection
+        are prefetched.
+
+        Returns true if a directory scan was started, false otherwise
+
+        Parameters:
+
+        - on_scanned : :class:`Callable[[ScanJob], None]` --> called on the UI thread each time more of the directory's children are available
+        - first_batch : :class:`int` --> number of entries to read before showing a first, partial listing
+        """
+        self.cancel_peek()
         if len(self.curr_directory.children) == 0:
             return False
+        self._prefetch_around_selection()
         selection = self.get_selected_entry()
         parent = self.curr_directory
 
-        if type(selection) != Directory:
+        if selection is None or selection.kind() != KIND_DIR:    # Archives are files until moved into, so they are only indexed on request
             return False
-        os.chdir(selection.name)
         if selection.parent is None:
             selection.set_parent(parent)
-        selection.traverse_contents()
-        os.chdir('../')
+        if selection.children is None:
+            cached = self.scanner.read_cached(selection)
+            if cached is not None:  # Nothing to wait for, so no scan is needed
+                self.scanner.save_listing(selection, cached)
+                return True
+        else:
+            selection.sort_children(self.sort_mode)
+        self.peek_job = self.scanner.submit(selection, on_scanned, lane=PEEK_LANE, first_batch=first_batch)
         return True
 
+    def finish_peek(self) -> bool:
+        """
+        Make sure at least the first entries of the currently selected directory are available. If
+        a background scan is running, wait briefly for its first listing. If the directory was never
+        peeked at, scan it on this thread.
+
+        Returns true if the directory had to be scanned on this thread
+        """
+        selection = self.get_selected_entry()
+        if not isinstance(selection, Directory) or selection.children is not None:
+            return False
+        if self.is_peek_pending():
+            self.scanner.wait_for_first(self.peek_job, FIRST_LISTING_TIMEOUT)
+            return False
+        self.scanner.scan_now(selection)
+        return True
+
+    def sync_selection(self) -> int:
+        """
+        Update the selected index after the current directory's children have changed, such as when
+        more entries have been streamed in. Returns the index of the currently selected file entry.
+        """
+        self.selected_index = self.curr_directory.get_curr_selected_child_index()
+        if self.entry_filter is not None:
+            self.entry_filter.refresh()
+        return self.selected_index
+
+    def set_filter(self, query: str, mode: int = FILTER_SUBSTRING) -> FileEntry:
+        """
+        Only allow the entries of the current directory whose names match query to be selected. The
+        selection is kept if it still matches, and moved to the first match otherwise.
+
+        Returns the selected file entry, or None if nothing matches
+
+        Parameters:
+
+        - query : :class:`str` --> the text to match against names, ignoring case
+        - mode : :class:`int` --> FILTER_SUBSTRING or FILTER_FUZZY
+        """
+        if self.entry_filter is None or self.entry_filter.directory is not self.curr_directory:
+            self.entry_filter = EntryFilter(self.curr_directory, mode)
+        self.entry_filter.set_mode(mode)
+        indices = self.entry_filter.set_query(query)
+        if len(indices) == 0:
+            return None
+        if self.entry_filter.position(self.selected_index) < 0:
+            self.select_by_index(indices[0])
+        return self.get_selected_entry()
+
+    def set_sort_mode(self, mode: int):
+        """
+        Order directories by a sort mode. The current directory is sorted straight away, from data already read,
+        keeping the same entry selected. Other directories are sorted when they are next shown.
+
+        Parameters:
+
+        - mode : :class:`int` --> one of the SORT_ constants
+        """
+        self.sort_mode = mode
+        self.scanner.sort_mode = mode
+        self.curr_directory.sort_children(mode)
+        self.sync_selection()
+
+    def clear_filter(self):
+        """
+        Allow every entry of the current directory to be selected again
+        """
+        self.entry_filter = None
+
+    def cancel_peek(self):
+        """
+        Drop the results of the current background peek, if there is one
+        """
+        if self.peek_job is not None:
+            self.peek_job.cancel()
+            self.peek_job = None
+
+    def is_peek_pending(self) -> bool:
+        return self.peek_job is not None and self.peek_job.is_pending()
+
+    def in_archive(self) -> bool:
+        """
+        Returns true if the current directory is an archive or inside one, where entries have no path on disk
+        """
+        return isinstance(self.curr_directory, ArchiveDirectory)
+
     def copy_path(self) -> Directory:
         """
-        Copy the relative path of the currently selected directory
+        Copy the relative path of the currently selected directory. Directories inside archives have no path to copy
         """
         selection = self.get_selected_entry()
-        if type(selection) == Directory:
-            rel_path = os.path.relpath(selection.name, self.start)
+        if selection is not None and selection.kind() == KIND_DIR and not self.in_archive():
+            rel_path = os.path.relpath(selection.get_path(), self.start)
             escaped_path = rel_path.replace(' ', '\ ')
+            import pyperclip
             pyperclip.copy(f'cd {escaped_path}')
             return selection
         return None
 
     def open_file(self):
         """
-        Open file using default OS application
+        Open file using default OS application. Archives are opened as files, but members of archives are not on disk to be opened
         """
         # Ref: https://stackoverflow.com/questions/434597/open-document-with-default-os-application-in-python-both-in-windows-and-mac-os
         selection = self.get_selected_entry()
-        if type(selection) != Directory:
+        if selection is not None and selection.kind() != KIND_DIR and not self.in_archive():
+            import platform, subprocess
             if platform.system() == 'Darwin':       # macOS
-                subprocess.call(('open', selection.name))
+                subprocess.call(('open', selection.get_path()))
             elif platform.system() == 'Windows':    # Windows
-                os.startfile(selection.name)
+                os.startfile(selection.get_path())
             else:                                   # linux variants
-                subprocess.call(('xdg-open', selection.name))
+                subprocess.call(('xdg-open', selection.get_path()))
+
+    def watch(self, directories: Iterable[Directory]):
+        """
+        Watch the given directories for changes, and stop watching any others. Archives are not watched, but are
+        indexed again if they changed when next read
+
+        Parameters:
+
+        - directories : :class:`Iterable[Directory]` --> the directories to watch
+        """
+        if self.watcher is None and self.can_watch:
+            from src.explorer.DirectoryWatcher import DirectoryWatcher
+            self.watcher = DirectoryWatcher.create()
+            self.can_watch = self.watcher is not None
+        if self.watcher is not None:
+            self.watcher.set_watched(directory for directory in directories if not isinstance(directory, ArchiveDirectory))
+
+    def apply_fs_changes(self, on_rescanned: Callable[[ScanJob], None] = None) -> Dict[Directory, int]:
+        """
+        Read the changes to watched directories without blocking, and insert or remove their
+        children in place. Directories whose events were lost are rescanned in the background.
+
+        Returns the lowest changed child index for each directory that was updated in place
+
+        Parameters:
+
+        - on_rescanned : :class:`Callable[[ScanJob], None]` --> called on the UI thread when a directory that had to be rescanned has been read
+        """
+        if self.watcher is None:
+            return {}
+        changes = self.watcher.read_changes()
+        if len(changes) == 0:
+            return {}
+        # Stat before reading the remaining events, so the cached listing can only be marked
+        # up to date with changes that have been applied to it
+        stamps = {}
+        for directory in changes:
+            try:
+                stamps[directory] = os.stat(directory.get_path())
+            except OSError:
+                pass
+        for directory, later in self.watcher.read_changes().items():
+            if directory in changes:
+                changes[directory].merge(later)
+            else:
+                changes[directory] = later
+
+        updated = {}
+        for directory, dir_changes in changes.items():
+            path = directory.get_path()
+            if dir_changes.rescan:
+                self.listing_cache.invalidate(path)
+                self.scanner.submit(directory, on_rescanned)
+                continue
+            first_changed = directory.apply_changes(dir_changes.entries)
+            if first_changed < 0:
+                continue
+            updated[directory] = first_changed
+            if directory in stamps:
+                self.listing_cache.restamp(path, stamps[directory], directory.children)
+            else:
+                self.listing_cache.invalidate(path)
+        if self.curr_directory in updated:
+            self.sync_selection()
+        return updated
+
+    def _operate_on_marked(self, kind: int, on_progress: Callable[[OperationJob], None]) -> OperationJob:
+        # Start an operation on the marked entries, or for a delete the selected entry if nothing is marked, into the current directory
+        from src.explorer.FileOperations import FileOperations, OP_DELETE
+        if self.in_archive():
+            return None
+        sources = self.get_marked()
+        if len(sources) == 0 and kind == OP_DELETE and self.get_selected_entry() is not None:
+            sources = [self.get_selected_entry().get_path()]
+        if len(sources) == 0:
+            return None
+        if self.file_ops is None:
+            self.file_ops = FileOperations()
+        self.clear_marks()
+        path = self.curr_directory.get_path()
+        return self.file_ops.start(kind, sources, destination=path, protected=path, callback=on_progress)
+
+    def _get_frecency(self) -> FrecencyStore:
+        # Open the frecency store the first time it is needed, recording the visit to the start directory
+        if self.frecency is None:
+            from src.explorer.FrecencyStore import FrecencyStore, FRECENCY_FILENAME
+            self.frecency = FrecencyStore(os.path.join(user_cache_dir(), FRECENCY_FILENAME))
+            self.frecency.visit(self.start)
+        return self.frecency
+
+    def _passes_filter(self, index: int) -> bool:
+        return self.entry_filter is None or self.entry_filter.position(index) >= 0
+
+    def _step_filtered(self, step: int) -> int:
+        # Move the selection to the next or previous entry that passes the filter, wrapping around
+        indices = self.entry_filter.indices
+        if len(indices) == 0:
+            return self.selected_index
+        position = self.entry_filter.position(self.selected_index)
+        position = 0 if position < 0 else (position + step) % len(indices)
+        self.selected_index = indices[position]
+        self.curr_directory.select_child(self.selected_index)
+        return self.selected_index
+
+    def _prefetch_around_selection(self):
+        # Prefetch the unread directories next to the selection, nearest first, and the parent directory if it has not been read.
+        # Inside an archive, everything is read from its index at once
+        if self.prefetcher is None or self.in_archive():
+            return
+        children = self.curr_directory.children
+        path = self.curr_directory.get_path()
+        targets = []
+        for distance in range(1, DEFAULT_REACH + 1):
+            for index in (self.selected_index + distance, self.selected_index - distance):
+                if 0 <= index < len(children) and children.is_dir(index):
+                    entry = children.entries.get(children.name(index))
+                    if entry is None or entry.children is None:
+                        targets.append(os.path.join(path, children.name(index)))
+        parent = self.curr_directory.parent
+        if (parent is None or parent.children is None) and self.curr_directory.name != '':
+            targets.append(self.curr_directory.dir)
+        self.prefetcher.prefetch(targets)
 
     def _get_curr_directory(self) -> Directory:
-        # Get the current Directory object, creating it if it doesn't exist
-        if not hasattr(self, 'curr_directory') or self.curr_directory.path != os.getcwd():
-            curr_dir = Directory()
-            curr_dir.traverse_contents()
-            return curr_dir
-        else:
-            return self.curr_directory
+        # Create the Directory object for start, the only place the working directory is read
+        curr_dir = Directory.at(self.start)
+        self.scanner.scan_now(curr_dir)
+        return curr_dir
 
-    def get_curr_file_entries(self) -> List[FileEntry]:
+    def get_curr_file_entries(self) -> ChildTable:
         """
         Returns the list of file entries in the current directory
         """
         return self.curr_directory.children
 
+def _is_under(path: str, directory: str) -> bool:
+    # True if path is directory or inside it
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
 if __name__ == "__main__":
     fe = FileExplorer()
     fe.traverse_right()
@@ -0,0 +1,454 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Set, Tuple
+import errno, os, stat, threading, time
+
+DEFAULT_WORKERS = 4
+CHUNK_BYTES = 8 << 20       # Bytes copied per system call, so progress is shown and cancelling is noticed between calls
+SMALL_FILE_BYTES = 1 << 20  # Files smaller than this are copied in batches, rather than one task each
+BATCH_FILES = 256           # Most files in a batch
+BATCH_BYTES = 16 << 20      # Most bytes in a batch
+MAX_ERRORS = 100            # Error messages kept for each job. Later errors are only counted
+RATE_WINDOW = 2.0           # Seconds of progress that the throughput is measured over
+
+OP_COPY = 0
+OP_MOVE = 1
+OP_DELETE = 2
+OP_NAMES = ('copy', 'move', 'delete')
+
+# Errors from copy_file_range and sendfile that mean the files do not support them, so the next way of copying is tried
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOTSOCK, errno.EBADF}
+
+class OperationJob:
+    """
+    A copy, move or delete of several files and directories, carried out by the worker pool of FileOperations.
+    Counters grow as the sources are walked and as their files are processed, and are read on the UI thread.
+
+    Attributes:
+
+    - kind : :class:`int` --> OP_COPY, OP_MOVE or OP_DELETE
+    - sources : :class:`List[str]` --> the absolute paths of the files and directories operated on
+    - destination : :class:`str` --> the directory that sources are copied or moved into, or None for a delete
+    - protected : :class:`str` --> a directory that must not be moved or deleted, such as the one being browsed. Sources containing it are refused
+    - callback : :class:`Callable[[OperationJob], None]` --> called on the UI thread each time progress is made, and once the job is done
+    - files_total : :class:`int` --> number of files found so far. Final once planned is True
+    - files_done : :class:`int` --> number of files processed, including those that failed
+    - bytes_total : :class:`int` --> number of bytes to copy found so far
+    - bytes_done : :class:`int` --> number of bytes copied
+    - errors : :class:`List[Tuple[str, str]]` --> the (path, reason) of the first MAX_ERRORS errors
+    - num_errors : :class:`int` --> number of errors
+    - failed_sources : :class:`Set[int]` --> indices in sources of those with an error, which a move does not delete
+    - copied_sources : :class:`Set[int]` --> indices in sources of those walked to the end and whose every file was processed. A move
+    across file systems only deletes these
+    - planned : :class:`bool` --> True once every source has been walked
+    - started_at : :class:`float` --> time.monotonic() when the job was started
+    - finished_at : :class:`float` --> time.monotonic() when the last file was processed, or None
+    - cancelled : :class:`bool` --> True if the job should stop. Files already processed stay processed, and a partly copied file is removed
+    - done : :class:`bool` --> True once the UI has been told the job finished
+    """
+    def __init__(self, kind: int, sources: List[str], destination: str = None, protected: str = None, callback: Callable[[OperationJob], None] = None) -> None:
+        self.kind = kind
+        self.sources = sources
+        self.destination = destination
+        self.protected = protected
+        self.callback = callback
+        self.files_total = 0
+        self.files_done = 0
+        self.bytes_total = 0
+        self.bytes_done = 0
+        self.errors: List[Tuple[str, str]] = []
+        self.num_errors = 0
+        self.failed_sources: Set[int] = set()
+        self.copied_sources: Set[int] = set()
+        self.items_left: Dict[int, int] = {}
+        self.walked_sources: Set[int] = set()
+        self.planned = False
+        self.started_at = time.monotonic()
+        self.finished_at: float = None
+        self.cancelled = False
+        self.done = False
+        self.changed = False
+        self.tasks_left = 0
+        self.created_dirs: List[Tuple[str, os.stat_result]] = []
+        self.removed_dirs: List[Tuple[int, str]] = []
+        self.samples = deque([(self.started_at, 0)])
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def is_pending(self) -> bool:
+        return not self.done
+
+    def rate(self) -> float:
+        """
+        Returns the bytes copied per second over the last few seconds, as sampled by FileOperations.poll()
+        """
+        (first_time, first_bytes), (last_time, last_bytes) = self.samples[0], self.samples[-1]
+        return 0.0 if last_time <= first_time else (last_bytes - first_bytes) / (last_time - first_time)
+
+    def touched_dirs(self) -> Set[str]:
+        """
+        Returns the paths of the directories whose entries the job changes
+        """
+        dirs = {os.path.dirname(source) for source in self.sources} if self.kind != OP_COPY else set()
+        if self.destination is not None:
+            dirs.add(self.destination)
+        return dirs
+
+    def fail(self, source: int, path: str, reason: str):
+        """
+        Record an error. Safe to call from any thread
+
+        Parameters:
+
+        - source : :class:`int` --> the index in sources of the source the error is under, or None if it could be under any of them
+        - path : :class:`str` --> the path that could not be processed
+        - reason : :class:`str` --> why
+        """
+        with self.lock:
+            self.num_errors += 1
+            if len(self.errors) < MAX_ERRORS:
+                self.errors.append((path, reason))
+            if source is None:
+                self.failed_sources.update(range(len(self.sources)))
+            else:
+                self.failed_sources.add(source)
+            self.changed = True
+
+    def _add_files(self, num_files: int, num_bytes: int):
+        with self.lock:
+            self.files_total += num_files
+            self.bytes_total += num_bytes
+            self.changed = True
+
+    def _add_done(self, num_files: int, num_bytes: int):
+        with self.lock:
+            self.files_done += num_files
+            self.bytes_done += num_bytes
+            self.changed = True
+
+    def _add_item(self, source: int):
+        with self.lock:
+            self.items_left[source] = self.items_left.get(source, 0) + 1
+
+    def _item_done(self, source: int):
+        # Count a file of a source as processed. The source is copied once it was walked to the end and this was its last file
+        with self.lock:
+            self.items_left[source] -= 1
+            if self.items_left[source] == 0 and source in self.walked_sources:
+                self.copied_sources.add(source)
+
+    def _source_walked(self, source: int):
+        with self.lock:
+            self.walked_sources.add(source)
+            if self.items_left.get(source, 0) == 0:
+                self.copied_sources.add(source)
+
+
+class FileOperations:
+    """
+    Service that copies, moves and deletes files on a pool of worker threads, so the UI stays responsive while
+    gigabytes are processed. Sources are walked on a worker, which hands out the work as it goes: each large
+    file is a task of its own, and small files are grouped into batches so the cost of a task is spread over
+    many of them. Files are copied inside the kernel with copy_file_range, or sendfile where that is not
+    supported, falling back to reads and writes. Moves within a file system are a rename, and across file
+    systems a copy followed by deleting the source. Nothing is ever overwritten: sources whose name is
+    already taken in the destination are reported as errors.
+
+    Progress is handed back to the UI thread through poll().
+
+    Attributes:
+
+    - executor : :class:`ThreadPoolExecutor` --> the pool of worker threads
+    - jobs : :class:`List[OperationJob]` --> jobs that the UI has not been told are done
+    """
+    def __init__(self, max_workers: int = DEFAULT_WORKERS) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fe-ops')
+        self.jobs: List[OperationJob] = []
+
+    def start(self, kind: int, sources: List[str], destination: str = None, protected: str = None, callback: Callable[[OperationJob], None] = None) -> OperationJob:
+        """
+        Start copying or moving sources into destination, or deleting them. Returns the job
+
+        Parameters:
+
+        - kind : :class:`int` --> OP_COPY, OP_MOVE or OP_DELETE
+        - sources : :class:`List[str]` --> the absolute paths of the files and directories to operate on
+        - destination : :class:`str` --> the directory to copy or move sources into. Ignored for OP_DELETE
+        - protected : :class:`str` --> a directory that must not be moved or deleted, such as the one being browsed
+        - callback : :class:`Callable[[OperationJob], None]` --> called on the UI thread each time progress is made, and once the job is done
+        """
+        job = OperationJob(kind, sources, None if kind == OP_DELETE else destination, protected, callback)
+        self.jobs.append(job)
+        self._submit(job, self._plan)
+        return job
+
+    def poll(self) -> int:
+        """
+        Run the callbacks of the jobs that made progress, and drop the jobs that are done. Must be called on the UI thread.
+        Returns the number of jobs that made progress
+        """
+        num_updated = 0
+        now = time.monotonic()
+        for job in list(self.jobs):
+            with job.lock:
+                changed = job.changed
+                job.changed = False
+                finished = job.finished_at is not None
+                job.samples.append((now, job.bytes_done))
+            while len(job.samples) > 2 and now - job.samples[1][0] >= RATE_WINDOW:
+                job.samples.popleft()
+            if finished:
+                self.jobs.remove(job)
+                job.done = True
+            if not changed and not finished:
+                continue
+            num_updated += 1
+            if job.callback is not None:
+                job.callback(job)
+        return num_updated
+
+    def has_pending(self) -> bool:
+        return len(self.jobs) > 0
+
+    def shutdown(self):
+        """
+        Cancel every job and drop the tasks that have not started. Files being copied are removed, so none are left half written
+        """
+        for job in self.jobs:
+            job.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, job: OperationJob, task: Callable, *args):
+        with job.lock:
+            job.tasks_left += 1
+        self.executor.submit(self._run, job, task, args)
+
+    def _run(self, job: OperationJob, task: Callable, args: Tuple):
+        # Run one task of a job. The last task to finish, which is never the walk since it submits the others first, finishes the job
+        try:
+            if not job.cancelled:
+                task(job, *args)
+        except Exception as e:  # Keep the job's count of tasks right whatever goes wrong. Any source may be incomplete, so a move deletes none
+            job.fail(None, OP_NAMES[job.kind], str(e))
+        finally:
+            with job.lock:
+                job.tasks_left -= 1
+                last = job.tasks_left == 0
+            if last:
+                self._finish(job)
+
+    def _plan(self, job: OperationJob):
+        # Walk the sources, handing out batches of work as they are found
+        batch: List[Tuple] = []
+        batch_bytes = 0
+        for i, source in enumerate(job.sources):
+            if job.cancelled:
+                break
+            if job.kind != OP_COPY and job.protected is not None and _is_under(job.protected, source):
+                job.fail(i, source, 'cannot remove the directory being browsed')
+                continue
+            try:
+                if job.kind == OP_DELETE:
+                    items = self._plan_delete(job, i, source)
+                else:
+                    target = os.path.join(job.destination, os.path.basename(source))
+                    if os.path.lexists(target):
+                        job.fail(i, source, f'already exists in {job.destination}')
+                        continue
+                    if _is_under(os.path.realpath(job.destination), os.path.realpath(source)):
+                        job.fail(i, source, 'cannot be put inside itself')
+                        continue
+                    if job.kind == OP_MOVE and self._rename(job, i, source, target):
+                        continue
+                    items = self._plan_copy(job, i, source, target)
+                for item in items:
+                    job._add_item(i)
+                    size = item[3]
+                    if size >= SMALL_FILE_BYTES:
+                        self._submit(job, self._process, [item])
+                        continue
+                    batch.append(item)
+                    batch_bytes += size
+                    if len(batch) >= BATCH_FILES or batch_bytes >= BATCH_BYTES:
+                        self._submit(job, self._process, batch)
+                        batch = []
+                        batch_bytes = 0
+            except Exception as e:  # The rest of this source is not walked, so it is never counted as copied
+                job.fail(i, source, str(e))
+                continue
+            if not job.cancelled:
+                job._source_walked(i)
+        if len(batch) > 0:
+            self._submit(job, self._process, batch)
+        with job.lock:
+            job.planned = True
+            job.changed = True
+
+    def _rename(self, job: OperationJob, i: int, source: str, target: str) -> bool:
+        # Move a source with a single rename. Returns false if it is on another file system, so it must be copied
+        try:
+            os.rename(source, target)
+        except OSError as e:
+            if e.errno == errno.EXDEV:
+                return False
+            job.fail(i, source, e.strerror)
+            return True
+        job._add_files(1, 0)
+        job._add_done(1, 0)
+        return True
+
+    def _plan_copy(self, job: OperationJob, i: int, source: str, target: str) -> Iterator[Tuple]:
+        # Create the directories of a source in the destination as they are walked, and yield a (source index, path, target, size, stat)
+        # for each file to copy. Directories get their permissions and times once their files are copied
+        for path, dest, st in _walk(job, i, source, target, top_down=True):
+            if stat.S_ISDIR(st.st_mode):
+                try:
+                    os.mkdir(dest, 0o700)   # Writable until its files are in
+                except OSError as e:
+                    job.fail(i, path, e.strerror)
+                    continue
+                with job.lock:
+                    job.created_dirs.append((dest, st))
+                continue
+            size = st.st_size if stat.S_ISREG(st.st_mode) else 0
+            job._add_files(1, size)
+            yield (i, path, dest, size, st)
+
+    def _plan_delete(self, job: OperationJob, i: int, source: str) -> Iterator[Tuple]:
+        # Yield a (source index, path, None, 0, stat) for each file under a source. Directories are removed once their files are gone
+        for path, _, st in _walk(job, i, source, None, top_down=False):
+            if stat.S_ISDIR(st.st_mode):
+                with job.lock:
+                    job.removed_dirs.append((i, path))
+                continue
+            job._add_files(1, 0)
+            yield (i, path, None, 0, st)
+
+    def _process(self, job: OperationJob, items: List[Tuple]):
+        # Copy or delete a batch of files
+        for i, path, dest, size, st in items:
+            if job.cancelled:
+                return
+            try:
+                if dest is None:
+                    os.unlink(path)
+                elif stat.S_ISLNK(st.st_mode):
+                    os.symlink(os.readlink(path), dest)
+                elif stat.S_ISREG(st.st_mode):
+                    self._copy_file(job, path, dest, st)
+                else:
+                    raise OSError(errno.EINVAL, 'Not a regular file, directory or symlink')
+            except OSError as e:
+                job.fail(i, path, e.strerror or str(e))
+            except Exception as e:  # Still an error of this file, so its source is not deleted by a move
+                job.fail(i, path, str(e))
+            job._add_done(1, 0)
+            job._item_done(i)
+
+    def _copy_file(self, job: OperationJob, path: str, dest: str, st: os.stat_result):
+        # Copy a regular file with its permissions and times. A file that is not copied completely is removed
+        in_fd = os.open(path, os.O_RDONLY)
+        try:
+            out_fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            try:
+                _copy_data(job, in_fd, out_fd)
+                os.fchmod(out_fd, stat.S_IMODE(st.st_mode))
+            except BaseException:
+                os.close(out_fd)
+                os.unlink(dest)
+                raise
+            os.close(out_fd)
+        finally:
+            os.close(in_fd)
+        if job.cancelled:
+            os.unlink(dest)
+            return
+        os.utime(dest, ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=False)
+
+    def _finish(self, job: OperationJob):
+        # Give copied directories their permissions and times, deepest first, remove the directories of deleted and moved sources,
+        # and mark the job finished for poll()
+        for dest, st in reversed(job.created_dirs):
+            try:
+                os.chmod(dest, stat.S_IMODE(st.st_mode))
+                os.utime(dest, ns=(st.st_atime_ns, st.st_mtime_ns))
+            except OSError:
+                pass
+        if job.kind == OP_MOVE and not job.cancelled:   # Sources copied from another file system are deleted once every file was copied without errors
+            moved = [i for i in sorted(job.copied_sources) if i not in job.failed_sources and os.path.lexists(job.sources[i])]
+            for i in moved:
+                for path, _, st in _walk(job, i, job.sources[i], None, top_down=False):
+                    try:
+                        os.rmdir(path) if stat.S_ISDIR(st.st_mode) else os.unlink(path)
+                    except OSError as e:
+                        job.fail(i, path, e.strerror)
+        for i, path in job.removed_dirs:
+            try:
+                os.rmdir(path)
+            except OSError as e:
+                if not job.cancelled:
+                    job.fail(i, path, e.strerror)
+        with job.lock:
+            job.finished_at = time.monotonic()
+            job.changed = True
+
+def _walk(job: OperationJob, i: int, source: str, target: str, top_down: bool) -> Iterator[Tuple[str, str, os.stat_result]]:
+    # Yield the (path, target path, lstat) of source and everything under it, without following symlinks.
+    # Directories come before their entries if top_down is set, and after them otherwise
+    try:
+        st = os.lstat(source)
+    except OSError as e:
+        job.fail(i, source, e.strerror)
+        return
+    if not stat.S_ISDIR(st.st_mode):
+        yield source, target, st
+        return
+    if top_down:
+        yield source, target, st
+    try:
+        with os.scandir(source) as it:
+            entries = list(it)
+    except OSError as e:
+        job.fail(i, source, e.strerror)
+        entries = []
+    for entry in entries:
+        if job.cancelled:
+            return
+        yield from _walk(job, i, entry.path, None if target is None else os.path.join(target, entry.name), top_down)
+    if not top_down:
+        yield source, target, st
+
+def _copy_data(job: OperationJob, in_fd: int, out_fd: int):
+    # Copy from the current offset of in_fd to the end, a chunk at a time, in the kernel where the file systems allow it
+    copy = _copy_file_range if hasattr(os, 'copy_file_range') else _sendfile
+    while not job.cancelled:
+        try:
+            copied = copy(in_fd, out_fd)
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED or copy is _read_write:
+                raise
+            copy = _sendfile if copy is _copy_file_range else _read_write
+            continue
+        if copied == 0:
+            return
+        job._add_done(0, copied)
+
+def _copy_file_range(in_fd: int, out_fd: int) -> int:
+    return os.copy_file_range(in_fd, out_fd, CHUNK_BYTES)
+
+def _sendfile(in_fd: int, out_fd: int) -> int:
+    return os.sendfile(out_fd, in_fd, None, CHUNK_BYTES)
+
+def _read_write(in_fd: int, out_fd: int) -> int:
+    data = os.read(in_fd, CHUNK_BYTES)
+    view = memoryview(data)
+    while len(view) > 0:
+        view = view[os.write(out_fd, view):]
+    return len(data)
+
+def _is_under(path: str, directory: str) -> bool:
+    # True if path is directory or inside it
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
@@ -0,0 +1,293 @@
+from __future__ import annotations
+from array import array
+from queue import Queue, Empty
+from typing import Callable, List, Tuple
+import os, stat, threading
+
+READ_SIZE = 65536           # Bytes read at a time while looking for the starts of lines
+MAX_LINE_BYTES = 4096       # Lines longer than this are cut into pieces of this many bytes, so a file without newlines still pages
+SNIFF_BYTES = 8192          # Bytes at the start of a file checked to tell binary files from text
+HEX_WIDTH = 16              # Bytes per line of a hex dump
+TAB_SIZE = 8
+
+class FilePreview:
+    """
+    The lines of a file, read on demand with bounded reads at their offsets. Opening a file reads only its first
+    few kilobytes, and each page of lines reads just those lines, so a file of any size previews in constant time
+    and memory. The starts of lines are found as the preview pages forward, and remembered so paging back reads
+    nothing more. Files with NUL bytes near the start are shown as a hex dump, whose lines are at fixed offsets.
+
+    Files are read rather than mapped, since touching a mapped page after the file was truncated, as when a log
+    is rotated, kills the process.
+
+    Attributes:
+
+    - path : :class:`str` --> the path of the file
+    - fd : :class:`int` --> the open file
+    - size : :class:`int` --> the size of the file in bytes when it was opened
+    - is_binary : :class:`bool` --> True if the file is shown as a hex dump
+    - encoding : :class:`str` --> 'utf-8' if the start of the file is valid UTF-8, and 'latin-1' otherwise. None for binary files
+    - line_starts : :class:`array` --> the offset of each line found so far, followed by the offset the next line would start at
+    - complete : :class:`bool` --> True once every line has been found
+    """
+    def __init__(self, path: str, fd: int, size: int, sniff: bytes) -> None:
+        self.path = path
+        self.fd = fd
+        self.size = size
+        self.is_binary = b'\0' in sniff
+        self.encoding = None if self.is_binary else _guess_encoding(sniff, size)
+        self.line_starts = array('Q', [0])
+        self.complete = size == 0
+
+    @staticmethod
+    def open(path: str) -> FilePreview:
+        """
+        Open a regular file for previewing. Raises OSError if it cannot be read, or is not a regular file,
+        since reading a FIFO or device could block forever
+
+        Parameters:
+
+        - path : :class:`str` --> the path of the file
+        """
+        st = os.stat(path)
+        if not stat.S_ISREG(st.st_mode):
+            raise OSError(f'Not a regular file: {path}')
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            return FilePreview(path, fd, st.st_size, os.pread(fd, SNIFF_BYTES, 0))
+        except OSError:
+            os.close(fd)
+            raise
+
+    def get_lines(self, first: int, count: int) -> Tuple[int, List[str]]:
+        """
+        Returns up to count lines from line first, ready to draw: decoded, with tabs expanded and control
+        characters replaced. Past the end, the last page is returned instead, along with the line it starts at
+
+        Parameters:
+
+        - first : :class:`int` --> the index of the first line
+        - count : :class:`int` --> the number of lines
+        """
+        if self.is_binary:
+            num_lines = -(-self.size // HEX_WIDTH)
+            first = max(0, min(first, num_lines - count))
+            data = os.pread(self.fd, count * HEX_WIDTH, first * HEX_WIDTH)
+            return first, [_hex_line((first + i) * HEX_WIDTH, data[i * HEX_WIDTH:(i + 1) * HEX_WIDTH])
+                           for i in range(-(-len(data) // HEX_WIDTH))]
+        self._find_lines(first + count)
+        num_found = len(self.line_starts) - 1
+        if first + count > num_found and self.complete:
+            first = max(0, min(first, num_found - count))
+        last = min(first + count, num_found)
+        if first >= last:
+            return first, []
+        starts = self.line_starts
+        data = os.pread(self.fd, starts[last] - starts[first], starts[first])
+        lines = []
+        for i in range(first, last):
+            raw = data[starts[i] - starts[first]:starts[i + 1] - starts[first]].rstrip(b'\r\n')
+            lines.append(_printable(raw.decode(self.encoding, 'replace').expandtabs(TAB_SIZE)))
+        return first, lines
+
+    def close(self):
+        os.close(self.fd)
+
+    def _find_lines(self, num_lines: int):
+        # Find the starts of lines until num_lines are known or the end of the file is reached, reading forward from the last start found
+        starts = self.line_starts
+        while len(starts) <= num_lines and not self.complete:
+            offset = starts[-1]
+            data = os.pread(self.fd, READ_SIZE, offset)
+            at_end = len(data) < READ_SIZE
+            pos = 0
+            while len(starts) <= num_lines:
+                newline = data.find(b'\n', pos, pos + MAX_LINE_BYTES)
+                if newline >= 0:
+                    pos = newline + 1
+                elif pos + MAX_LINE_BYTES <= len(data):    # Too long, so cut it
+                    pos += MAX_LINE_BYTES
+                elif at_end:    # Last line, without a newline
+                    if pos < len(data):
+                        starts.append(offset + len(data))
+                    self.complete = True
+                    break
+                else:   # Rest of the line is in the next read
+                    break
+                starts.append(offset + pos)
+                if at_end and pos == len(data):
+                    self.complete = True
+                    break
+
+
+class PreviewJob:
+    """
+    A request for a page of lines of a file, read on the preview worker.
+
+    Attributes:
+
+    - path : :class:`str` --> the path of the file
+    - first_line : :class:`int` --> the index of the first line wanted. Once read, the index of the first line returned
+    - num_lines : :class:`int` --> the number of lines wanted
+    - callback : :class:`Callable[[PreviewJob], None]` --> called on the UI thread once the lines have been read
+    - lines : :class:`List[str]` --> the lines read, or None until then
+    - is_binary : :class:`bool` --> True if the lines are a hex dump
+    - error : :class:`str` --> why the file could not be read, or None
+    - ready : :class:`threading.Event` --> set once the job has been read
+    - cancelled : :class:`bool` --> True if the results are no longer wanted
+    - done : :class:`bool` --> True once the results have been polled
+    """
+    def __init__(self, path: str, first_line: int, num_lines: int, callback: Callable[[PreviewJob], None] = None) -> None:
+        self.path = path
+        self.first_line = first_line
+        self.num_lines = num_lines
+        self.callback = callback
+        self.lines: List[str] = None
+        self.is_binary = False
+        self.error: str = None
+        self.ready = threading.Event()
+        self.cancelled = False
+        self.done = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def is_pending(self) -> bool:
+        return not self.cancelled and not self.done
+
+
+class FilePreviewer:
+    """
+    Service that reads pages of files on a worker thread, so a slow disk never blocks the UI. Only the most
+    recent request is read, and one still waiting when another comes in is dropped. The worker keeps the last
+    file open, so paging through it only reads the new lines. Results are handed back through poll().
+
+    Attributes:
+
+    - preview : :class:`FilePreview` --> the file open on the worker, or None. Only used by the worker
+    - waiting : :class:`PreviewJob` --> the request waiting to be read, or None
+    - completed : :class:`Queue` --> jobs read and waiting to be polled
+    """
+    def __init__(self) -> None:
+        self.preview: FilePreview = None
+        self.waiting: PreviewJob = None
+        self.completed: Queue = Queue()
+        self.condition = threading.Condition()
+        self.worker: threading.Thread = None
+        self.stopping = False
+
+    def request(self, path: str, first_line: int, num_lines: int, callback: Callable[[PreviewJob], None] = None) -> PreviewJob:
+        """
+        Read a page of lines of a file in the background, dropping any request still waiting. Returns the job
+
+        Parameters:
+
+        - path : :class:`str` --> the path of the file
+        - first_line : :class:`int` --> the index of the first line to read
+        - num_lines : :class:`int` --> the number of lines to read
+        - callback : :class:`Callable[[PreviewJob], None]` --> called on the UI thread once the lines have been read
+        """
+        job = PreviewJob(path, first_line, num_lines, callback)
+        with self.condition:
+            if self.waiting is not None:
+                self.waiting.cancel()
+            self.waiting = job
+            self.condition.notify()
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._work, name='fe-preview', daemon=True)
+            self.worker.start()
+        return job
+
+    def wait_for(self, job: PreviewJob, timeout: float) -> bool:
+        """
+        Block until a job has been read, then poll for results. Returns true if it was read within the timeout
+
+        Parameters:
+
+        - job : :class:`PreviewJob` --> the job to wait for
+        - timeout : :class:`float` --> the longest time in seconds to wait
+        """
+        ready = job.ready.wait(timeout)
+        self.poll()
+        return ready
+
+    def poll(self) -> int:
+        """
+        Run the callbacks of the jobs that have been read. Must be called from the UI thread.
+        Returns the number of jobs whose results were used
+        """
+        applied = 0
+        while True:
+            try:
+                job = self.completed.get_nowait()
+            except Empty:
+                return applied
+            if job.cancelled:
+                continue
+            job.done = True
+            applied += 1
+            if job.callback is not None:
+                job.callback(job)
+
+    def has_pending(self) -> bool:
+        return self.waiting is not None or not self.completed.empty()
+
+    def shutdown(self):
+        with self.condition:
+            self.stopping = True
+            self.waiting = None
+            self.condition.notify()
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while self.waiting is None and not self.stopping:
+                    self.condition.wait()
+                if self.stopping:
+                    break
+                job = self.waiting
+                self.waiting = None
+            if not job.cancelled:
+                self._read(job)
+            job.ready.set()
+            self.completed.put(job)
+        if self.preview is not None:
+            self.preview.close()
+
+    def _read(self, job: PreviewJob):
+        # Read the lines of a job, opening its file first if another one is open
+        try:
+            if self.preview is None or self.preview.path != job.path:
+                if self.preview is not None:
+                    self.preview.close()
+                    self.preview = None
+                self.preview = FilePreview.open(job.path)
+            job.first_line, job.lines = self.preview.get_lines(job.first_line, job.num_lines)
+            job.is_binary = self.preview.is_binary
+        except OSError as e:
+            job.error = e.strerror or str(e)
+            job.lines = []
+
+
+def _guess_encoding(sniff: bytes, size: int) -> str:
+    # UTF-8 if the start of the file decodes as UTF-8, allowing for a character cut off at the end of the sample
+    try:
+        sniff.decode('utf-8')
+    except UnicodeDecodeError as e:
+        if not (len(sniff) < size and e.start >= len(sniff) - 3 and e.reason == 'unexpected end of data'):
+            return 'latin-1'
+    return 'utf-8'
+
+def _printable(text: str) -> str:
+    # Replace control characters, which would move the cursor or change the terminal's state
+    if text.isprintable():
+        return text
+    return ''.join(ch if ch.isprintable() else '?' for ch in text)
+
+def _hex_line(offset: int, data: bytes) -> str:
+    # One line of a hex dump, like hexdump -C
+    hex_bytes = data.hex(' ')
+    if len(data) > 8:
+        hex_bytes = hex_bytes[:23] + ' ' + hex_bytes[23:]
+    text = ''.join(chr(b) if 32 <= b < 127 else '.' for b in data)
+    return f'{offset:08x}  {hex_bytes:<49} |{text}|'
@@ -0,0 +1,213 @@
+from __future__ import annotations
+from typing import Dict, List, Set, Tuple
+import os, struct, time
+
+FRECENCY_FILENAME = 'frecency.bin'
+BAD_STORE_SUFFIX = '.bad'     # Added to the name of a file that could not be read back, which is moved aside rather than overwritten
+DEFAULT_MAX_TOTAL_RANK = 10000  # Once the ranks add up to more than this, every rank is aged
+AGING_FACTOR = 0.9              # Share of its rank a directory keeps each time ranks are aged. Directories left below 1 are forgotten
+HOUR = 3600
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+
+# File of saved visits: a header, then one record per directory, each a RECORD_HEADER followed by the directory's path.
+# Native byte order is used, since the file is only read on the machine that wrote it
+STORE_MAGIC = b'FEFR'
+STORE_VERSION = 1
+STORE_HEADER = struct.Struct('=4sI')    # magic, version
+RECORD_HEADER = struct.Struct('=dqI')   # rank, time of last visit in seconds, path length
+
+MATCH_PREFIX = 0    # The directory's name starts with the query
+MATCH_SUBSTRING = 1 # The path contains the query
+MATCH_FUZZY = 2     # The path contains the characters of the query in order
+
+class FrecencyStore:
+    """
+    The directories visited most often and most recently, ranked like zoxide: each visit adds one to a directory's
+    rank, and the rank counts for more the more recent the last visit was. Ranks are aged as they grow, so
+    directories no longer visited are eventually forgotten and the store stays small.
+
+    The store is saved to a compact binary file on shutdown, and only read back the first time it is searched,
+    so recording visits costs nothing at startup. Visits recorded before then are added to the saved ranks.
+    Saving reads the file again and adds only the visits recorded since, so runs open at the same time don't
+    overwrite each other's visits.
+
+    Attributes:
+
+    - store_path : :class:`str` --> the file visits are saved to and loaded from between runs, or None to keep them in memory only
+    - max_total_rank : :class:`int` --> the total of the ranks above which every rank is aged
+    - ranks : :class:`Dict[str, Tuple[float, int]]` --> the (rank, time of last visit in seconds) of each directory, by its absolute path
+    - loaded : :class:`bool` --> True once the visits saved by previous runs have been read
+    - deltas : :class:`Dict[str, Tuple[int, int]]` --> the (number of visits, time of last visit in seconds) of each directory visited since the store was last saved
+    - removed : :class:`Set[str]` --> the directories forgotten since the store was last saved
+    """
+    def __init__(self, store_path: str = None, max_total_rank: int = DEFAULT_MAX_TOTAL_RANK) -> None:
+        self.store_path = store_path
+        self.max_total_rank = max_total_rank
+        self.ranks: Dict[str, Tuple[float, int]] = {}
+        self.loaded = store_path is None
+        self.deltas: Dict[str, Tuple[int, int]] = {}
+        self.removed: Set[str] = set()
+
+    def visit(self, path: str):
+        """
+        Record a visit to a directory
+
+        Parameters:
+
+        - path : :class:`str` --> the absolute path of the directory
+        """
+        now = int(time.time())
+        rank, _ = self.ranks.get(path, (0.0, 0))
+        self.ranks[path] = (rank + 1, now)
+        visits, _ = self.deltas.get(path, (0, 0))
+        self.deltas[path] = (visits + 1, now)
+        if self.loaded:
+            self._age()
+
+    def remove(self, path: str):
+        """
+        Forget a directory, such as one that no longer exists
+        """
+        self._load()
+        self.ranks.pop(path, None)
+        self.deltas.pop(path, None)
+        self.removed.add(path)
+
+    def matches(self, query: str) -> List[str]:
+        """
+        Returns the paths of the directories matching query, ignoring case, best first. Directories whose names start
+        with query come first, then those whose paths contain it, then those whose paths contain its characters in order.
+        Within each group, directories are ordered by frecency. An empty query matches every directory
+
+        Parameters:
+
+        - query : :class:`str` --> the text to match against the paths
+        """
+        self._load()
+        query = query.lower()
+        now = int(time.time())
+        ranked = []
+        for path, (rank, last_visit) in self.ranks.items():
+            match = _match(query, path.lower())
+            if match is not None:
+                ranked.append((match, -_frecency(rank, last_visit, now), path))
+        ranked.sort()
+        return [path for _, _, path in ranked]
+
+    def save(self):
+        """
+        Write the ranks to store_path for the next run. The file is read again first, and only the visits and removals
+        since the last save are applied to it, so ranks saved meanwhile by other runs are kept. The file is replaced
+        atomically, so a concurrent run never reads a partial file. A file that cannot be decoded, such as one truncated
+        or written by another version, is moved aside with BAD_STORE_SUFFIX added to its name instead of being lost.
+        """
+        if self.store_path is None:
+            return
+        try:
+            stored = self._read_store()
+        except OSError:     # Can't be read, so it isn't replaced either
+            return
+        except (ValueError, struct.error):  # Corrupt or from another version. Kept beside the new file rather than lost
+            try:
+                os.replace(self.store_path, self.store_path + BAD_STORE_SUFFIX)
+            except OSError:
+                return
+            stored = {}
+        self.ranks = stored
+        for path in self.removed:
+            self.ranks.pop(path, None)
+        for path, (visits, last_visit) in self.deltas.items():
+            rank, stored_visit = self.ranks.get(path, (0.0, 0))
+            self.ranks[path] = (rank + visits, max(last_visit, stored_visit))
+        self.loaded = True
+        self._age()
+        chunks = [STORE_HEADER.pack(STORE_MAGIC, STORE_VERSION)]
+        for path, (rank, last_visit) in self.ranks.items():
+            path_bytes = os.fsencode(path)
+            chunks.append(RECORD_HEADER.pack(rank, last_visit, len(path_bytes)))
+            chunks.append(path_bytes)
+        temp_path = f'{self.store_path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.store_path), exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                f.writelines(chunks)
+            os.replace(temp_path, self.store_path)
+            self.deltas = {}    # Saved, so the next save doesn't add them again
+            self.removed = set()
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def _load(self):
+        # Add the ranks saved by previous runs to the visits recorded so far, the first time they are needed.
+        # A missing or unreadable file is ignored here, and dealt with by save()
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            stored = self._read_store()
+        except (OSError, ValueError, struct.error):
+            return
+        for path, (rank, last_visit) in stored.items():
+            new_rank, new_visit = self.ranks.get(path, (0.0, 0))
+            self.ranks[path] = (rank + new_rank, max(last_visit, new_visit))
+        self._age()
+
+    def _read_store(self) -> Dict[str, Tuple[float, int]]:
+        # The ranks saved in store_path, or none if there is no file yet. Raises OSError if it cannot be read,
+        # and ValueError or struct.error if it is not a valid file of this version
+        try:
+            with open(self.store_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return {}
+        return _decode_records(data)
+
+    def _age(self):
+        # Scale every rank down once they add up to too much, forgetting directories left with a rank below 1
+        if sum(rank for rank, _ in self.ranks.values()) <= self.max_total_rank:
+            return
+        self.ranks = {path: (rank * AGING_FACTOR, last_visit) for path, (rank, last_visit) in self.ranks.items() if rank * AGING_FACTOR >= 1}
+
+def _frecency(rank: float, last_visit: int, now: int) -> float:
+    # Rank weighted by how recently the directory was last visited, as in zoxide
+    age = now - last_visit
+    if age < HOUR:
+        return rank * 4
+    if age < DAY:
+        return rank * 2
+    if age < WEEK:
+        return rank / 2
+    return rank / 4
+
+def _match(query: str, path: str) -> int:
+    # The MATCH_ constant of the best way a lowercased path matches a lowercased query, or None if it does not match
+    if path[path.rfind(os.sep) + 1:].startswith(query):
+        return MATCH_PREFIX
+    if query in path:
+        return MATCH_SUBSTRING
+    end = 0
+    for c in query:
+        end = path.find(c, end) + 1
+        if end == 0:
+            return None
+    return MATCH_FUZZY
+
+def _decode_records(data: bytes) -> Dict[str, Tuple[float, int]]:
+    # Read the (rank, last visit) of each directory in a file of saved visits
+    magic, version = STORE_HEADER.unpack_from(data, 0)
+    if magic != STORE_MAGIC or version != STORE_VERSION:
+        raise ValueError('Not a frecency file of this version')
+    ranks = {}
+    offset = STORE_HEADER.size
+    while offset < len(data):
+        rank, last_visit, path_len = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        if offset + path_len > len(data):
+            raise ValueError('Truncated frecency file')
+        ranks[os.fsdecode(data[offset:offset + path_len])] = (rank, last_visit)
+        offset += path_len
+    return ranks
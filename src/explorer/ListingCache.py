@@ -0,0 +1,287 @@
+from __future__ import annotations
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+from src.explorer.FileEntry import ChildTable
+import os, struct, sys, threading, time
+
+DEFAULT_MAX_ENTRIES = 500000
+RACY_WINDOW_NS = 2 * 10**9  # Listings of directories modified this recently may miss a change made in the same mtime tick
+LISTINGS_FILENAME = 'listings.bin'
+
+# File of saved listings: a header, then one record per directory. Each record is a RECORD_HEADER,
+# the directory's path, the inode of each entry, and the names of the entries separated by NUL bytes.
+# Records hold entries in table order, directories first, so reading one back needs no sorting.
+# Native byte order is used, since the file is only read on the machine that wrote it
+STORE_MAGIC = b'FELC'
+STORE_VERSION = 1
+STORE_HEADER = struct.Struct('=4sI')        # magic, version
+RECORD_HEADER = struct.Struct('=qQQIIII')   # mtime_ns, inode, device, path length, number of entries, number of directories, length of names
+
+class CachedListing:
+    """
+    The children of a directory, along with the stat data used to check they are still up to date.
+
+    Attributes:
+
+    - mtime_ns : :class:`int` --> st_mtime_ns of the directory when it was scanned
+    - inode : :class:`int` --> st_ino of the directory when it was scanned
+    - device : :class:`int` --> st_dev of the directory when it was scanned
+    - children : :class:`ChildTable` --> the sorted file entries in the directory
+    - num_entries : :class:`int` --> number of entries counted against the cache's budget
+    """
+    __slots__ = ('mtime_ns', 'inode', 'device', 'children', 'num_entries')
+
+    def __init__(self, st: os.stat_result, children: ChildTable) -> None:
+        self.mtime_ns = st.st_mtime_ns
+        self.inode = st.st_ino
+        self.device = st.st_dev
+        self.children = children
+        self.num_entries = len(children)
+
+    def is_valid(self, st: os.stat_result) -> bool:
+        """
+        Returns true if the directory has not changed since it was scanned
+
+        Parameters:
+
+        - st : :class:`os.stat_result` --> the current stat data of the directory
+        """
+        return st.st_mtime_ns == self.mtime_ns and st.st_ino == self.inode and st.st_dev == self.device
+
+
+class ListingCache:
+    """
+    Least-recently-used cache of directory listings, keyed on path and validated against the
+    directory's mtime and inode. Safe to use from several threads.
+
+    Attributes:
+
+    - max_entries : :class:`int` --> the total number of file entries that can be cached across all listings
+    - total_entries : :class:`int` --> the number of file entries currently cached
+    - listings : :class:`OrderedDict[str, CachedListing]` --> cached listings, from least to most recently used
+    - store_path : :class:`str` --> the file listings are saved to and loaded from between runs, or None to keep them in memory only
+    - stored : :class:`Dict[str, Tuple[int, int]]` --> for each listing loaded from store_path that has not been used yet, the offset
+    and length of its record in stored_data. Records are only decoded when they are used and still valid
+    - stored_data : :class:`bytes` --> the contents of store_path when it was loaded
+    """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, store_path: str = None) -> None:
+        self.max_entries = max_entries
+        self.total_entries = 0
+        self.listings: OrderedDict[str, CachedListing] = OrderedDict()
+        self.store_path = store_path
+        self.stored: Dict[str, Tuple[int, int]] = {}
+        self.stored_data = b''
+        self.lock = threading.Lock()
+
+    def get(self, path: str, st: os.stat_result) -> ChildTable:
+        """
+        Returns the cached children of the directory at path, or None if there is no listing for it
+        or the directory has changed since it was cached.
+
+        Parameters:
+
+        - path : :class:`str` --> the absolute path of the directory
+        - st : :class:`os.stat_result` --> the current stat data of the directory
+        """
+        with self.lock:
+            listing = self.listings.get(path)
+            if listing is None:
+                listing = self._take_stored(path, st)
+                if listing is None:
+                    return None
+            if not listing.is_valid(st):
+                self._remove(path)
+                return None
+            self.listings.move_to_end(path)
+            return listing.children
+
+    def put(self, path: str, st: os.stat_result, children: ChildTable, evict: bool = True) -> bool:
+        """
+        Cache the children of a directory, evicting the least recently used listings if the cache is full.
+        Listings of directories modified within the last RACY_WINDOW_NS are not cached, since a change
+        made in the same mtime tick would go unnoticed.
+
+        Returns true if the listing was cached
+
+        Parameters:
+
+        - path : :class:`str` --> the absolute path of the directory
+        - st : :class:`os.stat_result` --> the stat data of the directory, taken before it was scanned
+        - children : :class:`ChildTable` --> the sorted file entries in the directory
+        - evict : :class:`bool` --> if False, the listing is only cached if it fits without evicting others, such as for a listing that may never be used
+        """
+        if time.time_ns() - st.st_mtime_ns < RACY_WINDOW_NS or len(children) > self.max_entries:
+            return False
+        with self.lock:
+            if not evict and self.total_entries + len(children) > self.max_entries:
+                return False
+            self._remove(path)
+            self.listings[path] = CachedListing(st, children)
+            self.total_entries += len(children)
+            self._evict()
+            return True
+
+    def contains(self, path: str) -> bool:
+        """
+        Returns true if there is a listing for the directory at path, without checking that it is still valid
+        """
+        with self.lock:
+            return path in self.listings or path in self.stored
+
+    def restamp(self, path: str, st: os.stat_result, children: ChildTable):
+        """
+        Mark a cached listing that was edited in place as up to date with the directory's new stat data.
+        Nothing is done if the cache holds a different listing for the path.
+
+        Parameters:
+
+        - path : :class:`str` --> the absolute path of the directory
+        - st : :class:`os.stat_result` --> the stat data of the directory, taken before the changes applied to the listing were read
+        - children : :class:`ChildTable` --> the listing that was edited
+        """
+        with self.lock:
+            listing = self.listings.get(path)
+            if listing is None or listing.children is not children:
+                return
+            if time.time_ns() - st.st_mtime_ns < RACY_WINDOW_NS:
+                self._remove(path)
+                return
+            self._remove(path)
+            self.listings[path] = CachedListing(st, children)
+            self.total_entries += len(children)
+            self._evict()
+
+    def invalidate(self, path: str):
+        """
+        Drop the cached listing for a directory, if there is one
+        """
+        with self.lock:
+            self._remove(path)
+
+    def load(self):
+        """
+        Read the listings saved by a previous run from store_path. Only the position of each record
+        is read, so loading stays fast however many listings were saved. A missing or unreadable file is ignored.
+        """
+        if self.store_path is None:
+            return
+        try:
+            with open(self.store_path, 'rb') as f:
+                data = f.read()
+            stored = _index_records(data)
+        except (OSError, ValueError, struct.error):
+            return
+        with self.lock:
+            self.stored_data = data
+            self.stored = stored
+
+    def save(self):
+        """
+        Write the cached listings to store_path for the next run, most recently used first, up to
+        max_entries entries in total. Listings loaded from the file and not used in this run are kept
+        as they were. The file is replaced atomically, so a concurrent run never reads a partial file.
+        """
+        if self.store_path is None:
+            return
+        with self.lock:
+            listings = list(self.listings.items())
+            stored = list(self.stored.items())
+            data = self.stored_data
+        chunks = [STORE_HEADER.pack(STORE_MAGIC, STORE_VERSION)]
+        num_entries = 0
+        for path, listing in reversed(listings):
+            if num_entries + listing.num_entries > self.max_entries:
+                break
+            chunks.append(_encode_record(path, listing))
+            num_entries += listing.num_entries
+        for path, (offset, length) in stored:
+            record_entries = RECORD_HEADER.unpack_from(data, offset)[4]
+            if num_entries + record_entries > self.max_entries:
+                break
+            chunks.append(data[offset:offset + length])
+            num_entries += record_entries
+        temp_path = f'{self.store_path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.store_path), exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                f.writelines(chunks)
+            os.replace(temp_path, self.store_path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def _take_stored(self, path: str, st: os.stat_result) -> CachedListing:
+        # Decode a listing loaded from disk if it is still valid, moving it into the in-memory cache.
+        # Must be called with the lock held
+        record = self.stored.pop(path, None)
+        if record is None:
+            return None
+        offset, _ = record
+        mtime_ns, inode, device, path_len, num_entries, num_dirs, names_len = RECORD_HEADER.unpack_from(self.stored_data, offset)
+        if st.st_mtime_ns != mtime_ns or st.st_ino != inode or st.st_dev != device:
+            return None
+        offset += RECORD_HEADER.size + path_len
+        inodes = array('Q', self.stored_data[offset:offset + 8 * num_entries])
+        offset += 8 * num_entries
+        names = _decode_names(self.stored_data[offset:offset + names_len]) if num_entries > 0 else []
+        listing = CachedListing(st, ChildTable.from_sorted(None, names, inodes, num_dirs))
+        self.listings[path] = listing
+        self.total_entries += num_entries
+        self._evict()
+        return listing
+
+    def _remove(self, path: str):
+        self.stored.pop(path, None)
+        listing = self.listings.pop(path, None)
+        if listing is not None:
+            self.total_entries -= listing.num_entries
+
+    def _evict(self):
+        while self.total_entries > self.max_entries:
+            _, evicted = self.listings.popitem(last=False)
+            self.total_entries -= evicted.num_entries
+
+def _encode_record(path: str, listing: CachedListing) -> bytes:
+    children = listing.children
+    path_bytes = os.fsencode(path)
+    names, inodes = children.in_name_order()  # Records are read back with from_sorted
+    names = '\0'.join(names).encode(sys.getfilesystemencoding(), sys.getfilesystemencodeerrors())
+    header = RECORD_HEADER.pack(listing.mtime_ns, listing.inode, listing.device, len(path_bytes), len(children), children.num_dirs, len(names))
+    return b''.join((header, path_bytes, inodes.tobytes(), names))
+
+def _decode_names(data: bytes) -> List[str]:
+    # Decoding every name in one call is several times faster than calling os.fsdecode on each
+    return data.decode(sys.getfilesystemencoding(), sys.getfilesystemencodeerrors()).split('\0')
+
+def _index_records(data: bytes) -> Dict[str, Tuple[int, int]]:
+    # Find the offset and length of each record in a file of saved listings
+    magic, version = STORE_HEADER.unpack_from(data, 0)
+    if magic != STORE_MAGIC or version != STORE_VERSION:
+        raise ValueError('Not a listing file of this version')
+    records = {}
+    offset = STORE_HEADER.size
+    while offset < len(data):
+        _, _, _, path_len, num_entries, _, names_len = RECORD_HEADER.unpack_from(data, offset)
+        length = RECORD_HEADER.size + path_len + 8 * num_entries + names_len
+        if offset + length > len(data):
+            raise ValueError('Truncated listing file')
+        path_start = offset + RECORD_HEADER.size
+        records[os.fsdecode(data[path_start:path_start + path_len])] = (offset, length)
+        offset += length
+    return records
+
+def user_cache_dir() -> str:
+    """
+    Returns the directory to keep files cached between runs in, following the conventions of the platform.
+    The directory may not exist yet.
+    """
+    if sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    elif sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'fe')
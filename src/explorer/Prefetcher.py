@@ -0,0 +1,132 @@
+from __future__ import annotations
+from typing import Callable, List
+from src.explorer.FileEntry import Directory, ChildTable
+from src.explorer.ListingCache import ListingCache
+import os, threading, time
+
+DEFAULT_REACH = 2               # Number of sibling directories to prefetch on each side of the selection
+DEFAULT_MAX_LISTING = 20000     # Directories with more entries than this are not prefetched
+DEFAULT_MAX_ENTRIES = 50000     # Number of entries read for each set of targets, across all of its directories
+BUSY_BACKOFF = 0.05             # Time in seconds to wait before checking again whether the foreground scanner is idle
+IDLE_AFTER = 10.0               # Time in seconds after which targets are dropped if they have not been replaced
+NICENESS = 10                   # How much to lower the priority of the prefetch thread, where priorities are per thread
+
+class Prefetcher:
+    """
+    Service that reads directories the user is likely to open next on a low priority thread, and saves
+    their listings to the listing cache. Scans of those directories then find them in the cache, and
+    peeks can show them without waiting for a worker.
+
+    Prefetching stays within a budget. Each set of targets reads at most max_entries entries, directories
+    larger than max_listing are skipped, and listings are only cached if they fit without evicting any
+    listing that was actually used. Work pauses while the foreground scanner is busy, and targets are
+    dropped once the user has been idle for IDLE_AFTER seconds.
+
+    Attributes:
+
+    - cache : :class:`ListingCache` --> the cache that prefetched listings are saved to
+    - is_busy : :class:`Callable[[], bool]` --> returns true while foreground scans are running, which prefetching waits for
+    - max_listing : :class:`int` --> the largest directory, in entries, that is prefetched
+    - max_entries : :class:`int` --> the number of entries that may be read for each set of targets
+    - targets : :class:`List[str]` --> paths of the directories waiting to be prefetched, most likely first
+    - targets_set_at : :class:`float` --> time.monotonic() when targets was last replaced
+    - budget : :class:`int` --> entries that may still be read for the current targets
+    - dirs_read : :class:`int` --> number of directories read and cached so far
+    - entries_read : :class:`int` --> number of entries read so far, including those of directories that were skipped
+    - dirs_skipped : :class:`int` --> number of directories that were too large for the budget, or did not fit in the cache
+    """
+    def __init__(self, cache: ListingCache, is_busy: Callable[[], bool], max_listing: int = DEFAULT_MAX_LISTING,
+                 max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.cache = cache
+        self.is_busy = is_busy
+        self.max_listing = max_listing
+        self.max_entries = max_entries
+        self.targets: List[str] = []
+        self.targets_set_at = 0.0
+        self.budget = 0
+        self.dirs_read = 0
+        self.entries_read = 0
+        self.dirs_skipped = 0
+        self.condition = threading.Condition()
+        self.worker: threading.Thread = None
+        self.stopping = False
+
+    def prefetch(self, paths: List[str]):
+        """
+        Replace the directories waiting to be prefetched, and give them a fresh budget. Directories already
+        in the cache are skipped at the cost of a stat() call each.
+
+        Parameters:
+
+        - paths : :class:`List[str]` --> absolute paths of the directories to prefetch, most likely to be opened first
+        """
+        with self.condition:
+            self.targets = list(reversed(paths))    # Popped from the end
+            self.targets_set_at = time.monotonic()
+            self.budget = self.max_entries
+            self.condition.notify()
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._work, name='fe-prefetch', daemon=True)
+            self.worker.start()
+
+    def shutdown(self):
+        with self.condition:
+            self.stopping = True
+            self.targets = []
+            self.condition.notify()
+
+    def _work(self):
+        try:    # On Linux each thread has its own priority, which also lowers its I/O priority
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), NICENESS)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            with self.condition:
+                while not self.stopping and not self._has_work():
+                    self.condition.wait()
+                if self.stopping:
+                    return
+                if time.monotonic() - self.targets_set_at >= IDLE_AFTER:    # User stopped moving, so the targets are no longer likely
+                    self.targets = []
+                    continue
+            if self.is_busy():  # Leave the disk to the scans the user is waiting for
+                time.sleep(BUSY_BACKOFF)
+                continue
+            with self.condition:
+                if not self._has_work():    # Replaced while backing off
+                    continue
+                path = self.targets.pop()
+            self._read(path)
+
+    def _has_work(self) -> bool:
+        # Must be called with the condition held
+        return len(self.targets) > 0 and self.budget > 0
+
+    def _read(self, path: str):
+        # Read a directory into the cache, unless it is cached already or is too large
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        if self.cache.get(path, st) is not None:
+            return
+        with self.condition:
+            limit = min(self.max_listing, self.budget)
+        directory = Directory.at(path)
+        children = ChildTable(directory)
+        num_read = 0
+        try:
+            for table in directory.stream_contents(first_batch=limit):   # First table comes once limit entries are read
+                num_read = len(table)
+                if num_read > limit:
+                    break
+                children = table
+        except OSError:
+            return
+        with self.condition:
+            self.budget -= num_read
+            self.entries_read += num_read
+            if num_read > limit or not self.cache.put(path, st, children, evict=False):
+                self.dirs_skipped += 1
+            else:
+                self.dirs_read += 1
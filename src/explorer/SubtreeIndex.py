@@ -0,0 +1,362 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from queue import Queue, Empty
+from typing import Callable, Dict, List, Tuple
+from src.explorer.FileEntry import KIND_DIR, KIND_FILE
+from src.explorer.ListingCache import RACY_WINDOW_NS, user_cache_dir
+import os, sqlite3, threading, time
+
+KIND_LINKED_DIR = 2     # Symbolic link to a directory. Listed like a directory, but not descended into
+INDEX_FILENAME = 'index.sqlite3'
+COMMIT_INTERVAL = 0.5   # Longest time in seconds between commits while updating, so searches see the progress
+DEFAULT_MAX_WORKERS = 8
+SEARCH_LIMIT = 200
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS dirs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    dir_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    kind INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_dir_id ON entries (dir_id);
+'''
+
+class IndexUpdate:
+    """
+    Progress of a walk that brings the index of a subtree up to date.
+
+    Attributes:
+
+    - root : :class:`str` --> the absolute path of the directory at the top of the subtree
+    - dirs_scanned : :class:`int` --> number of directories that were read because they changed since they were indexed
+    - dirs_reused : :class:`int` --> number of directories whose indexed entries were still up to date
+    - dirs_failed : :class:`int` --> number of directories that could not be stored, and are left out with everything under them
+    - done : :class:`bool` --> True once every directory in the subtree has been visited
+    - stopping : :class:`bool` --> True if the walk was asked to stop early
+    """
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.dirs_scanned = 0
+        self.dirs_reused = 0
+        self.dirs_failed = 0
+        self.done = False
+        self.stopping = False
+
+    def dirs_visited(self) -> int:
+        return self.dirs_scanned + self.dirs_reused
+
+
+class SearchJob:
+    """
+    A search of the index, run on the search worker.
+
+    Attributes:
+
+    - root : :class:`str` --> the absolute path of the directory to search under
+    - query : :class:`str` --> the text to search for in names
+    - limit : :class:`int` --> the largest number of results to return
+    - callback : :class:`Callable[[SearchJob], None]` --> called on the UI thread once the search has run
+    - results : :class:`List[Tuple[str, bool]]` --> the (path, is_dir) of the entries found, or None until then
+    - cancelled : :class:`bool` --> True if the results are no longer wanted
+    - done : :class:`bool` --> True once the results have been polled
+    """
+    def __init__(self, root: str, query: str, limit: int, callback: Callable[[SearchJob], None] = None) -> None:
+        self.root = root
+        self.query = query
+        self.limit = limit
+        self.callback = callback
+        self.results: List[Tuple[str, bool]] = None
+        self.cancelled = False
+        self.done = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def is_pending(self) -> bool:
+        return not self.cancelled and not self.done
+
+
+class SubtreeIndex:
+    """
+    Index of the names of every entry under a directory, stored in SQLite so it can be searched
+    without walking the file system, and kept between runs.
+
+    The index is brought up to date by walking the subtree on a pool of threads, in the background.
+    Each directory's mtime is stored with its entries, so directories that have not changed since
+    they were indexed are not read again. Their subdirectories are still visited, since a change deep
+    in the tree does not update the mtimes above it.
+
+    Searches requested with request_search() run on a worker thread with its own connection, so scanning a
+    large index never blocks the UI. A new search drops the one waiting and interrupts the one running.
+
+    Attributes:
+
+    - db_path : :class:`str` --> the path of the SQLite database
+    - max_workers : :class:`int` --> number of threads reading directories during an update
+    - update : :class:`IndexUpdate` --> the running or most recent update, or None
+    - waiting : :class:`SearchJob` --> the search waiting to run, or None
+    - running : :class:`SearchJob` --> the search running on the worker, or None
+    - completed : :class:`Queue` --> searches run and waiting to be polled
+    """
+    def __init__(self, db_path: str = None, max_workers: int = DEFAULT_MAX_WORKERS) -> None:
+        if db_path is None:
+            db_path = os.path.join(user_cache_dir(), INDEX_FILENAME)
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.max_workers = max_workers
+        connection = self._connect()
+        try:
+            connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+        self.update: IndexUpdate = None
+        self.update_thread: threading.Thread = None
+        self.waiting: SearchJob = None
+        self.running: SearchJob = None
+        self.completed: Queue = Queue()
+        self.condition = threading.Condition()
+        self.search_connection: sqlite3.Connection = None
+        self.search_thread: threading.Thread = None
+        self.stopping = False
+
+    def start_update(self, root: str) -> bool:
+        """
+        Start bringing the index of the subtree under root up to date on a background thread.
+        Returns false if an update is already running.
+
+        Parameters:
+
+        - root : :class:`str` --> the absolute path of the directory at the top of the subtree
+        """
+        if self.is_updating():
+            return False
+        self.update = IndexUpdate(root)
+        self.update_thread = threading.Thread(target=self._run_update, args=(self.update,), daemon=True)
+        self.update_thread.start()
+        return True
+
+    def is_updating(self) -> bool:
+        return self.update_thread is not None and self.update_thread.is_alive()
+
+    def request_search(self, root: str, query: str, callback: Callable[[SearchJob], None] = None, limit: int = SEARCH_LIMIT) -> SearchJob:
+        """
+        Search the indexed entries under root whose names contain query, ignoring case, in the background. Any
+        search still waiting is dropped, and the one running is interrupted. While an update is running, only the
+        directories indexed so far are searched. Returns the job, whose results are the (path, is_dir) of up to limit entries
+
+        Parameters:
+
+        - root : :class:`str` --> the absolute path of the directory to search under
+        - query : :class:`str` --> the text to search for in names
+        - callback : :class:`Callable[[SearchJob], None]` --> called on the UI thread once the search has run
+        - limit : :class:`int` --> the largest number of results to return
+        """
+        job = SearchJob(root, query, limit, callback)
+        with self.condition:
+            if self.waiting is not None:
+                self.waiting.cancel()
+            if self.running is not None:
+                self.running.cancel()
+                self.search_connection.interrupt()
+            self.waiting = job
+            self.condition.notify()
+        if self.search_thread is None:
+            self.search_thread = threading.Thread(target=self._run_searches, name='fe-search', daemon=True)
+            self.search_thread.start()
+        return job
+
+    def poll(self) -> int:
+        """
+        Run the callbacks of the searches that have run. Must be called from the UI thread.
+        Returns the number of searches whose results were used
+        """
+        applied = 0
+        while True:
+            try:
+                job = self.completed.get_nowait()
+            except Empty:
+                return applied
+            if job.cancelled:
+                continue
+            job.done = True
+            applied += 1
+            if job.callback is not None:
+                job.callback(job)
+
+    def is_searching(self) -> bool:
+        return self.waiting is not None or self.running is not None or not self.completed.empty()
+
+    def close(self):
+        """
+        Stop any running update and search, keeping the directories indexed so far, and close the database
+        """
+        if self.is_updating():
+            self.update.stopping = True
+            self.update_thread.join()
+        with self.condition:
+            self.stopping = True
+            self.waiting = None
+            if self.running is not None:
+                self.search_connection.interrupt()
+            self.condition.notify()
+        if self.search_thread is not None:
+            self.search_thread.join()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, timeout=10)
+        connection.execute('PRAGMA journal_mode=WAL')   # Searches can read while an update writes
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _run_searches(self):
+        # Run the latest search on this thread's own connection, until the index is closed
+        self.search_connection = self._connect()
+        try:
+            while True:
+                with self.condition:
+                    while self.waiting is None and not self.stopping:
+                        self.condition.wait()
+                    if self.stopping:
+                        break
+                    job = self.running = self.waiting
+                    self.waiting = None
+                try:
+                    job.results = _search(self.search_connection, job.root, job.query, job.limit)
+                except sqlite3.OperationalError:    # Interrupted by a newer search
+                    job.cancel()
+                with self.condition:
+                    self.running = None
+                self.completed.put(job)
+        finally:
+            self.search_connection.close()
+
+    def _run_update(self, update: IndexUpdate):
+        # Walk the subtree breadth first on a thread pool. Workers only touch the file system, and
+        # this thread owns the database connection and writes each directory's results as they arrive
+        if not _is_storable(update.root):
+            update.dirs_failed += 1
+            return
+        connection = self._connect()
+        try:
+            prefix, end = _subtree_range(update.root)
+            known: Dict[str, Tuple[int, int]] = {path: (dir_id, mtime_ns) for dir_id, path, mtime_ns in connection.execute(
+                'SELECT id, path, mtime_ns FROM dirs WHERE path = ? OR (path >= ? AND path < ?)', (update.root, prefix, end))}
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                def submit(path: str):
+                    previous = known.get(path)
+                    return pool.submit(_read_directory, path, None if previous is None else previous[1])
+
+                pending = {submit(update.root)}
+                last_commit = time.monotonic()
+                while len(pending) > 0 and not update.stopping:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        path, mtime_ns, entries = future.result()
+                        previous = known.pop(path, None)
+                        try:
+                            if mtime_ns is None:    # Directory is gone
+                                if previous is not None:
+                                    _delete_dir(connection, previous[0])
+                                continue
+                            if entries is None:     # Unchanged since it was indexed
+                                update.dirs_reused += 1
+                                subdirs = [name for name, in connection.execute(
+                                    'SELECT name FROM entries WHERE dir_id = ? AND kind = ?', (previous[0], KIND_DIR))]
+                            else:
+                                update.dirs_scanned += 1
+                                _store_dir(connection, path, mtime_ns, entries, None if previous is None else previous[0])
+                                subdirs = [name for name, kind in entries if kind == KIND_DIR]
+                        except (sqlite3.Error, UnicodeError):    # Such as a path that is not valid UTF-8. The rest of the walk goes on
+                            update.dirs_failed += 1
+                            continue
+                        for name in subdirs:
+                            pending.add(submit(os.path.join(path, name)))
+                    if time.monotonic() - last_commit >= COMMIT_INTERVAL:
+                        connection.commit()
+                        last_commit = time.monotonic()
+                for future in pending:
+                    future.cancel()
+            if not update.stopping:
+                for dir_id, _ in known.values():  # Directories that were not reached anymore have been removed
+                    _delete_dir(connection, dir_id)
+                update.done = True
+            connection.commit()
+        finally:
+            connection.close()
+
+
+def _search(connection: sqlite3.Connection, root: str, query: str, limit: int) -> List[Tuple[str, bool]]:
+    # The (path, is_dir) of up to limit entries under root whose lowercased names contain query. An empty query finds nothing
+    if len(query) == 0:
+        return []
+    prefix, end = _subtree_range(root)
+    rows = connection.execute(
+        'SELECT dirs.path, entries.name, entries.kind FROM entries JOIN dirs ON dirs.id = entries.dir_id '
+        'WHERE (dirs.path = ? OR (dirs.path >= ? AND dirs.path < ?)) AND instr(entries.key, ?) > 0 LIMIT ?',
+        (root, prefix, end, query.lower(), limit))
+    return [(os.path.join(path, name), kind != KIND_FILE) for path, name, kind in rows]
+
+def _read_directory(path: str, known_mtime_ns: int) -> Tuple[str, int, List[Tuple[str, int]]]:
+    # Returns the path, mtime and (name, kind) of each entry of a directory. The entries are None if the
+    # mtime matches the one already indexed, and the mtime is None if the directory cannot be found
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path, None, None
+    if st.st_mtime_ns == known_mtime_ns:
+        return path, st.st_mtime_ns, None
+    entries = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        kind = KIND_DIR
+                    elif entry.is_symlink() and entry.is_dir():
+                        kind = KIND_LINKED_DIR
+                    else:
+                        kind = KIND_FILE
+                except OSError:
+                    kind = KIND_FILE
+                if not _is_storable(entry.name):   # Left out, with everything under it
+                    continue
+                entries.append((entry.name, kind))
+    except OSError:     # No permission, so it is indexed as empty
+        pass
+    mtime_ns = st.st_mtime_ns
+    if time.time_ns() - mtime_ns < RACY_WINDOW_NS:  # A change in the same mtime tick would go unnoticed, so read it again next time
+        mtime_ns = 0
+    return path, mtime_ns, entries
+
+def _store_dir(connection: sqlite3.Connection, path: str, mtime_ns: int, entries: List[Tuple[str, int]], dir_id: int = None):
+    # Replace the indexed entries of a directory
+    if dir_id is None:
+        connection.execute('INSERT OR IGNORE INTO dirs (path, mtime_ns) VALUES (?, ?)', (path, mtime_ns))
+        dir_id, = connection.execute('SELECT id FROM dirs WHERE path = ?', (path,)).fetchone()
+    connection.execute('UPDATE dirs SET mtime_ns = ? WHERE id = ?', (mtime_ns, dir_id))
+    connection.execute('DELETE FROM entries WHERE dir_id = ?', (dir_id,))
+    connection.executemany('INSERT INTO entries (dir_id, name, key, kind) VALUES (?, ?, ?, ?)',
+                           [(dir_id, name, name.lower(), kind) for name, kind in entries])
+
+def _delete_dir(connection: sqlite3.Connection, dir_id: int):
+    connection.execute('DELETE FROM entries WHERE dir_id = ?', (dir_id,))
+    connection.execute('DELETE FROM dirs WHERE id = ?', (dir_id,))
+
+def _is_storable(name: str) -> bool:
+    # False for names that are not valid UTF-8, which Python decodes to lone surrogates that SQLite cannot store
+    try:
+        name.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+def _subtree_range(root: str) -> Tuple[str, str]:
+    # Paths strictly under root sort between root + sep and the string just after it
+    prefix = root.rstrip(os.sep) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
@@ -0,0 +1,228 @@
+from __future__ import annotations
+from collections import deque
+from contextlib import nullcontext
+from typing import Callable, Deque, Dict
+import functools, threading, time
+
+NUM_BUCKETS = 32        # Buckets of a histogram, the last one holding everything from about 36 minutes up
+RECENT_KEYS = 100       # Number of key presses whose timings are kept, for the overlay and the trace
+KEY_OP = 'key'          # Operation timing the handling of a whole key press, up to the screen being updated
+ENV_VAR = 'FE_TIMINGS'  # Set to 1 to record timings
+
+class Histogram:
+    """
+    Latencies of one operation, counted in buckets that double in width from one microsecond. Any
+    number of samples takes the same memory, and percentiles are accurate to within a factor of two.
+
+    Attributes:
+
+    - counts : :class:`List[int]` --> number of samples in each bucket. Bucket b holds samples shorter than 2**b microseconds, and at least half that
+    - count : :class:`int` --> number of samples
+    - total : :class:`float` --> sum of the samples, in seconds
+    - max : :class:`float` --> longest sample, in seconds
+    """
+    def __init__(self) -> None:
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.counts[min(int(seconds * 1e6).bit_length(), NUM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        """
+        Returns the upper bound of the bucket holding the sample that p percent of samples are at or below, in seconds
+
+        Parameters:
+
+        - p : :class:`float` --> the percentile, from 0 to 100
+        """
+        rank = max(1, -(-self.count * p // 100))
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(2 ** bucket / 1e6, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict:
+        return {'count': self.count, 'total_ms': self.total * 1000, 'max_ms': self.max * 1000,
+                'p50_ms': self.percentile(50) * 1000, 'p90_ms': self.percentile(90) * 1000, 'p99_ms': self.percentile(99) * 1000,
+                'bucket_upper_us': [2 ** b for b in range(NUM_BUCKETS)], 'counts': self.counts}
+
+
+class KeyTiming:
+    """
+    Time spent on one key press, in total and in each timed operation while it was handled.
+
+    Attributes:
+
+    - key : :class:`str` --> the name of the key
+    - started : :class:`float` --> time.perf_counter() when the key was read
+    - total : :class:`float` --> seconds from reading the key to the screen being updated, or None while it is handled
+    - ops : :class:`Dict[str, float]` --> seconds spent in each operation, including background scans that ran meanwhile
+    """
+    __slots__ = ('key', 'started', 'total', 'ops')
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.started = time.perf_counter()
+        self.total: float = None
+        self.ops: Dict[str, float] = {}
+
+
+class Timings:
+    """
+    Latencies of the operations on the path from a key press to the screen. Timers cost a single attribute
+    check while recording is off, which is the default. Samples may be recorded from any thread.
+
+    Attributes:
+
+    - enabled : :class:`bool` --> True while timings are recorded
+    - histograms : :class:`Dict[str, Histogram]` --> the latencies of each operation since recording started
+    - recent : :class:`Deque[KeyTiming]` --> the last RECENT_KEYS key presses, oldest first
+    - current : :class:`KeyTiming` --> the key press being handled, or None
+    """
+    def __init__(self) -> None:
+        self.enabled = False
+        self.histograms: Dict[str, Histogram] = {}
+        self.recent: Deque[KeyTiming] = deque(maxlen=RECENT_KEYS)
+        self.current: KeyTiming = None
+        self.lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def record(self, op: str, seconds: float):
+        """
+        Add a sample to the histogram of an operation, and to the key press being handled
+
+        Parameters:
+
+        - op : :class:`str` --> the name of the operation
+        - seconds : :class:`float` --> how long it took
+        """
+        with self.lock:
+            histogram = self.histograms.get(op)
+            if histogram is None:
+                histogram = self.histograms[op] = Histogram()
+            histogram.add(seconds)
+            if self.current is not None:
+                self.current.ops[op] = self.current.ops.get(op, 0.0) + seconds
+
+    def time(self, op: str):
+        """
+        Returns a context manager that records how long its block takes, or one that does nothing while recording is off
+
+        Parameters:
+
+        - op : :class:`str` --> the name of the operation
+        """
+        return _Timer(self, op) if self.enabled else nullcontext()
+
+    def start_key(self, key: str):
+        """
+        Start timing the handling of a key press. Operations recorded until end_key are counted towards it
+        """
+        if self.enabled:
+            self.end_key()
+            self.current = KeyTiming(key)
+
+    def end_key(self):
+        """
+        Finish timing the key press being handled, once the screen has been updated
+        """
+        key = self.current
+        if key is None:
+            return
+        key.total = time.perf_counter() - key.started
+        with self.lock:
+            self.recent.append(key)
+            self.current = None
+        self.record(KEY_OP, key.total)
+
+    def recent_percentiles(self, p: float) -> Dict[str, float]:
+        """
+        Returns, for each operation, the time spent on it per key press that p percent of the recent key
+        presses are at or below, in seconds. Key presses that did not run an operation count as zero for it
+
+        Parameters:
+
+        - p : :class:`float` --> the percentile, from 0 to 100
+        """
+        with self.lock:
+            keys = list(self.recent)
+        if len(keys) == 0:
+            return {}
+        rank = int(max(1, -(-len(keys) * p // 100)))
+        ops = sorted({op for key in keys for op in key.ops} | {KEY_OP})
+        result = {}
+        for op in ops:
+            times = sorted(key.total if op == KEY_OP else key.ops.get(op, 0.0) for key in keys)
+            result[op] = times[rank - 1]
+        return result
+
+    def to_json(self) -> Dict:
+        """
+        Returns the histograms and the recent key presses, in a form json can write
+        """
+        with self.lock:
+            return {
+                'histograms': {op: histogram.to_dict() for op, histogram in sorted(self.histograms.items())},
+                'recent_keys': [{'key': key.key, 'total_ms': key.total * 1000, 'ops_ms': {op: s * 1000 for op, s in key.ops.items()}}
+                                for key in self.recent],
+            }
+
+    def dump(self, path: str):
+        """
+        Write the timings to a JSON file, such as to attach to a bug report
+
+        Parameters:
+
+        - path : :class:`str` --> the file to write
+        """
+        import json
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f, indent=1)
+
+
+class _Timer:
+    __slots__ = ('timings', 'op', 'started')
+
+    def __init__(self, timings: Timings, op: str) -> None:
+        self.timings = timings
+        self.op = op
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timings.record(self.op, time.perf_counter() - self.started)
+
+
+TIMINGS = Timings()     # Shared by every module, so timers don't have to be passed around
+
+def timed(op: str) -> Callable:
+    """
+    Decorator that records how long each call of a function takes while TIMINGS is enabled
+
+    Parameters:
+
+    - op : :class:`str` --> the name to record the calls under
+    """
+    def decorate(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not TIMINGS.enabled:
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                TIMINGS.record(op, time.perf_counter() - started)
+        return wrapper
+    return decorate
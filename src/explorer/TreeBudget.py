@@ -0,0 +1,105 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Set
+from src.explorer.FileEntry import Directory
+
+DEFAULT_MAX_ENTRIES = 2000000   # Entries the child lists of the tree may hold before the least recently used are released
+ENV_VAR = 'FE_TREE_ENTRIES'     # Set to change the number of entries the tree may hold
+
+class TreeStats:
+    """
+    What the tree of directories holds in memory.
+
+    Attributes:
+
+    - num_dirs : :class:`int` --> number of directories holding a child list
+    - num_entries : :class:`int` --> number of entries in those child lists
+    - num_bytes : :class:`int` --> estimate of the memory taken by those child lists, in bytes
+    - num_released : :class:`int` --> number of child lists released so far to stay within the budget
+    """
+    def __init__(self) -> None:
+        self.num_dirs = 0
+        self.num_entries = 0
+        self.num_bytes = 0
+        self.num_released = 0
+
+
+class TreeBudget:
+    """
+    Bounds the memory held by the tree of Directory objects. Directories are recorded each time they are shown,
+    and once their child lists hold more than max_entries entries in total, the child lists of the directories
+    shown longest ago are released. A released directory keeps its place in the tree and its selected child
+    index, and its children are read again, from the listing cache if unchanged, the next time it is shown.
+
+    Attributes:
+
+    - max_entries : :class:`int` --> the number of entries the child lists may hold
+    - resident : :class:`OrderedDict[Directory, int]` --> the number of entries each recorded directory held when last shown, least recently shown first
+    - num_entries : :class:`int` --> the total of the entries in resident
+    - num_released : :class:`int` --> number of child lists released so far
+    """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self.resident: OrderedDict[Directory, int] = OrderedDict()
+        self.num_entries = 0
+        self.num_released = 0
+
+    def touch(self, directories: Iterable[Directory]):
+        """
+        Record that directories were shown, and how many entries their child lists hold now
+
+        Parameters:
+
+        - directories : :class:`Iterable[Directory]` --> the directories shown, with the most recently used last
+        """
+        for directory in directories:
+            if directory.children is None:
+                continue
+            count = len(directory.children)
+            self.num_entries += count - self.resident.pop(directory, 0)
+            self.resident[directory] = count
+
+    def trim(self, kept: Callable[[], Set[Directory]]) -> List[Directory]:
+        """
+        Release the child lists of the directories shown longest ago until the rest fit in the budget.
+        Returns the directories that were released
+
+        Parameters:
+
+        - kept : :class:`Callable[[], Set[Directory]]` --> returns the directories that must keep their children, such as those on
+        the current path. Only called if the budget is exceeded
+        """
+        excess = self.num_entries - self.max_entries
+        if excess <= 0:
+            return []
+        keep = kept()
+        released = []
+        for directory, count in list(self.resident.items()):
+            if excess <= 0:
+                break
+            if directory in keep:
+                continue
+            del self.resident[directory]
+            self.num_entries -= count
+            excess -= count
+            if directory.children is not None:
+                directory.release_children()
+                released.append(directory)
+        self.num_released += len(released)
+        return released
+
+    def stats(self) -> TreeStats:
+        """
+        Returns what the recorded directories hold in memory now. The size of each child list is measured, so this takes
+        time in proportion to the number of entries
+        """
+        stats = TreeStats()
+        for directory in self.resident:
+            children = directory.children
+            if children is None:
+                continue
+            stats.num_dirs += 1
+            stats.num_entries += len(children)
+            stats.num_bytes += children.nbytes()
+        stats.num_released = self.num_released
+        return stats
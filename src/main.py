@@ -1,52 +1,374 @@
 #!/usr/bin/env python3
 
-import curses
-from typing import List
+from __future__ import annotations
+import time
+STARTED = time.perf_counter()   # Taken before the other imports, so --profile-startup can time them
+
+import curses, os, sys
+from typing import TYPE_CHECKING, Callable, List, Tuple
 from src.explorer.FileExplorer import FileExplorer
-from src.explorer.FileEntry import FileEntry, Directory
+from src.explorer.FileEntry import FileEntry, Directory, KIND_DIR, SORT_NAME, SORT_NATURAL, SORT_EXTENSION, SORT_MTIME, SORT_SIZE
 from src.displays.DirectoryPad import DirectoryPad
 from src.displays.PadList import PadList
+from src.displays.Prompt import Prompt, PROMPT_ACTIVE, PROMPT_ACCEPTED
+from src.displays.CursesBackend import CursesBackend
+from src.explorer.Timings import TIMINGS, ENV_VAR as TIMINGS_ENV_VAR
+from src.explorer.ListingCache import user_cache_dir
+
+if TYPE_CHECKING:
+    from src.displays.SearchResults import SearchResults
+    from src.displays.TimingOverlay import TimingOverlay
+    from src.displays.ProgressOverlay import ProgressOverlay
+    from src.explorer.SubtreeIndex import SearchJob
+IMPORTED = time.perf_counter()
+
+TAB_KEY = 9
+TIMINGS_FILENAME = 'timings.json'
+ESCAPE_KEY = 27
+
+SCAN_POLL_MS = 30   # How often to check for finished background scans while any are running
+WATCH_POLL_MS = 100 # How often to check watched directories for changes
+INDEX_POLL_MS = 250 # How often to refresh search results while the index is being updated
+SIZE_POLL_MS = 200  # How often to show growing totals while sizes are being measured
+OPERATION_POLL_MS = 200 # How often to show the progress of copies, moves and deletes while any are running
+
+FIND_PROMPT = 0
+FILTER_PROMPT = 1
+SEARCH_PROMPT = 2
+SORT_PROMPT = 3
+MEMORY_PROMPT = 4
+DELETE_PROMPT = 5
+JUMP_PROMPT = 6
+
+SORT_LABEL = 'sort by (n)ame, n(a)tural, (e)xtension, (t)ime, (s)ize: '
+SORT_KEYS = {ord('n'): SORT_NAME, ord('a'): SORT_NATURAL, ord('e'): SORT_EXTENSION, ord('t'): SORT_MTIME, ord('s'): SORT_SIZE}
 
 def main():
-    curses.wrapper(start)
-
-def start(stdscr):
-    stdscr.clear()
-    curses.use_default_colors()
-    curses.init_pair(1, curses.COLOR_MAGENTA, -1)
-    curses.init_pair(2, curses.COLOR_GREEN, -1)
-    curses.init_pair(3, curses.COLOR_YELLOW, -1)
-    curses.init_pair(4, 143, -1) # Darker yellow
-    curses.curs_set(0)
-    stdscr.refresh()    # Need to call this before rendering anything
+    profile = None
+    timings_path = os.path.join(user_cache_dir(), TIMINGS_FILENAME) if os.environ.get(TIMINGS_ENV_VAR, '0') != '0' else None
+    if len(sys.argv) > 1:   # argparse is slow to import, so it is only loaded when it has something to parse
+        import argparse
+        parser = argparse.ArgumentParser(prog='fe', description='Navigate the file system with the arrow keys')
+        parser.add_argument('--profile-startup', action='store_true',
+                            help='start up, wait for the first preview, then quit and print how long each step took')
+        parser.add_argument('--timings', nargs='?', const=os.path.join(user_cache_dir(), TIMINGS_FILENAME), metavar='PATH',
+                            help=f'time each key press and the operations it runs, press t to show them, and write them to PATH '
+                                 f'as JSON on exit. Same as setting {TIMINGS_ENV_VAR}=1, which writes to the default PATH')
+        args = parser.parse_args()
+        if args.profile_startup:
+            profile = [('imports', IMPORTED - STARTED), ('parse arguments', time.perf_counter() - IMPORTED)]
+        timings_path = args.timings or timings_path
+    if timings_path is not None:
+        TIMINGS.enable()
+    os.environ.setdefault('ESCDELAY', '25')    # Don't wait a full second to tell escape apart from other keys
+    phase_started = time.perf_counter()
+    def on_phase(phase: str):
+        nonlocal phase_started
+        now = time.perf_counter()
+        profile.append((phase, now - phase_started))
+        phase_started = now
+    curses.wrapper(start, on_phase if profile is not None else None)
+    if profile is not None:
+        print(_startup_report(profile), file=sys.stderr)
+    if timings_path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(timings_path)), exist_ok=True)
+        TIMINGS.dump(timings_path)
+        print(f'Timings written to {timings_path}', file=sys.stderr)
+
+def start(stdscr, on_phase: Callable[[str], None] = None):
+    """
+    Run the user interaction loop on the given curses screen
+
+    Parameters:
+
+    - on_phase : :class:`Callable[[str], None]` --> if given, called with the name of each step of startup once it is done. The loop then quits as soon as the first preview is on screen
+    """
+    backend = CursesBackend(stdscr)
+    backend.setup()
 
     DIR_COLOR = curses.color_pair(1)
     FILE_COLOR = curses.color_pair(2)
     SELECTED_COLOR = curses.color_pair(3)
+    profiling = on_phase is not None
+    on_phase = on_phase or (lambda phase: None)
+    on_phase('set up curses')
 
-    fe = FileExplorer()
-    directory_view = PadList(fe)
+    fe = FileExplorer(on_phase)
+    directory_view = PadList(fe, backend)
+    on_phase('build pads')
+    backend.doupdate()  # Show the start directory before scanning anything else
+    on_phase('first paint')
+    directory_view.peek_selection()
+    prompt: Prompt = None
+    index_before_prompt = 0
+    prompt_kind = FIND_PROMPT
+    fuzzy = False
+    search_results: SearchResults = None
+    search_job: SearchJob = None
+    timing_overlay: TimingOverlay = None
+    progress_overlay: ProgressOverlay = None
 
     # User interaction loop
     while True:
-        curses.doupdate()   # Change physical screen to match previous update
-        k = stdscr.getch()  # Wait for user to hit key
-        if k == curses.KEY_UP:
-            directory_view.traverse_up()
-        elif k == curses.KEY_DOWN:
-            directory_view.traverse_down()
+        if search_results is not None:
+            search_results.draw()
+        if timing_overlay is not None:
+            timing_overlay.draw()
+        if progress_overlay is not None:
+            progress_overlay.draw()
+        if prompt is not None:
+            prompt.draw()   # Keep the prompt on top of any pads redrawn since the last key
+        backend.doupdate()  # Change physical screen to match previous update
+        TIMINGS.end_key()
+        if profiling and not _is_peek_loading(fe):
+            on_phase('first preview')
+            break
+        if directory_view.has_pending_scans() or directory_view.has_pending_previews():
+            stdscr.timeout(SCAN_POLL_MS)
+        elif directory_view.is_measuring():
+            stdscr.timeout(SIZE_POLL_MS)
+        elif directory_view.is_operating():
+            stdscr.timeout(OPERATION_POLL_MS)
+        elif prompt_kind == SEARCH_PROMPT and search_results is not None and fe.is_searching():
+            stdscr.timeout(SCAN_POLL_MS)
+        elif prompt_kind == SEARCH_PROMPT and search_results is not None and fe.is_indexing():
+            stdscr.timeout(INDEX_POLL_MS)
+        else:
+            stdscr.timeout(WATCH_POLL_MS if directory_view.is_watching() else -1)
+        k = stdscr.getch()  # Wait for user to hit key, or for a background scan or file system change
+        if TIMINGS.enabled and k != -1:
+            TIMINGS.start_key(curses.keyname(k).decode('ascii', 'replace'))
+        if k != -1 and progress_overlay is not None and not progress_overlay.job.is_pending():  # Summary of a finished operation stays until the next key
+            progress_overlay.close()
+            progress_overlay = None
+            directory_view.redraw()
+        if k == -1:
+            directory_view.poll_scans()
+            directory_view.poll_previews()
+            directory_view.apply_fs_changes()
+            directory_view.poll_sizes()
+            directory_view.poll_operations()
+            fe.poll_searches()
+            if prompt_kind == SEARCH_PROMPT and search_results is not None and not fe.is_searching() and prompt.label != _search_label(fe):
+                # Show what the index has found so far, once the last search is done
+                search_job = fe.search_subtree(prompt.text, lambda job: search_results.set_results(job.results))
+                prompt.set_label(_search_label(fe))
+        elif prompt is not None and prompt_kind == JUMP_PROMPT:
+            # Type part of a path to pick among the directories visited most often and most recently.
+            # Enter moves into the highlighted one
+            if k == curses.KEY_UP:
+                search_results.traverse_up()
+                continue
+            if k == curses.KEY_DOWN:
+                search_results.traverse_down()
+                continue
+            status = prompt.handle_key(k)
+            if status == PROMPT_ACTIVE:
+                search_results.set_results(fe.frecent_directories(prompt.text))
+                continue
+            path = search_results.get_selected() if status == PROMPT_ACCEPTED else None
+            search_results.close()
+            search_results = None
+            prompt.close()
+            prompt = None
+            if path is None or not directory_view.jump_into_directory(path):
+                directory_view.redraw()
+        elif prompt is not None and prompt_kind == SEARCH_PROMPT:
+            # Type part of a name to search for it under the starting directory. Enter jumps to the
+            # highlighted result
+            if k == curses.KEY_UP:
+                search_results.traverse_up()
+                continue
+            if k == curses.KEY_DOWN:
+                search_results.traverse_down()
+                continue
+            status = prompt.handle_key(k)
+            if status == PROMPT_ACTIVE:     # Searched in the background, so typing never waits for the index
+                search_job = fe.search_subtree(prompt.text, lambda job: search_results.set_results(job.results))
+                continue
+            if search_job is not None:
+                search_job.cancel()
+                search_job = None
+            path = search_results.get_selected() if status == PROMPT_ACCEPTED else None
+            search_results.close()
+            search_results = None
+            prompt.close()
+            prompt = None
+            if path is None or not directory_view.jump_to_path(path):
+                directory_view.redraw()
+        elif prompt is not None and prompt_kind == FILTER_PROMPT:
+            # Type to narrow the current directory. Tab switches between substring and fuzzy matching,
+            # enter keeps the filtered view and escape shows every entry again
+            if k == TAB_KEY:
+                fuzzy = not fuzzy
+                prompt.set_label('fuzzy: ' if fuzzy else 'filter: ')
+                status = PROMPT_ACTIVE
+            else:
+                status = prompt.handle_key(k)
+            if status == PROMPT_ACTIVE:
+                directory_view.filter_entries(prompt.text, fuzzy)
+                continue
+            if status != PROMPT_ACCEPTED or fe.get_selected_entry() is None:   # Don't keep a view with nothing in it
+                directory_view.clear_filter()
+                if status != PROMPT_ACCEPTED:
+                    directory_view.select_index(index_before_prompt)
+            prompt.close()
+            prompt = None
+            directory_view.redraw()
+        elif prompt is not None and prompt_kind == MEMORY_PROMPT:
+            # Any key dismisses the memory readout
+            prompt.close()
+            prompt = None
+            directory_view.redraw()
+            continue    # Even q only closes the prompt
+        elif prompt is not None and prompt_kind == DELETE_PROMPT:
+            # Only y deletes. Any other key keeps the entries
+            prompt.close()
+            prompt = None
+            if k == ord('y'):
+                from src.explorer.FileOperations import OP_DELETE
+                progress_overlay = _start_operation(directory_view, OP_DELETE, backend) or progress_overlay
+            directory_view.redraw()
+            continue    # Even q only closes the prompt
+        elif prompt is not None and prompt_kind == SORT_PROMPT:
+            # Pick the order of the entries with a single key. Any other key keeps the current order
+            prompt.close()
+            prompt = None
+            if k in SORT_KEYS:
+                directory_view.set_sort_mode(SORT_KEYS[k])
+            directory_view.redraw()
+            continue    # Even q only closes the prompt
+        elif prompt is not None:
+            # Type a name to jump to it. Escape goes back to where the jump started
+            status = prompt.handle_key(k)
+            if status == PROMPT_ACTIVE:
+                if len(prompt.text) > 0:
+                    directory_view.jump_to_name(prompt.text)
+                continue
+            if status != PROMPT_ACCEPTED:
+                directory_view.select_index(index_before_prompt)
+            prompt.close()
+            prompt = None
+            directory_view.redraw()
+        elif k == ord('f'):
+            prompt = Prompt('find: ', backend)
+            prompt_kind = FIND_PROMPT
+            index_before_prompt = fe.selected_index
+        elif k == ord('/'):
+            prompt = Prompt('fuzzy: ' if fuzzy else 'filter: ', backend)
+            prompt_kind = FILTER_PROMPT
+            index_before_prompt = fe.selected_index
+        elif k == ord('s'):
+            from src.displays.SearchResults import SearchResults
+            fe.update_subtree_index()
+            search_results = SearchResults(fe.start, backend)
+            prompt = Prompt(_search_label(fe), backend)
+            prompt_kind = SEARCH_PROMPT
+        elif k == ord('z'):
+            from src.displays.SearchResults import SearchResults
+            search_results = SearchResults(None, backend)
+            search_results.set_results(fe.frecent_directories(''))
+            prompt = Prompt('jump: ', backend)
+            prompt_kind = JUMP_PROMPT
+        elif k == ord('d'):
+            directory_view.toggle_sizes()
+        elif k == ord('o'):
+            prompt = Prompt(SORT_LABEL, backend)
+            prompt_kind = SORT_PROMPT
+        elif k == ord('m'):
+            prompt = Prompt(_memory_label(fe), backend)
+            prompt_kind = MEMORY_PROMPT
+        elif k == ord('t') and TIMINGS.enabled:
+            if timing_overlay is None:
+                from src.displays.TimingOverlay import TimingOverlay
+                timing_overlay = TimingOverlay(TIMINGS, backend)
+            else:
+                timing_overlay.close()
+                timing_overlay = None
+                directory_view.redraw()
+        elif k == ord(' '):
+            directory_view.toggle_mark()
+        elif k == ord('u'):
+            directory_view.clear_marks()
+        elif k == ord('c') or k == ord('x'):
+            from src.explorer.FileOperations import OP_COPY, OP_MOVE
+            progress_overlay = _start_operation(directory_view, OP_COPY if k == ord('c') else OP_MOVE, backend) or progress_overlay
+        elif k == ord('D'):
+            from src.explorer.FileOperations import OP_DELETE
+            if fe.count_targets(OP_DELETE) > 0:
+                prompt = Prompt(_delete_label(fe), backend)
+                prompt_kind = DELETE_PROMPT
+        elif k == ESCAPE_KEY and directory_view.is_filtered():
+            directory_view.clear_filter()
+        elif k == ESCAPE_KEY and directory_view.is_operating():
+            fe.cancel_operations()
+        elif k == curses.KEY_UP or k == curses.KEY_DOWN:
+            directory_view.move_selection(_drain_moves(stdscr, k))
+        elif k == curses.KEY_NPAGE or k == curses.KEY_PPAGE:
+            directory_view.scroll_preview(1 if k == curses.KEY_NPAGE else -1)
         elif k == curses.KEY_LEFT:
             directory_view.traverse_left()
         elif k == curses.KEY_RIGHT:
             directory_view.traverse_right()
-        elif k == 10:
-            if type(fe.get_selected_entry()) == Directory:
+        elif k == 10 and not fe.in_archive():   # Entries inside an archive have no path on disk to cd to or open
+            if fe.get_selected_entry() is not None and fe.get_selected_entry().kind() == KIND_DIR:
                 fe.copy_path()
             else:
                 fe.open_file()
             break
         if k == ord('q'):
             break
+    fe.shutdown()
+
+def _memory_label(fe: FileExplorer) -> str:
+    # One line on what the directories read so far, and the listing cache, hold in memory
+    stats = fe.get_tree_stats()
+    return (f'tree: {stats.num_dirs:,} dirs, {stats.num_entries:,} of {fe.tree_budget.max_entries:,} entries, '
+            f'{stats.num_bytes // 1024:,} KiB, {stats.num_released:,} released; cache: {fe.listing_cache.total_entries:,} entries ')
+
+def _start_operation(directory_view: PadList, kind: int, backend: CursesBackend) -> ProgressOverlay:
+    # Start copying, moving or deleting the marked entries, and show its progress. Returns None if there was nothing to operate on
+    from src.displays.ProgressOverlay import ProgressOverlay
+    job = directory_view.start_operation(kind)
+    return None if job is None else ProgressOverlay(job, backend)
+
+def _delete_label(fe: FileExplorer) -> str:
+    from src.explorer.FileOperations import OP_DELETE
+    num_marked = fe.count_targets(OP_DELETE)
+    if len(fe.marks) == 0:
+        return f'delete {fe.get_selected_entry().name}? (y/n) '
+    return f'delete {num_marked} marked {"entry" if num_marked == 1 else "entries"}? (y/n) '
+
+def _drain_moves(stdscr, k: int) -> int:
+    # Net number of entries to move for k and the up and down keys already waiting behind it, such as
+    # from a held arrow key, so the whole burst is peeked at and drawn once. The first other key is put back
+    steps = 0
+    stdscr.timeout(0)
+    while k == curses.KEY_UP or k == curses.KEY_DOWN:
+        steps += 1 if k == curses.KEY_DOWN else -1
+        k = stdscr.getch()
+    if k != -1:
+        curses.ungetch(k)
+    return steps
+
+def _is_peek_loading(fe: FileExplorer) -> bool:
+    # True while the selected directory is waiting for the first entries of its preview
+    selection = fe.get_selected_entry()
+    return isinstance(selection, Directory) and selection.children is None and fe.is_peek_pending()
+
+def _startup_report(phases: List[Tuple[str, float]]) -> str:
+    # One line per phase with its own and cumulative time in milliseconds
+    lines = [f'{"phase":<22}{"ms":>8}{"total":>8}']
+    total = 0
+    for phase, seconds in phases:
+        total += seconds
+        lines.append(f'{phase:<22}{seconds * 1000:>8.1f}{total * 1000:>8.1f}')
+    return '\n'.join(lines)
+
+def _search_label(fe: FileExplorer) -> str:
+    if fe.is_indexing():
+        return f'search (indexing, {fe.subtree_index.update.dirs_visited()} dirs): '
+    return 'search: '
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
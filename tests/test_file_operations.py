@@ -0,0 +1,113 @@
+import errno, os, time
+import pytest
+from src.explorer import FileOperations as file_operations
+from src.explorer.FileOperations import FileOperations, OperationJob, OP_COPY, OP_MOVE, OP_DELETE
+
+TIMEOUT = 10
+
+def run(ops: FileOperations, kind: int, sources, destination=None, protected=None) -> OperationJob:
+    # Start a job and poll until it is done, as the UI thread does
+    job = ops.start(kind, [str(source) for source in sources], None if destination is None else str(destination),
+                    None if protected is None else str(protected))
+    deadline = time.monotonic() + TIMEOUT
+    while ops.has_pending():
+        assert time.monotonic() < deadline, 'operation did not finish'
+        ops.poll()
+        time.sleep(0.005)
+    return job
+
+def make_tree(root, files):
+    for path, content in files.items():
+        path = root / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+
+@pytest.fixture
+def ops():
+    ops = FileOperations()
+    yield ops
+    ops.shutdown()
+
+@pytest.fixture
+def cross_device(monkeypatch):
+    # Every rename fails as it would between file systems, so moves copy and then delete
+    def rename(source, target):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+    monkeypatch.setattr(file_operations.os, 'rename', rename)
+
+def test_copy_keeps_contents_and_modes(ops, tmp_path):
+    make_tree(tmp_path / 'src', {'a/f': b'x' * 100, 'a/sub/g': b'y'})
+    (tmp_path / 'src/a/f').chmod(0o640)
+    (tmp_path / 'dst').mkdir()
+    job = run(ops, OP_COPY, [tmp_path / 'src/a'], tmp_path / 'dst')
+    assert job.num_errors == 0
+    assert (tmp_path / 'dst/a/f').read_bytes() == b'x' * 100
+    assert (tmp_path / 'dst/a/sub/g').read_bytes() == b'y'
+    assert (tmp_path / 'dst/a/f').stat().st_mode & 0o777 == 0o640
+    assert (tmp_path / 'src/a/f').exists()
+
+@pytest.mark.parametrize('error', [OSError(errno.EIO, 'Input/output error'), RuntimeError('unexpected')])
+def test_cross_device_move_keeps_the_source_that_failed(ops, tmp_path, monkeypatch, cross_device, error):
+    make_tree(tmp_path / 'src', {'a/f': b'a', 'b/f': b'b', 'c/f': b'c'})
+    (tmp_path / 'dst').mkdir()
+    copy_file = FileOperations._copy_file
+    def failing_copy(self, job, path, dest, st):
+        if os.path.basename(os.path.dirname(path)) == 'b':
+            raise error
+        copy_file(self, job, path, dest, st)
+    monkeypatch.setattr(FileOperations, '_copy_file', failing_copy)
+    job = run(ops, OP_MOVE, [tmp_path / 'src/a', tmp_path / 'src/b', tmp_path / 'src/c'], tmp_path / 'dst')
+    assert [path for path, _ in job.errors] == [str(tmp_path / 'src/b/f')]
+    assert (tmp_path / 'src/b/f').read_bytes() == b'b'
+    assert not (tmp_path / 'src/a').exists() and not (tmp_path / 'src/c').exists()
+    assert (tmp_path / 'dst/a/f').read_bytes() == b'a'
+    assert (tmp_path / 'dst/c/f').read_bytes() == b'c'
+
+def test_cross_device_move_keeps_every_source_after_a_failed_walk(ops, tmp_path, monkeypatch, cross_device):
+    make_tree(tmp_path / 'src', {'a/f': b'a', 'b/f': b'b'})
+    (tmp_path / 'dst').mkdir()
+    def failing_plan(self, job):
+        raise RuntimeError('unexpected')
+    monkeypatch.setattr(FileOperations, '_plan', failing_plan)
+    job = run(ops, OP_MOVE, [tmp_path / 'src/a', tmp_path / 'src/b'], tmp_path / 'dst')
+    assert job.num_errors == 1
+    assert (tmp_path / 'src/a/f').exists() and (tmp_path / 'src/b/f').exists()
+
+@pytest.mark.parametrize('kind', [OP_MOVE, OP_DELETE])
+def test_refuses_to_remove_the_protected_directory(ops, tmp_path, kind):
+    make_tree(tmp_path / 'src', {'a/browsed/f': b'f', 'b/f': b'b'})
+    (tmp_path / 'dst').mkdir()
+    job = run(ops, kind, [tmp_path / 'src/a', tmp_path / 'src/b'], tmp_path / 'dst', protected=tmp_path / 'src/a/browsed')
+    assert job.errors == [(str(tmp_path / 'src/a'), 'cannot remove the directory being browsed')]
+    assert (tmp_path / 'src/a/browsed/f').exists()
+    assert not (tmp_path / 'src/b').exists()
+
+@pytest.mark.parametrize('kind', [OP_COPY, OP_MOVE])
+def test_refuses_to_put_a_directory_inside_itself(ops, tmp_path, kind):
+    make_tree(tmp_path, {'a/sub/f': b'f'})
+    job = run(ops, kind, [tmp_path / 'a'], tmp_path / 'a/sub')
+    assert job.errors == [(str(tmp_path / 'a'), 'cannot be put inside itself')]
+    assert os.listdir(tmp_path / 'a/sub') == ['f']
+
+def test_refuses_to_overwrite(ops, tmp_path):
+    make_tree(tmp_path, {'src/f': b'new', 'dst/f': b'old'})
+    job = run(ops, OP_COPY, [tmp_path / 'src/f'], tmp_path / 'dst')
+    assert job.num_errors == 1
+    assert (tmp_path / 'dst/f').read_bytes() == b'old'
+
+def test_cancel_removes_the_partly_copied_file(ops, tmp_path, monkeypatch, cross_device):
+    make_tree(tmp_path, {'src/big': b'z' * 4096})
+    (tmp_path / 'dst').mkdir()
+    monkeypatch.setattr(file_operations, 'CHUNK_BYTES', 1024)
+    copy_file_range = file_operations._copy_file_range
+    def cancelling_copy(in_fd, out_fd):
+        copied = copy_file_range(in_fd, out_fd)
+        ops.jobs[0].cancel()    # Cancelled once the first chunk is written
+        return copied
+    monkeypatch.setattr(file_operations, '_copy_file_range', cancelling_copy)
+    monkeypatch.setattr(file_operations, '_sendfile', cancelling_copy)
+    job = run(ops, OP_MOVE, [tmp_path / 'src/big'], tmp_path / 'dst')
+    assert job.cancelled
+    assert 0 < job.bytes_done < 4096
+    assert os.listdir(tmp_path / 'dst') == []
+    assert (tmp_path / 'src/big').read_bytes() == b'z' * 4096